@@ -0,0 +1,197 @@
+"""
+Per-user trading performance for ``/api/analytics/``.
+
+Settled binary options are summarized in ``BinaryOptionStats`` rows, one per
+user overall and one per symbol, direction and expiry, each holding win/loss
+counts, stake and payout sums and streaks. Settlement updates them with
+``record_outcomes`` in the transaction that moves the trades out of ACTIVE,
+so reading them is one small query however long the history is; streaks
+follow settlement order. Users without rows (history from before the table,
+or rows dropped after a settled trade was written some other way, see
+``core.signals``) have them rebuilt from their trades on the next read.
+Spot trade totals are aggregated by the database in one grouped query. The
+view caches the result with ``versioned_response``.
+"""
+from collections import defaultdict
+from decimal import Decimal
+from operator import attrgetter
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from .models import BinaryOptionStats, BinaryOptionTrade, Trade
+
+User = get_user_model()
+
+SETTLED_STATUSES = ('WON', 'LOST', 'EXPIRED')
+EIGHT_PLACES = Decimal('0.00000001')
+OVERALL = 'overall'
+DIMENSIONS = {'by_symbol': 'symbol', 'by_direction': 'direction', 'by_expiry': 'expiry_seconds'}
+# Fields of a settled trade that feed its stats, in ``_add_outcomes`` order
+OUTCOME_FIELDS = ('symbol', 'direction', 'expiry_seconds', 'status', 'amount', 'payout_amount')
+STATS_FIELDS = ('won', 'lost', 'staked', 'payout', 'longest_win', 'longest_loss', 'current_streak')
+
+
+def add_outcome(stats, status, amount, payout):
+    """Add one settled trade to a ``BinaryOptionStats`` row"""
+    stats.staked += amount
+    stats.payout += payout or 0
+    if status == 'WON':
+        stats.won += 1
+        stats.current_streak = stats.current_streak + 1 if stats.current_streak > 0 else 1
+        stats.longest_win = max(stats.longest_win, stats.current_streak)
+    else:
+        stats.lost += 1
+        stats.current_streak = stats.current_streak - 1 if stats.current_streak < 0 else -1
+        stats.longest_loss = max(stats.longest_loss, -stats.current_streak)
+
+
+def _add_outcomes(user_id, stats, outcomes):
+    """
+    Add ``OUTCOME_FIELDS`` tuples, in settlement order, to a user's
+    ``(dimension, key) -> BinaryOptionStats`` map, creating missing rows.
+    Returns the keys touched.
+    """
+    touched = set()
+    for symbol, direction, expiry_seconds, status, amount, payout in outcomes:
+        for key in ((OVERALL, ''), ('by_symbol', symbol), ('by_direction', direction), ('by_expiry', str(expiry_seconds))):
+            row = stats.get(key)
+            if row is None:
+                row = stats[key] = BinaryOptionStats(user_id=user_id, dimension=key[0], key=key[1])
+            add_outcome(row, status, amount, payout)
+            touched.add(key)
+    return touched
+
+
+def _lock_users(user_ids):
+    # Serializes stats writers per user, in the same order as balance credits
+    return list(User.objects.select_for_update().filter(pk__in=user_ids).order_by('pk').values_list('pk', flat=True))
+
+
+def record_outcomes(trades):
+    """Add just-settled ``trades`` to their owners' stats; call inside the transaction that settles them"""
+    by_user = defaultdict(list)
+    for trade in sorted(trades, key=attrgetter('id')):
+        by_user[trade.user_id].append(trade)
+    if not by_user:
+        return
+    _lock_users(by_user)
+    stats = defaultdict(dict)
+    for row in BinaryOptionStats.objects.filter(user_id__in=by_user):
+        stats[row.user_id][(row.dimension, row.key)] = row
+
+    created, updated = [], []
+    for user_id, user_trades in by_user.items():
+        if (OVERALL, '') not in stats[user_id]:
+            # Never built: rebuild_stats will read these trades from the table
+            continue
+        existing = set(stats[user_id])
+        touched = _add_outcomes(user_id, stats[user_id], (
+            tuple(getattr(trade, field) for field in OUTCOME_FIELDS) for trade in user_trades
+        ))
+        for key in touched:
+            (updated if key in existing else created).append(stats[user_id][key])
+    if created:
+        BinaryOptionStats.objects.bulk_create(created)
+    if updated:
+        BinaryOptionStats.objects.bulk_update(updated, STATS_FIELDS)
+
+
+def rebuild_stats(user_id):
+    """Build a user's stats from all of their settled trades, unless another request already has"""
+    with transaction.atomic():
+        _lock_users([user_id])
+        if BinaryOptionStats.objects.filter(user_id=user_id, dimension=OVERALL).exists():
+            return
+        stats = {(OVERALL, ''): BinaryOptionStats(user_id=user_id, dimension=OVERALL, key='')}
+        outcomes = BinaryOptionTrade.objects.filter(user_id=user_id, status__in=SETTLED_STATUSES).order_by(
+            'updated_at', 'id',
+        ).values_list(*OUTCOME_FIELDS)
+        _add_outcomes(user_id, stats, outcomes.iterator(chunk_size=2000))
+        BinaryOptionStats.objects.bulk_create(stats.values())
+
+
+def _stats_dict(stats):
+    settled = stats.won + stats.lost
+    net_pnl = stats.payout - stats.staked
+    return {
+        'trades': settled,
+        'won': stats.won,
+        'lost': stats.lost,
+        'win_rate': round(stats.won / settled, 4) if settled else None,
+        'staked': str(stats.staked),
+        'payout': str(stats.payout),
+        'net_pnl': str(net_pnl),
+        'roi': round(float(net_pnl / stats.staked), 4) if stats.staked else None,
+        'streaks': {
+            'longest_win': stats.longest_win,
+            'longest_loss': stats.longest_loss,
+            'current': stats.current_streak,
+        },
+    }
+
+
+def binary_option_stats(user):
+    """Win rate, PnL, ROI and streaks overall and per symbol, direction and expiry"""
+    rows = list(BinaryOptionStats.objects.filter(user=user))
+    if not any(row.dimension == OVERALL for row in rows):
+        rebuild_stats(user.pk)
+        rows = list(BinaryOptionStats.objects.filter(user=user))
+
+    result = {OVERALL: None}
+    result.update((name, {}) for name in DIMENSIONS)
+    # Expiries sort numerically, like the integers they are
+    for row in sorted(rows, key=lambda row: (row.dimension, int(row.key) if row.dimension == 'by_expiry' else row.key)):
+        if row.dimension == OVERALL:
+            result[OVERALL] = _stats_dict(row)
+        elif row.dimension in DIMENSIONS:
+            result[row.dimension][row.key] = _stats_dict(row)
+    return result
+
+
+def trade_stats(user):
+    """Volume and average-cost realized PnL of spot trades, overall and per symbol"""
+    rows = Trade.objects.filter(user=user).values('symbol', 'trade_type').annotate(
+        count=Count('id'), quantity=Sum('quantity'), total=Sum('total_amount'),
+    ).order_by()
+    by_symbol = defaultdict(lambda: {
+        'BUY': (0, Decimal('0'), Decimal('0')),
+        'SELL': (0, Decimal('0'), Decimal('0')),
+    })
+    for row in rows:
+        by_symbol[row['symbol']][row['trade_type']] = (row['count'], row['quantity'] or 0, row['total'] or 0)
+
+    result = {}
+    overall_count = 0
+    overall_realized = Decimal('0')
+    overall_cost = Decimal('0')
+    for symbol in sorted(by_symbol):
+        buys, bought, spent = by_symbol[symbol]['BUY']
+        sells, sold, received = by_symbol[symbol]['SELL']
+        average_buy = (spent / bought).quantize(EIGHT_PLACES) if bought else None
+        # Cost basis of what was sold, at the average buy price
+        cost = (sold * average_buy).quantize(EIGHT_PLACES) if average_buy is not None else Decimal('0')
+        realized = received - cost if average_buy is not None else Decimal('0')
+        result[symbol] = {
+            'trades': buys + sells,
+            'bought': str(bought),
+            'sold': str(sold),
+            'spent': str(spent),
+            'received': str(received),
+            'average_buy_price': str(average_buy) if average_buy is not None else None,
+            'average_sell_price': str((received / sold).quantize(EIGHT_PLACES)) if sold else None,
+            'realized_pnl': str(realized),
+            'roi': round(float(realized / cost), 4) if cost else None,
+        }
+        overall_count += buys + sells
+        overall_realized += realized
+        overall_cost += cost
+    return {
+        'overall': {
+            'trades': overall_count,
+            'realized_pnl': str(overall_realized),
+            'roi': round(float(overall_realized / overall_cost), 4) if overall_cost else None,
+        },
+        'by_symbol': result,
+    }
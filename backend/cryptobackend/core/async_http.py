@@ -0,0 +1,61 @@
+"""
+Shared aiohttp client for upstream calls made from async views.
+
+``get_session()`` returns one ``ClientSession`` per event loop, so every
+request served by an ASGI worker reuses the same pool of keep-alive
+connections. aiohttp sessions are bound to the loop they were created on,
+so they only pay off on a loop that outlives the request. Under WSGI each
+async view runs on a short-lived loop of its own; the view marks itself with
+``short_lived_loop()`` and ``core.upstream`` then makes its calls through the
+process-wide keep-alive ``requests.Session`` in a thread instead.
+"""
+import asyncio
+import contextvars
+import weakref
+from contextlib import contextmanager
+
+import aiohttp
+from django.conf import settings
+
+_sessions = weakref.WeakKeyDictionary()  # event loop -> ClientSession
+_short_lived_loop = contextvars.ContextVar('short_lived_loop', default=False)
+
+
+def _new_session():
+    connector = aiohttp.TCPConnector(
+        limit=getattr(settings, 'ASYNC_HTTP_MAX_CONNECTIONS', 100),
+        ttl_dns_cache=300,
+    )
+    timeout = aiohttp.ClientTimeout(total=getattr(settings, 'ASYNC_HTTP_TIMEOUT', 5.0))
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+def get_session():
+    """The ``ClientSession`` for the running event loop"""
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        session = _sessions[loop] = _new_session()
+    return session
+
+
+@contextmanager
+def short_lived_loop():
+    """Mark the code inside as running on an event loop that ends with the request"""
+    token = _short_lived_loop.set(True)
+    try:
+        yield
+    finally:
+        _short_lived_loop.reset(token)
+
+
+def loop_is_short_lived():
+    """Whether a per-loop session would be thrown away with the current request"""
+    return _short_lived_loop.get()
+
+
+async def close_session():
+    """Close the running loop's shared session, e.g. on worker shutdown"""
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
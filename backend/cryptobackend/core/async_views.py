@@ -0,0 +1,645 @@
+"""
+Async implementations of the endpoints that wait on upstream prices.
+
+Under ASGI these run on the event loop: the price lookup is awaited through
+``market_data.aget_price``/``aget_prices`` and the shared aiohttp session, and
+only the database work is handed to a thread with ``sync_to_async``. A slow
+Binance response then holds a coroutine instead of a worker thread.
+
+DRF has no async views, so ``async_api_view`` supplies the parts of
+``APIView`` these endpoints use: request parsing, the default authentication
+classes, DRF's exception handler and JSON rendering. ``method_view`` puts an
+async handler and the sync viewset for the other methods on the same URL.
+
+The ``*_batch`` endpoints take a basket of orders, price all of them from one
+``aget_prices`` call, validate them together and insert them with one
+``bulk_create`` in a single transaction; a basket is placed whole or not at
+all, with per-order results or errors in request order.
+"""
+import functools
+import logging
+from decimal import Decimal
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from rest_framework import exceptions, serializers, status
+from rest_framework.fields import empty
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .analytics import record_outcomes
+from .async_http import short_lived_loop
+from .events import publish_trade_updates
+from .exchanges import get_exchange
+from .market_data import market_data
+from .metrics import record_settlements
+from .models import ApiKey, BinaryOptionTrade, Portfolio
+from .renderers import FastJSONRenderer
+from .response_cache import bump_on_commit
+from .serializers import BinaryOptionTradeSerializer, TradeSerializer
+from .settlement import credit_balance, expiry_prices, settle_trades
+from .ticks import tick_history
+
+logger = logging.getLogger(__name__)
+
+
+def _authenticate(request):
+    if not request.user or not request.user.is_authenticated:
+        raise exceptions.NotAuthenticated()
+
+
+def _handle_exception(request, exc):
+    """``APIView.handle_exception`` without a view"""
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        authenticators = request.authenticators
+        auth_header = authenticators[0].authenticate_header(request) if authenticators else None
+        if auth_header:
+            exc.auth_header = auth_header
+        else:
+            exc.status_code = status.HTTP_403_FORBIDDEN
+    response = api_settings.EXCEPTION_HANDLER(exc, {'view': None, 'args': (), 'kwargs': {}, 'request': request})
+    if response is None:
+        raise exc
+    return response
+
+
+def _render(request, response):
+    """Render a DRF ``Response`` into a plain ``HttpResponse``, which Django will not re-render in a thread"""
+    response.accepted_renderer = FastJSONRenderer()
+    response.accepted_media_type = FastJSONRenderer.media_type
+    response.renderer_context = {'request': request, 'response': response}
+    rendered = HttpResponse(response.rendered_content, status=response.status_code)
+    for header, value in response.items():
+        rendered[header] = value
+    return rendered
+
+
+def async_api_view(http_method_names):
+    """
+    ``api_view`` for coroutines: ``view(request, *args, **kwargs)`` gets an
+    authenticated DRF ``Request`` and returns a ``Response``
+    """
+    allowed = [method.upper() for method in http_method_names]
+
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if isinstance(request, ASGIRequest):
+                return await _call(view, allowed, request, args, kwargs)
+            # WSGI runs each async view on its own event loop
+            with short_lived_loop():
+                return await _call(view, allowed, request, args, kwargs)
+
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
+
+
+async def _call(view, allowed, request, args, kwargs):
+    request = Request(
+        request,
+        parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES],
+        authenticators=[authenticator() for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES],
+    )
+    try:
+        # Authentication first, as APIView.initial runs before the method check
+        await sync_to_async(_authenticate)(request)
+        if request.method not in allowed:
+            raise exceptions.MethodNotAllowed(request.method)
+        response = await view(request, *args, **kwargs)
+    except Exception as exc:
+        response = _handle_exception(request, exc)
+    response['Allow'] = ', '.join(allowed)
+    return _render(request, response)
+
+
+def method_view(sync_view, **async_views):
+    """
+    One URL view that serves the methods in ``async_views`` (lowercase name ->
+    async view) on the event loop and every other method through the sync
+    ``sync_view`` in a thread, as Django does for sync views under ASGI
+    """
+    sync_view = sync_to_async(sync_view)
+
+    async def view(request, *args, **kwargs):
+        handler = async_views.get(request.method.lower())
+        if handler is None:
+            return await sync_view(request, *args, **kwargs)
+        return await handler(request, *args, **kwargs)
+
+    view.csrf_exempt = True
+    return view
+
+
+def run_handler(handler, request, *args):
+    """
+    Call an async handler from a sync view, e.g. a viewset method serving the
+    same operation on a route ``method_view`` does not cover
+    """
+    async def run():
+        with short_lived_loop():
+            return await handler(request, *args)
+    return async_to_sync(run)()
+
+
+def update_portfolio(user, symbol, trade_type, quantity, price):
+    try:
+        portfolio, created = Portfolio.objects.get_or_create(
+            user=user,
+            symbol=symbol,
+            defaults={
+                'quantity': 0,
+                'average_buy_price': 0
+            }
+        )
+
+        _apply_trade(portfolio, trade_type, quantity, price)
+        portfolio.save()
+    except Exception:
+        # Log the error but don't interrupt the trade
+        logger.exception('Error updating portfolio')
+
+
+def update_portfolios(user, trades):
+    """``update_portfolio`` for several trades, in order, with one read and one write of the holdings"""
+    symbols = {trade.symbol for trade in trades}
+    try:
+        with transaction.atomic():
+            # Create missing holdings first so every row can be locked
+            Portfolio.objects.bulk_create(
+                [Portfolio(user=user, symbol=symbol, quantity=0, average_buy_price=0) for symbol in symbols],
+                ignore_conflicts=True,
+            )
+            holdings = {
+                portfolio.symbol: portfolio
+                for portfolio in Portfolio.objects.select_for_update().filter(user=user, symbol__in=symbols)
+            }
+            now = timezone.now()
+            for trade in trades:
+                portfolio = holdings[trade.symbol]
+                _apply_trade(portfolio, trade.trade_type, trade.quantity, trade.price)
+                portfolio.last_updated = now
+            Portfolio.objects.bulk_update(holdings.values(), ['quantity', 'average_buy_price', 'last_updated'])
+    except Exception:
+        # Log the error but don't interrupt the trades
+        logger.exception('Error updating portfolio')
+
+
+def _apply_trade(portfolio, trade_type, quantity, price):
+    if trade_type == 'BUY':
+        # Calculate new average buy price
+        total_value = (portfolio.quantity * portfolio.average_buy_price) + (quantity * price)
+        new_quantity = portfolio.quantity + quantity
+        if new_quantity > 0:
+            new_avg_price = total_value / new_quantity
+        else:
+            new_avg_price = 0
+
+        portfolio.quantity = new_quantity
+        portfolio.average_buy_price = new_avg_price
+    else:  # SELL
+        portfolio.quantity = max(0, portfolio.quantity - quantity)
+        # We don't change the average buy price when selling
+
+
+def _save_trade(request, trade_data, price):
+    serializer = TradeSerializer(data=trade_data, context={'request': request})
+    if serializer.is_valid():
+        serializer.save(user=request.user)
+
+        # Update portfolio
+        update_portfolio(request.user, trade_data['symbol'], trade_data['trade_type'], trade_data['quantity'], price)
+
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+def _place_exchange_order(api_key, symbol, trade_type, quantity):
+    # Get the pooled client for this key
+    exchange = get_exchange(api_key)
+    symbol_pair = f"{symbol}/USDT"
+    if trade_type == 'BUY':
+        return exchange.create_market_buy_order(symbol_pair, float(quantity))
+    return exchange.create_market_sell_order(symbol_pair, float(quantity))
+
+
+async def create_trade(request):
+    """Buy or sell on the user's exchange, or at the public price"""
+    symbol = request.data.get('symbol')
+    quantity = Decimal(request.data.get('quantity'))
+    trade_type = request.data.get('trade_type')
+    api_key_id = request.data.get('api_key_id')
+
+    # Check if using an exchange API or public API
+    if api_key_id:
+        try:
+            api_key = await ApiKey.objects.aget(id=api_key_id, user=request.user, is_active=True)
+
+            # Execute the trade; ccxt is blocking, so off the request's DB thread
+            order = await sync_to_async(_place_exchange_order, thread_sensitive=False)(api_key, symbol, trade_type, quantity)
+
+            # Calculate average price and total amount
+            price = Decimal(str(order['price'])) if 'price' in order else Decimal(str(order['average']))
+            trade_data = {
+                'symbol': symbol,
+                'trade_type': trade_type,
+                'quantity': quantity,
+                'price': price,
+                'total_amount': price * quantity,
+                'exchange': api_key.exchange,
+            }
+            return await sync_to_async(_save_trade)(request, trade_data, price)
+
+        except ApiKey.DoesNotExist:
+            return Response({
+                'status': 'error',
+                'message': 'API key not found or inactive'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({
+                'status': 'error',
+                'message': str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    # Fallback to mock trading using public API
+    try:
+        current_price = await market_data.aget_price(symbol)
+    except Exception:
+        return Response({'error': 'Failed to fetch current price'}, status=status.HTTP_400_BAD_REQUEST)
+
+    trade_data = {
+        'symbol': symbol,
+        'trade_type': trade_type,
+        'quantity': quantity,
+        'price': current_price,
+        'total_amount': quantity * current_price,
+        'exchange': 'PUBLIC_API',
+    }
+    return await sync_to_async(_save_trade)(request, trade_data, current_price)
+
+
+def _save_binary_option(request, data):
+    serializer = BinaryOptionTradeSerializer(data=data, context={'request': request})
+    if serializer.is_valid():
+        serializer.save(user=request.user)
+
+        # The trade is settled at expiry by the settlement worker
+        # (python manage.py run_settlement)
+
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+async def create_binary_option(request):
+    """Open a binary option at the current price"""
+    data = request.data.copy()
+
+    # Only fetch price from API if entry_price is not provided by the client
+    if not data.get('entry_price'):
+        symbol = data.get('symbol')
+        try:
+            data['entry_price'] = await market_data.aget_price(symbol)
+        except Exception as e:
+            return Response({
+                'status': 'error',
+                'message': f'Failed to fetch current price: {str(e)}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+    return await sync_to_async(_save_binary_option)(request, _binary_option_data(data))
+
+
+def _binary_option_data(data):
+    """Accept the trade-style field names the frontend may send"""
+    # Map trade_type to direction if needed
+    if 'trade_type' in data and 'direction' not in data:
+        data['direction'] = 'UP' if data.pop('trade_type') == 'BUY' else 'DOWN'
+
+    # Set default profit percentage if not provided
+    if 'profit_percentage' not in data:
+        data['profit_percentage'] = 85.0
+
+    # Convert quantity to amount if needed
+    if 'quantity' in data and 'amount' not in data:
+        data['amount'] = data.pop('quantity')
+
+    return data
+
+
+def _batch_orders(request):
+    """The order list of a batch request (a JSON list or ``{"orders": [...]}``) and a 400 response if it is unusable"""
+    orders = request.data.get('orders') if isinstance(request.data, dict) else request.data
+    max_size = getattr(settings, 'BATCH_ORDER_MAX_SIZE', 100)
+    if not isinstance(orders, list) or not orders:
+        message = 'Expected a non-empty list of orders'
+    elif len(orders) > max_size:
+        message = f'A batch can hold at most {max_size} orders'
+    else:
+        return orders, None
+    return None, Response({'status': 'error', 'message': message}, status=status.HTTP_400_BAD_REQUEST)
+
+
+def _validate_fields(serializer_class, order, names):
+    """Run the named serializer fields on ``order``; returns (values, errors)"""
+    fields = serializer_class().fields
+    values, errors = {}, {}
+    for name in names:
+        try:
+            values[name] = fields[name].run_validation(order.get(name, empty))
+        except serializers.ValidationError as e:
+            errors[name] = e.detail
+    return values, errors
+
+
+def _save_batch(request, serializer_class, items, errors):
+    """
+    Validate the priced ``items`` together and insert them in one transaction
+    unless any order failed here or earlier (``errors``, aligned with ``items``)
+    """
+    indexes = [index for index, item_errors in enumerate(errors) if not item_errors]
+    serializer = serializer_class(data=[items[index] for index in indexes], many=True, context={'request': request})
+    if not serializer.is_valid():
+        item_errors = serializer.errors
+        if isinstance(item_errors, dict):
+            # Keyed by position under LIST_SERIALIZER_ERRORS_AS_DICT
+            item_errors = [item_errors.get(position, {}) for position in range(len(indexes))]
+        for index, order_errors in zip(indexes, item_errors):
+            errors[index] = order_errors
+    failed = sum(1 for item_errors in errors if item_errors)
+    if failed:
+        return Response({
+            'status': 'error',
+            'message': f'{failed} of {len(errors)} orders are invalid; none were placed',
+            'errors': errors,
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    with transaction.atomic():
+        created = serializer.save(user=request.user)
+        if serializer_class is TradeSerializer:
+            update_portfolios(request.user, created)
+        # bulk_create sends no post_save, so invalidate cached lists here
+        bump_on_commit([request.user.id])
+    return Response({'status': 'success', 'results': serializer.data}, status=status.HTTP_201_CREATED)
+
+
+async def create_trades_batch(request):
+    """Place a basket of trades at the public price, priced from one quote fetch"""
+    orders, error = _batch_orders(request)
+    if error is not None:
+        return error
+
+    values, errors = [], []
+    for order in orders:
+        if not isinstance(order, dict):
+            values.append(None)
+            errors.append({'non_field_errors': ['Expected an order object']})
+            continue
+        order_values, order_errors = _validate_fields(TradeSerializer, order, ('symbol', 'trade_type', 'quantity'))
+        if order.get('api_key_id'):
+            # Exchange orders cannot be rolled back with the rest of the basket
+            order_errors['api_key_id'] = ['Exchange orders cannot be batched; submit them to /api/trades/']
+        values.append(order_values)
+        errors.append(order_errors)
+
+    symbols = {order_values['symbol'] for order_values, order_errors in zip(values, errors) if not order_errors}
+    prices = await market_data.aget_prices(symbols) if symbols else {}
+
+    items = []
+    for order_values, order_errors in zip(values, errors):
+        price = prices.get(order_values['symbol'].upper()) if not order_errors else None
+        if price is None:
+            if not order_errors:
+                order_errors['symbol'] = [f'Failed to fetch current price for {order_values["symbol"]}']
+            items.append(None)
+            continue
+        items.append({
+            **order_values,
+            'price': price,
+            'total_amount': (order_values['quantity'] * price).quantize(Decimal('0.00000001')),
+            'exchange': 'PUBLIC_API',
+        })
+    return await sync_to_async(_save_batch)(request, TradeSerializer, items, errors)
+
+
+async def create_binary_options_batch(request):
+    """Open a basket of binary options, priced from one quote fetch"""
+    orders, error = _batch_orders(request)
+    if error is not None:
+        return error
+
+    items, errors = [], []
+    for order in orders:
+        if not isinstance(order, dict):
+            items.append(None)
+            errors.append({'non_field_errors': ['Expected an order object']})
+            continue
+        item = _binary_option_data(dict(order))
+        _, order_errors = _validate_fields(BinaryOptionTradeSerializer, item, ('symbol',))
+        items.append(item)
+        errors.append(order_errors)
+
+    # Only fetch prices for the orders without a client-provided entry_price
+    unpriced = [item for item, item_errors in zip(items, errors) if not item_errors and not item.get('entry_price')]
+    prices = await market_data.aget_prices({item['symbol'] for item in unpriced}) if unpriced else {}
+    for item, item_errors in zip(items, errors):
+        if item_errors or item.get('entry_price'):
+            continue
+        price = prices.get(item['symbol'].upper())
+        if price is None:
+            item_errors['symbol'] = [f'Failed to fetch current price for {item["symbol"]}']
+        else:
+            item['entry_price'] = price
+    return await sync_to_async(_save_batch)(request, BinaryOptionTradeSerializer, items, errors)
+
+
+def _close_trade(trade):
+    """Move ``trade`` out of ACTIVE with its computed result and credit the payout; False if it was settled meanwhile"""
+    # Credit the balance atomically instead of saving the user
+    with transaction.atomic():
+        closed = BinaryOptionTrade.objects.filter(pk=trade.pk, status='ACTIVE').update(
+            status=trade.status,
+            exit_price=trade.exit_price,
+            payout_amount=trade.payout_amount,
+            updated_at=timezone.now(),
+        )
+        if not closed:
+            return False
+        record_outcomes([trade])
+        if trade.payout_amount:
+            credit_balance(trade.user_id, trade.payout_amount)
+        bump_on_commit([trade.user_id])
+    publish_trade_updates([trade])
+    record_settlements([trade])
+    return True
+
+
+async def close_early(request, pk=None):
+    """Close a binary option trade before expiry"""
+    try:
+        trade = await sync_to_async(get_object_or_404)(BinaryOptionTrade, pk=pk, user=request.user)
+
+        if trade.status != 'ACTIVE':
+            return Response({
+                'status': 'error',
+                'message': 'Only active trades can be closed early'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # Current price, or the recorded price at expiry if the trade has already expired
+        try:
+            current_price = None
+            if trade.expiry_time <= timezone.now():
+                current_price = tick_history.price_at(trade.symbol, trade.expiry_time)
+            if current_price is None:
+                current_price = await market_data.aget_price(trade.symbol)
+        except Exception as e:
+            return Response({
+                'status': 'error',
+                'message': f'Failed to fetch current price: {str(e)}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # Determine if the trade is winning or losing at this point
+        if trade.direction == 'UP':
+            is_winning = current_price > trade.entry_price
+        else:  # DOWN
+            is_winning = current_price < trade.entry_price
+
+        # Early close usually offers a reduced payout or reduced loss
+        # For simplicity, we'll use 80% of normal payout for winners
+        # and 20% refund for losers
+        if is_winning:
+            trade.status = 'WON'
+            reduced_percentage = trade.profit_percentage * Decimal('0.8')
+            trade.payout_amount = trade.amount + (trade.amount * reduced_percentage / 100)
+        else:
+            trade.status = 'LOST'
+            refund_percentage = 20
+            trade.payout_amount = trade.amount * Decimal(refund_percentage) / 100
+
+        trade.exit_price = current_price
+
+        # Only move the trade out of ACTIVE if nobody settled it meanwhile
+        if not await sync_to_async(_close_trade)(trade):
+            return Response({
+                'status': 'error',
+                'message': 'Only active trades can be closed early'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(BinaryOptionTradeSerializer(trade, context={'request': request}).data)
+
+    except Exception as e:
+        return Response({
+            'status': 'error',
+            'message': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@async_api_view(['GET'])
+async def update_expired_trades(request):
+    """
+    Check for expired trades and update their status
+    Compare the entry price with the current price to determine if the trade is won or lost
+
+    Optional parameters:
+    - force: Process all active trades even if not expired
+    - ignore_expiry: Ignore the expiry time check
+    - manual_price: Use this price instead of fetching from API
+    - trade_id: Process only a specific trade (by ID)
+    """
+    now = timezone.now()
+
+    logger.debug(f"update_expired_trades called at {now}. Query params: {request.query_params}")
+
+    # Check if a specific trade_id was provided
+    specific_trade_id = request.query_params.get('trade_id')
+    if specific_trade_id:
+        logger.debug(f"Processing specific trade ID: {specific_trade_id}")
+        # Get only the specified trade that belongs to this user
+        expired_trades = BinaryOptionTrade.objects.filter(
+            user=request.user,
+            status='ACTIVE',
+            id=specific_trade_id
+        )
+    else:
+        # Find all active trades
+        expired_trades = BinaryOptionTrade.objects.filter(
+            user=request.user,
+            status='ACTIVE'
+        )
+
+    # By default, skip trades that are not yet fully expired
+    if 'ignore_expiry' not in request.query_params and 'force' not in request.query_params:
+        expired_trades = expired_trades.filter(expiry_time__lte=now)
+
+    # Evaluate the queryset once; the list doubles as the emptiness check
+    expired_trades = [trade async for trade in expired_trades]
+    logger.debug(f"Found {len(expired_trades)} trades to process")
+
+    if not expired_trades:
+        return Response({
+            'status': 'success',
+            'message': 'No expired trades found',
+            'updated_trades': []
+        })
+
+    # Check if manual price is provided
+    symbols = {trade.symbol.upper() for trade in expired_trades}
+    recorded = {}
+    if 'manual_price' in request.query_params:
+        try:
+            manual_price = Decimal(request.query_params['manual_price'])
+            logger.debug(f"Using manual price: {manual_price}")
+        except (ValueError, TypeError, ArithmeticError):
+            return Response({
+                'status': 'error',
+                'message': 'Invalid manual price provided'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        prices = {symbol: manual_price for symbol in symbols}
+    else:
+        # Settle at the recorded price at expiry where there is one; fetch
+        # the current price once per symbol for the rest
+        recorded = expiry_prices(expired_trades)
+        symbols = {trade.symbol.upper() for trade in expired_trades if trade.id not in recorded}
+        prices = await market_data.aget_prices(symbols) if symbols else {}
+        missing = symbols - prices.keys()
+        if missing:
+            return Response({
+                'status': 'error',
+                'message': f'Failed to fetch current price for {", ".join(sorted(missing))}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    try:
+        # Trades settled concurrently (e.g. by the settlement worker) are skipped
+        expired_trades = await sync_to_async(settle_trades)(expired_trades, prices, recorded)
+    except Exception as e:
+        logger.exception("Error settling trades")
+        return Response({
+            'status': 'error',
+            'message': f'Error updating trades: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    updated_trades = [{
+        'id': trade.id,
+        'status': trade.status,
+        'exit_price': str(trade.exit_price),
+        'payout_amount': str(trade.payout_amount)
+    } for trade in expired_trades]
+
+    logger.debug(f"Successfully updated {len(updated_trades)} trades")
+    return Response({
+        'status': 'success',
+        'message': f'Updated {len(updated_trades)} expired trades',
+        'updated_trades': updated_trades
+    })
+
+
+# URL views for the handlers above (see cryptobackend/urls.py)
+create_trade_view = async_api_view(['POST'])(create_trade)
+create_binary_option_view = async_api_view(['POST'])(create_binary_option)
+close_early_view = async_api_view(['POST'])(close_early)
+create_trades_batch_view = async_api_view(['POST'])(create_trades_batch)
+create_binary_options_batch_view = async_api_view(['POST'])(create_binary_options_batch)
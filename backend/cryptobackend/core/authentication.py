@@ -0,0 +1,98 @@
+"""
+JWT authentication that resolves users from a short-lived in-process cache.
+
+``JWTAuthentication`` loads the user row on every request. Here the loaded
+user is kept for ``AUTH_USER_CACHE_TTL`` seconds under the user's auth
+version, a counter in the shared ``versions`` cache that is bumped whenever
+the user row is saved or deleted (password change, deactivation, ...). A
+bump in any process makes every process reload the user on its next request,
+so revocation is as immediate as without the cache.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .response_cache import bump_version, get_version
+
+
+def _auth_version_key(user_id):
+    return f'auth-version:{user_id}'
+
+
+def get_auth_version(user_id):
+    return get_version(_auth_version_key(user_id))
+
+
+def bump_auth_version(user_id):
+    """Drop ``user_id`` from every process's user cache"""
+    bump_version(_auth_version_key(user_id))
+
+
+class UserCache:
+    """LRU of user objects keyed by user id, valid for one auth version and ``ttl`` seconds"""
+
+    def __init__(self, ttl=None, max_size=None):
+        self.ttl = ttl if ttl is not None else getattr(settings, 'AUTH_USER_CACHE_TTL', 30.0)
+        self.max_size = max_size if max_size is not None else getattr(settings, 'AUTH_USER_CACHE_SIZE', 10000)
+        self._lock = threading.Lock()
+        self._users = OrderedDict()  # user id -> (auth version, loaded_at, user)
+
+    def get(self, user_id, version):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] != version or time.monotonic() - entry[1] >= self.ttl:
+                del self._users[user_id]
+                return None
+            self._users.move_to_end(user_id)
+            # Each request gets its own copy to modify
+            return copy.copy(entry[2])
+
+    def set(self, user_id, version, user):
+        with self._lock:
+            self._users[user_id] = (version, time.monotonic(), copy.copy(user))
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_size:
+                self._users.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+user_cache = UserCache()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """``JWTAuthentication`` with users resolved through ``user_cache``"""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_('Token contained no recognizable user identification')) from e
+
+        version = get_auth_version(user_id)
+        user = user_cache.get(user_id, version)
+        if user is None:
+            # Loads the row and runs the active and revocation checks
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, version, user)
+            return user
+
+        # The same checks against the cached row, which is current for this version
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+        return user
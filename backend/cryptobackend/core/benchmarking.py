@@ -0,0 +1,33 @@
+"""Helpers shared by the benchmark management commands"""
+import math
+
+from django.contrib.auth import get_user_model
+
+User = get_user_model()
+
+BENCHMARK_EMAIL_DOMAIN = 'bench.cryptrade.local'
+SYMBOLS = ['BTC', 'ETH', 'BNB', 'ADA', 'DOGE', 'XRP', 'SOL', 'DOT', 'AVAX', 'MATIC']
+
+
+def benchmark_users():
+    return User.objects.filter(email__endswith=f'@{BENCHMARK_EMAIL_DOMAIN}')
+
+
+def seed_users(count, batch_size=10_000):
+    """Make sure ``count`` benchmark users exist and return their ids"""
+    existing = set(benchmark_users().values_list('email', flat=True))
+    User.objects.bulk_create([
+        User(email=f'bench{i}@{BENCHMARK_EMAIL_DOMAIN}', username=f'bench{i}', password='!')
+        for i in range(count)
+        if f'bench{i}@{BENCHMARK_EMAIL_DOMAIN}' not in existing
+    ], batch_size=batch_size)
+    return list(benchmark_users().order_by('id').values_list('id', flat=True)[:count])
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of ``values`` (``pct`` in 0-100)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
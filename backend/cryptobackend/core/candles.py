@@ -0,0 +1,279 @@
+"""
+On-disk price history: sampled ticks and 1-minute candles per symbol.
+
+Each series is a directory of fixed-size, append-only segment files of
+float64 records that are memory-mapped for both writing and reading, so a
+range read is a binary search plus a sequential scan of mapped pages, with
+no database or upstream calls. The single writer
+(``python manage.py broadcast_prices``) appends every sampled tick and rolls
+each closed minute up into the ``1m`` series; 5m/15m/1h candles are built
+from 1m candles at read time, and the still-open minute from raw ticks.
+
+Layout: ``<CANDLE_STORE_DIR>/<SYMBOL>/<series>/<first timestamp in ms>.seg``.
+"""
+import bisect
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+
+from django.conf import settings
+
+INTERVALS = {'1m': 60, '5m': 300, '15m': 900, '1h': 3600}
+BASE_INTERVAL = 60
+
+TICKS = 'ticks'
+MINUTES = '1m'
+# Fields per record, all float64: ticks are (time, price), candles (open time, open, high, low, close)
+FIELDS = {TICKS: 2, MINUTES: 5}
+# Records per segment file: about a day of 1s ticks, a month of minutes
+SEGMENT_RECORDS = {TICKS: 86_400, MINUTES: 44_640}
+
+HEADER = struct.Struct('<8sQ')  # magic, record count
+MAGIC = b'CTSEG001'
+SUFFIX = '.seg'
+SYMBOL_PATTERN = re.compile(r'^[A-Z0-9]{1,20}$')
+
+
+class Segment:
+    """One memory-mapped segment file of fixed-width float64 records, ordered by time"""
+
+    def __init__(self, path, fields, writable=False):
+        self.path = path
+        self.fields = fields
+        self._file = open(path, 'r+b' if writable else 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        if HEADER.unpack_from(self._mmap)[0] != MAGIC:
+            self._mmap.close()
+            self._file.close()
+            raise ValueError(f'Not a segment file: {path}')
+        self._values = memoryview(self._mmap)[HEADER.size:].cast('d')
+        self.capacity = len(self._values) // fields
+        # Strided view of the time field, for binary search
+        self._times = self._values[::fields]
+
+    @classmethod
+    def create(cls, path, fields, capacity):
+        with open(path, 'xb') as f:
+            f.write(HEADER.pack(MAGIC, 0))
+            f.truncate(HEADER.size + capacity * fields * 8)
+        return cls(path, fields, writable=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def count(self):
+        return HEADER.unpack_from(self._mmap)[1]
+
+    def is_full(self):
+        return self.count >= self.capacity
+
+    def append(self, record):
+        count = self.count
+        offset = count * self.fields
+        for i, value in enumerate(record):
+            self._values[offset + i] = value
+        # Publish the new count only after the record is complete, so
+        # concurrent readers never see a partial record
+        HEADER.pack_into(self._mmap, 0, MAGIC, count + 1)
+
+    def last(self):
+        count = self.count
+        if not count:
+            return None
+        return tuple(self._values[(count - 1) * self.fields:count * self.fields].tolist())
+
+    def records(self, start, end):
+        """Records with ``start <= time < end``"""
+        count = self.count
+        lo = bisect.bisect_left(self._times, start, 0, count)
+        hi = bisect.bisect_left(self._times, end, lo, count)
+        flat = self._values[lo * self.fields:hi * self.fields].tolist()
+        return list(zip(*[iter(flat)] * self.fields))
+
+    def close(self):
+        self._times.release()
+        self._values.release()
+        self._mmap.close()
+        self._file.close()
+
+
+def aggregate(rows, interval):
+    """Merge time-ordered (time, open, high, low, close) rows into ``interval``-second candles"""
+    candles = []
+    for row_time, open_, high, low, close in rows:
+        bucket = row_time - row_time % interval
+        if candles and candles[-1][0] == bucket:
+            candle = candles[-1]
+            candle[2] = max(candle[2], high)
+            candle[3] = min(candle[3], low)
+            candle[4] = close
+        else:
+            candles.append([bucket, open_, high, low, close])
+    return candles
+
+
+class TickStore:
+    """
+    Append ticks and read back ticks or candles per symbol.
+
+    Any number of processes may read; only one process may write.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._writers = {}  # (symbol, series) -> writable Segment
+        self._pending = {}  # symbol -> unfinished minute as [open time, open, high, low, close]
+
+    def _series_dir(self, symbol, series):
+        if not SYMBOL_PATTERN.match(symbol):
+            raise ValueError(f'Invalid symbol {symbol}')
+        return os.path.join(self.directory, symbol, series)
+
+    def _segments(self, symbol, series):
+        """(first time, path) of each segment of a series, oldest first"""
+        directory = self._series_dir(symbol, series)
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return []
+        return sorted(
+            (int(name[:-len(SUFFIX)]) / 1000, os.path.join(directory, name))
+            for name in names if name.endswith(SUFFIX)
+        )
+
+    def read(self, symbol, series, start, end):
+        """Records of a series with ``start <= time < end``, oldest first"""
+        symbol = symbol.upper()
+        segments = self._segments(symbol, series)
+        records = []
+        for i, (first, path) in enumerate(segments):
+            # Segment names are floored to the millisecond
+            next_first = segments[i + 1][0] + 0.001 if i + 1 < len(segments) else math.inf
+            if first >= end or next_first <= start:
+                continue
+            with Segment(path, FIELDS[series]) as segment:
+                records.extend(segment.records(start, end))
+        return records
+
+    def ticks(self, symbol, start, end):
+        """(time, price) ticks with ``start <= time < end``"""
+        return self.read(symbol, TICKS, start, end)
+
+    def candles(self, symbol, interval, start, end):
+        """[open time, open, high, low, close] candles opening in ``[start, end)``; ``interval`` is a multiple of 60"""
+        start -= start % interval
+        minutes = self.read(symbol, MINUTES, start, end)
+        # Minutes after the last rolled-up one are only in the raw ticks
+        tail_start = minutes[-1][0] + BASE_INTERVAL if minutes else start
+        tail = self.ticks(symbol, tail_start, end)
+        minutes.extend(aggregate(((t, p, p, p, p) for t, p in tail), BASE_INTERVAL))
+        return aggregate(minutes, interval)
+
+    def _last_record(self, symbol, series):
+        for _, path in reversed(self._segments(symbol, series)):
+            with Segment(path, FIELDS[series]) as segment:
+                last = segment.last()
+            if last is not None:
+                return last
+        return None
+
+    def _writer(self, symbol, series, timestamp):
+        key = (symbol, series)
+        segment = self._writers.get(key)
+        if segment is None:
+            segments = self._segments(symbol, series)
+            if segments:
+                segment = Segment(segments[-1][1], FIELDS[series], writable=True)
+        if segment is None or segment.is_full():
+            if segment is not None:
+                segment.close()
+            directory = self._series_dir(symbol, series)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f'{int(timestamp * 1000):015d}{SUFFIX}')
+            segment = Segment.create(path, FIELDS[series], SEGMENT_RECORDS[series])
+        self._writers[key] = segment
+        return segment
+
+    def _roll_up(self, symbol, timestamp, price):
+        minute = timestamp - timestamp % BASE_INTERVAL
+        candle = self._pending.get(symbol)
+        if candle is not None and candle[0] != minute:
+            self._writer(symbol, MINUTES, candle[0]).append(candle)
+            candle = None
+        if candle is None:
+            self._pending[symbol] = [minute, price, price, price, price]
+        else:
+            candle[2] = max(candle[2], price)
+            candle[3] = min(candle[3], price)
+            candle[4] = price
+
+    def _resume(self, symbol):
+        """Rebuild the unfinished minute from ticks written before a restart"""
+        self._pending[symbol] = None
+        last_minute = self._last_record(symbol, MINUTES)
+        if last_minute is not None:
+            since = last_minute[0] + BASE_INTERVAL
+        else:
+            # Nothing rolled up yet: only the last tick's minute can be open,
+            # so skip reading the whole tick history
+            last_tick = self._last_record(symbol, TICKS)
+            if last_tick is None:
+                return
+            since = last_tick[0] - last_tick[0] % BASE_INTERVAL
+        for timestamp, price in self.ticks(symbol, since, math.inf):
+            self._roll_up(symbol, timestamp, price)
+
+    def append(self, symbol, price, timestamp=None):
+        """Record one tick; returns False if it is not newer than the symbol's last tick"""
+        symbol = symbol.upper()
+        timestamp = time.time() if timestamp is None else timestamp
+        price = float(price)
+        with self._lock:
+            if symbol not in self._pending:
+                self._resume(symbol)
+            ticks = self._writer(symbol, TICKS, timestamp)
+            last = ticks.last()
+            if last is not None and timestamp <= last[0]:
+                return False
+            ticks.append((timestamp, price))
+            self._roll_up(symbol, timestamp, price)
+        return True
+
+    def append_prices(self, prices, timestamp=None):
+        """Record one tick per symbol from a ``{symbol: price}`` mapping, all at the same time"""
+        timestamp = time.time() if timestamp is None else timestamp
+        for symbol, price in prices.items():
+            self.append(symbol, price, timestamp)
+
+    def close(self):
+        with self._lock:
+            for segment in self._writers.values():
+                segment.close()
+            self._writers.clear()
+            self._pending.clear()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_tick_store():
+    """Return the process-wide store in ``CANDLE_STORE_DIR``, creating it on first use"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TickStore(settings.CANDLE_STORE_DIR)
+        return _store
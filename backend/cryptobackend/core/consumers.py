@@ -0,0 +1,105 @@
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .candles import SYMBOL_PATTERN
+from .events import price_group, user_group
+
+User = get_user_model()
+
+MAX_SUBSCRIPTIONS = 50
+USAGE = 'Expected {"action": "subscribe"|"unsubscribe", "symbols": [...]}'
+
+
+@database_sync_to_async
+def get_user_for_token(raw_token):
+    """Return the active user an access token belongs to, or None"""
+    try:
+        token = AccessToken(raw_token)
+        user_id = token[api_settings.USER_ID_CLAIM]
+    except (TokenError, KeyError):
+        return None
+    return User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}, is_active=True).first()
+
+
+class LiveUpdatesConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Live price ticks and trade status changes over one WebSocket.
+
+    Connect to ``/ws/live/?token=<JWT access token>``, then send
+    ``{"action": "subscribe", "symbols": ["BTC", "ETH"]}`` (or ``unsubscribe``).
+    The server pushes ``{"type": "price", ...}`` for subscribed symbols and
+    ``{"type": "trade", ...}`` whenever one of the user's trades settles.
+    Malformed messages, symbols other than 1-20 letters or digits, and more
+    than ``MAX_SUBSCRIPTIONS`` symbols are answered with ``{"type": "error"}``.
+    """
+
+    async def connect(self):
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        token = (query.get('token') or [None])[0]
+        self.user = await get_user_for_token(token) if token else None
+        if self.user is None:
+            await self.close(code=4401)
+            return
+
+        self.symbols = set()
+        await self.channel_layer.group_add(user_group(self.user.pk), self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if getattr(self, 'user', None) is None:
+            return
+        await self.channel_layer.group_discard(user_group(self.user.pk), self.channel_name)
+        for symbol in self.symbols:
+            await self.channel_layer.group_discard(price_group(symbol), self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None, **kwargs):
+        # Malformed or binary frames get an error frame instead of closing the socket
+        try:
+            content = await self.decode_json(text_data) if text_data else None
+        except ValueError:
+            content = None
+        await self.receive_json(content, **kwargs)
+
+    async def receive_json(self, content, **kwargs):
+        if not isinstance(content, dict):
+            await self.send_error(USAGE)
+            return
+        action = content.get('action')
+        symbols = content.get('symbols')
+        if action not in ('subscribe', 'unsubscribe') or not isinstance(symbols, list):
+            await self.send_error(USAGE)
+            return
+        invalid = [symbol for symbol in symbols if not isinstance(symbol, str) or not SYMBOL_PATTERN.fullmatch(symbol.upper())]
+        if invalid:
+            await self.send_error(f'Invalid symbols: {", ".join(map(str, invalid[:5]))}'[:200])
+            return
+
+        symbols = {symbol.upper() for symbol in symbols}
+        if action == 'subscribe':
+            symbols -= self.symbols
+            if len(self.symbols) + len(symbols) > MAX_SUBSCRIPTIONS:
+                await self.send_error(f'At most {MAX_SUBSCRIPTIONS} symbols can be subscribed')
+                return
+            for symbol in symbols:
+                await self.channel_layer.group_add(price_group(symbol), self.channel_name)
+            self.symbols |= symbols
+        else:
+            for symbol in symbols & self.symbols:
+                await self.channel_layer.group_discard(price_group(symbol), self.channel_name)
+            self.symbols -= symbols
+        await self.send_json({'type': 'subscriptions', 'symbols': sorted(self.symbols)})
+
+    async def send_error(self, message):
+        await self.send_json({'type': 'error', 'message': message})
+
+    async def price_tick(self, event):
+        await self.send_json({'type': 'price', 'symbol': event['symbol'], 'price': event['price']})
+
+    async def trade_update(self, event):
+        await self.send_json({'type': 'trade', 'trade': event['trade']})
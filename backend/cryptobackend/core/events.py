@@ -0,0 +1,60 @@
+"""
+Push events to WebSocket clients through the channel layer.
+
+Groups:
+- ``user_<id>``: trade status changes for one user
+- ``prices_<SYMBOL>``: price ticks for one symbol
+
+Publishing is a no-op when no channel layer is configured, so the HTTP API
+works the same with or without the WebSocket endpoint.
+"""
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+logger = logging.getLogger(__name__)
+
+
+def user_group(user_id):
+    return f'user_{user_id}'
+
+
+def price_group(symbol):
+    return f'prices_{symbol.upper()}'
+
+
+def _send(group, message):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(group, message)
+    except Exception:
+        # A push failure must never fail the trade or settlement that caused it
+        logger.exception('Failed to publish %s to %s', message['type'], group)
+
+
+def publish_trade_updates(trades):
+    """Tell each owner that their trades changed status (e.g. ACTIVE -> WON/LOST)"""
+    for trade in trades:
+        _send(user_group(trade.user_id), {
+            'type': 'trade.update',
+            'trade': {
+                'id': trade.id,
+                'symbol': trade.symbol,
+                'status': trade.status,
+                'exit_price': str(trade.exit_price) if trade.exit_price is not None else None,
+                'payout_amount': str(trade.payout_amount) if trade.payout_amount is not None else None,
+            },
+        })
+
+
+def publish_prices(prices):
+    """Send a tick to the subscribers of each symbol in a symbol -> price map"""
+    for symbol, price in prices.items():
+        _send(price_group(symbol), {
+            'type': 'price.tick',
+            'symbol': symbol.upper(),
+            'price': str(price),
+        })
@@ -0,0 +1,105 @@
+"""
+Pooled ccxt exchange clients.
+
+Building a ccxt client is cheap, but the first call on a new one has to load
+market metadata and open a fresh HTTP session. ``exchange_registry`` keeps
+initialized clients keyed by ``ApiKey`` id with LRU eviction, so repeated
+requests for the same key reuse the loaded markets and keep-alive connections.
+An entry is rebuilt when the key's credentials change, and dropped when the
+key is saved or deleted (see ``core.signals``).
+"""
+import threading
+from collections import OrderedDict
+
+import ccxt
+from django.conf import settings
+
+from . import simulator
+from .metrics import instrument_exchange
+
+# ApiKey.EXCHANGE_CHOICES -> ccxt class name
+EXCHANGE_CLASSES = {
+    'BINANCE': 'binance',
+    'COINBASE': 'coinbase',
+    'KRAKEN': 'kraken',
+    'KUCOIN': 'kucoin',
+    'BITFINEX': 'bitfinex',
+}
+
+
+class UnsupportedExchange(Exception):
+    """Raised for an exchange with no ccxt client mapping"""
+
+
+def build_exchange(api_key):
+    """Create a new ccxt client for ``api_key``, or a simulated one when the simulator is enabled"""
+    if simulator.is_enabled():
+        if api_key.exchange not in EXCHANGE_CLASSES:
+            raise UnsupportedExchange(f'Unsupported exchange: {api_key.exchange}')
+        return simulator.SimulatedExchange(
+            simulator.get_simulator(),
+            name=EXCHANGE_CLASSES[api_key.exchange],
+            start_balance=getattr(settings, 'MARKET_SIMULATOR_START_BALANCE', 100000.0),
+        )
+    try:
+        exchange_class = getattr(ccxt, EXCHANGE_CLASSES[api_key.exchange])
+    except KeyError:
+        raise UnsupportedExchange(f'Unsupported exchange: {api_key.exchange}')
+    return instrument_exchange(exchange_class({
+        'apiKey': api_key.api_key,
+        'secret': api_key.api_secret,
+        'enableRateLimit': True,
+        # Per-call deadline in milliseconds
+        'timeout': int(getattr(settings, 'EXCHANGE_FETCH_DEADLINE', 5.0) * 1000),
+    }))
+
+
+class ExchangeRegistry:
+    """LRU cache of initialized ccxt clients keyed by ApiKey id"""
+
+    def __init__(self, factory=build_exchange, max_size=None):
+        self.factory = factory
+        self.max_size = max_size if max_size is not None else getattr(settings, 'EXCHANGE_CLIENT_CACHE_SIZE', 256)
+        self._lock = threading.Lock()
+        self._clients = OrderedDict()  # api_key.id -> (fingerprint, client)
+
+    @staticmethod
+    def _fingerprint(api_key):
+        # A key edited in another process shows up here as new credentials
+        return (api_key.exchange, api_key.api_key, api_key.api_secret)
+
+    def get(self, api_key):
+        """Return a cached client for ``api_key``, building one on first use"""
+        fingerprint = self._fingerprint(api_key)
+        with self._lock:
+            entry = self._clients.get(api_key.pk)
+            if entry is not None and entry[0] == fingerprint:
+                self._clients.move_to_end(api_key.pk)
+                return entry[1]
+
+        client = self.factory(api_key)
+        with self._lock:
+            self._clients[api_key.pk] = (fingerprint, client)
+            self._clients.move_to_end(api_key.pk)
+            while len(self._clients) > self.max_size:
+                self._clients.popitem(last=False)
+        return client
+
+    def invalidate(self, api_key_id):
+        with self._lock:
+            self._clients.pop(api_key_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+
+    def __len__(self):
+        return len(self._clients)
+
+
+exchange_registry = ExchangeRegistry()
+
+
+def get_exchange(api_key):
+    """Shortcut for ``exchange_registry.get``"""
+    return exchange_registry.get(api_key)
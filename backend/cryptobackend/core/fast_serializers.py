@@ -0,0 +1,163 @@
+"""
+Read-only list serialization straight from ``.values()`` rows.
+
+``ModelSerializer(many=True)`` builds a model instance per row and then runs
+every field through DRF's generic ``to_representation`` machinery. For list
+endpoints ``get_values_serializer(serializer_class)`` instead derives one
+plain converter per field from the serializer once and applies them to the
+dicts ``.values()`` returns. The output is identical to ``serializer.data``;
+serializers with a field it cannot reproduce exactly get ``None``, and
+``ValuesListMixin`` falls back to the regular serializer for them.
+"""
+import decimal
+import functools
+
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.settings import ISO_8601, api_settings
+
+
+def _char(field):
+    return str
+
+
+def _integer(field):
+    return int
+
+
+def _big_integer(field):
+    if getattr(field, 'coerce_to_string', api_settings.COERCE_BIGINT_TO_STRING):
+        return str
+    return int
+
+
+def _float(field):
+    return float
+
+
+def _boolean(field):
+    # Database booleans already are True/False
+    return bool
+
+
+def _choice(field):
+    if any(key != value for key, value in field.choice_strings_to_values.items()):
+        return field.to_representation
+    return str
+
+
+def _decimal(field):
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if not coerce_to_string or field.localize or getattr(field, 'normalize_output', False):
+        return field.to_representation
+    if field.decimal_places is None:
+        return '{:f}'.format
+
+    # DecimalField.quantize with its context and exponent built once
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def convert(value):
+        return f'{value.quantize(exponent, rounding=rounding, context=context):f}'
+    return convert
+
+
+def _datetime(field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+        return field.to_representation
+
+    def convert(value):
+        if value.tzinfo is None:
+            return field.to_representation(value)
+        text = value.astimezone(field_timezone).isoformat()
+        return text[:-6] + 'Z' if text.endswith('+00:00') else text
+    return convert
+
+
+# Exact field classes only: a subclass may override to_representation.
+# Converters are built per response, as the current timezone is per request.
+CONVERTERS = {
+    serializers.CharField: _char,
+    serializers.IntegerField: _integer,
+    serializers.FloatField: _float,
+    serializers.BooleanField: _boolean,
+    serializers.ChoiceField: _choice,
+    serializers.DecimalField: _decimal,
+    serializers.DateTimeField: _datetime,
+}
+if hasattr(serializers, 'BigIntegerField'):
+    # DRF 3.16+ maps BigAutoField primary keys to it
+    CONVERTERS[serializers.BigIntegerField] = _big_integer
+
+
+class ValuesSerializer:
+    """Serializes ``.values()`` rows like ``serializer_class(many=True).data``"""
+
+    def __init__(self, serializer_class, fields):
+        self.serializer_class = serializer_class
+        # (output name, model field name, serializer field) in output order
+        self.fields = fields
+        self.sources = [source for _, source, _ in fields]
+
+    def values(self, queryset, *extra):
+        """``queryset`` as dicts with the serialized fields plus ``extra``"""
+        return queryset.values(*self.sources, *[name for name in extra if name not in self.sources])
+
+    def serialize(self, rows):
+        converters = [(name, source, CONVERTERS[type(field)](field)) for name, source, field in self.fields]
+        data = []
+        append = data.append
+        for row in rows:
+            item = {}
+            for name, source, convert in converters:
+                value = row[source]
+                item[name] = None if value is None else convert(value)
+            append(item)
+        return data
+
+
+@functools.lru_cache(maxsize=None)
+def get_values_serializer(serializer_class):
+    """A ``ValuesSerializer`` for a ``ModelSerializer`` class, or None if it cannot mirror it exactly"""
+    if not issubclass(serializer_class, serializers.ModelSerializer):
+        return None
+    if serializer_class.to_representation is not serializers.Serializer.to_representation:
+        return None
+
+    model = serializer_class.Meta.model
+    concrete = {field.name for field in model._meta.concrete_fields if not field.is_relation}
+    fields = []
+    for field in serializer_class().fields.values():
+        if field.write_only:
+            continue
+        if type(field) not in CONVERTERS or field.source not in concrete:
+            return None
+        fields.append((field.field_name, field.source, field))
+    return ValuesSerializer(serializer_class, fields)
+
+
+class ValuesListMixin:
+    """ViewSet mixin that builds list responses with ``ValuesSerializer`` where possible"""
+
+    def list(self, request, *args, **kwargs):
+        return self.list_response(self.filter_queryset(self.get_queryset()))
+
+    def list_response(self, queryset):
+        """Serialized ``queryset`` (model instances), paginated if the client asked for it"""
+        values_serializer = get_values_serializer(self.get_serializer_class())
+        if values_serializer is None:
+            page = self.paginate_queryset(queryset)
+            if page is not None:
+                return self.get_paginated_response(self.get_serializer(page, many=True).data)
+            return Response(self.get_serializer(queryset, many=True).data)
+
+        queryset = values_serializer.values(queryset)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(values_serializer.serialize(page))
+        return Response(values_serializer.serialize(queryset))
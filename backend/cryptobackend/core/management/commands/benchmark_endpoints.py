@@ -0,0 +1,232 @@
+import json
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.benchmarking import SYMBOLS, benchmark_users, percentile, seed_users
+from core.market_data import market_data
+from core.models import BinaryOptionTrade, Portfolio, Trade
+from core.simulator import MarketSimulator, RandomWalkFeed
+
+ENDPOINTS = {
+    'binary-options': '/api/binary-options/',
+    'check-trades': '/api/check-trades/',
+    'trades': '/api/trades/',
+    'total-value': '/api/portfolio/total_value/',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test the API endpoints in-process against a simulated price source and report '
+        'p50/p95/p99 latency, requests per second and DB queries per request as JSON. '
+        'Seeds benchmark users and their trades; never run against production.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--trades-per-user', type=int, default=1_000)
+        parser.add_argument('--binary-options-per-user', type=int, default=1_000)
+        parser.add_argument('--holdings-per-user', type=int, default=len(SYMBOLS))
+        parser.add_argument('--expired-per-user', type=int, default=20,
+                            help='Expired ACTIVE binary options each settling check-trades request settles')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS),
+                            help=f'Comma-separated subset of: {", ".join(ENDPOINTS)}')
+        parser.add_argument('--upstream-latency-ms', type=float, default=50.0,
+                            help='Simulated price source latency')
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse previously seeded data')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        endpoints = [name.strip() for name in options['endpoints'].split(',') if name.strip()]
+        unknown = set(endpoints) - ENDPOINTS.keys()
+        if unknown:
+            raise CommandError(f'Unknown endpoints: {", ".join(sorted(unknown))}')
+
+        # Stub the upstream so runs are reproducible and offline
+        simulator = MarketSimulator(RandomWalkFeed(seed=42), latency_ms=options['upstream_latency_ms'], seed=42)
+        market_data.fetcher = simulator.fetch_price
+        market_data.bulk_fetcher = simulator.fetch_prices
+        market_data.invalidate()
+
+        user_ids = seed_users(options['users'])
+        if not options['skip_seed']:
+            self.seed(user_ids, options)
+        users = list(benchmark_users().filter(id__in=user_ids).order_by('id'))
+        tokens = [str(AccessToken.for_user(user)) for user in users]
+
+        report = {
+            'config': {
+                key: options[key] for key in (
+                    'users', 'trades_per_user', 'binary_options_per_user', 'holdings_per_user',
+                    'expired_per_user', 'requests', 'concurrency', 'upstream_latency_ms',
+                )
+            },
+            'database': connection.vendor,
+            'endpoints': {},
+        }
+        for name in endpoints:
+            self.stderr.write(f'Benchmarking {name}...')
+            if name == 'check-trades':
+                report['endpoints'][name] = self.run_check_trades(users, tokens, options)
+            else:
+                report['endpoints'][name] = self.run_endpoint(ENDPOINTS[name], tokens, options)
+        report['market_data'] = market_data.stats()
+
+        output = json.dumps(report, indent=2, default=str)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stderr.write(f'Report written to {options["output"]}')
+        else:
+            self.stdout.write(output)
+
+    def run_endpoint(self, path, tokens, options):
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            results, wall = self.run_requests(pool, path, [tokens[i % len(tokens)] for i in range(options['requests'])])
+            self.close_connections(pool, options['concurrency'])
+        return self.summarise(results, wall)
+
+    def run_check_trades(self, users, tokens, options):
+        """
+        Measure check-trades settling expired trades and its "nothing expired"
+        fast path separately. Settling requests run in rounds of one request per
+        user, and every user gets fresh expired trades before each round
+        (untimed), so each request settles ``--expired-per-user`` trades.
+        """
+        path = ENDPOINTS['check-trades']
+        report = {}
+        if options['expired_per_user'] > 0:
+            rng = random.Random(42)
+            results, wall = [], 0.0
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                while len(results) < options['requests']:
+                    batch = min(len(users), options['requests'] - len(results))
+                    self.seed_expired([user.id for user in users[:batch]], options['expired_per_user'], rng)
+                    batch_results, batch_wall = self.run_requests(pool, path, tokens[:batch])
+                    results += batch_results
+                    wall += batch_wall
+                self.close_connections(pool, options['concurrency'])
+            report['settling'] = self.summarise(results, wall)
+        # Every expired trade is settled now, so these all take the fast path
+        report['steady_state'] = self.run_endpoint(path, tokens, options)
+        return report
+
+    def run_requests(self, pool, path, tokens):
+        """Make one GET per token on ``pool``; return the (latency ms, queries, status) results and wall time"""
+        local = threading.local()
+        results = []
+        results_lock = threading.Lock()
+
+        def request(token):
+            if not hasattr(local, 'client'):
+                local.client = Client(raise_request_exception=False)
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = local.client.get(path, HTTP_AUTHORIZATION=f'Bearer {token}')
+                elapsed = (time.perf_counter() - start) * 1000
+            with results_lock:
+                results.append((elapsed, len(queries.captured_queries), response.status_code))
+
+        started = time.perf_counter()
+        list(pool.map(request, tokens))
+        return results, time.perf_counter() - started
+
+    def close_connections(self, pool, workers):
+        """Release the per-thread DB connections"""
+        def close_connection(_):
+            connection.close()
+
+        list(pool.map(close_connection, range(workers)))
+
+    def summarise(self, results, wall):
+        latencies = [elapsed for elapsed, _, _ in results]
+        query_counts = [count for _, count, _ in results]
+        return {
+            'requests': len(results),
+            'errors': sum(1 for _, _, status in results if status >= 400),
+            'requests_per_second': round(len(results) / wall, 2),
+            'latency_ms': {
+                'mean': round(statistics.mean(latencies), 3),
+                'p50': round(percentile(latencies, 50), 3),
+                'p95': round(percentile(latencies, 95), 3),
+                'p99': round(percentile(latencies, 99), 3),
+                'max': round(max(latencies), 3),
+            },
+            'db_queries_per_request': {
+                'mean': round(statistics.mean(query_counts), 2),
+                'max': max(query_counts),
+            },
+        }
+
+    def seed(self, user_ids, options):
+        self.stderr.write(f'Seeding data for {len(user_ids)} users...')
+        rng = random.Random(42)
+        now = timezone.now()
+        BinaryOptionTrade.objects.filter(user_id__in=user_ids).delete()
+        Trade.objects.filter(user_id__in=user_ids).delete()
+        Portfolio.objects.filter(user_id__in=user_ids).delete()
+
+        for user_id in user_ids:
+            BinaryOptionTrade.objects.bulk_create([
+                BinaryOptionTrade(
+                    user_id=user_id,
+                    symbol=rng.choice(SYMBOLS),
+                    direction=rng.choice(['UP', 'DOWN']),
+                    amount=Decimal(rng.randint(1, 500)),
+                    entry_price=Decimal('100'),
+                    expiry_time=now - timedelta(seconds=rng.randint(60, 90 * 86400)),
+                    expiry_seconds=rng.choice([60, 300, 900, 3600]),
+                    status=rng.choice(['WON', 'LOST']),
+                )
+                for _ in range(options['binary_options_per_user'])
+            ], batch_size=5_000)
+
+            Trade.objects.bulk_create([
+                Trade(
+                    user_id=user_id,
+                    symbol=rng.choice(SYMBOLS),
+                    trade_type=rng.choice(['BUY', 'SELL']),
+                    quantity=Decimal('0.5'),
+                    price=Decimal('100'),
+                    total_amount=Decimal('50'),
+                    exchange='PUBLIC_API',
+                )
+                for _ in range(options['trades_per_user'])
+            ], batch_size=5_000)
+
+            Portfolio.objects.bulk_create([
+                Portfolio(user_id=user_id, symbol=symbol, quantity=Decimal('1.5'), average_buy_price=Decimal('100'))
+                for symbol in SYMBOLS[:options['holdings_per_user']]
+            ])
+
+    def seed_expired(self, user_ids, count, rng):
+        """Give each user ``count`` ACTIVE binary options that have just expired"""
+        expiry_time = timezone.now() - timedelta(seconds=1)
+        BinaryOptionTrade.objects.bulk_create([
+            BinaryOptionTrade(
+                user_id=user_id,
+                symbol=rng.choice(SYMBOLS),
+                direction=rng.choice(['UP', 'DOWN']),
+                amount=Decimal(rng.randint(1, 500)),
+                entry_price=Decimal('100'),
+                expiry_time=expiry_time,
+                expiry_seconds=rng.choice([60, 300, 900, 3600]),
+                status='ACTIVE',
+            )
+            for user_id in user_ids
+            for _ in range(count)
+        ], batch_size=5_000)
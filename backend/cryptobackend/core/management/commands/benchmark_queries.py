@@ -0,0 +1,121 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from core.benchmarking import SYMBOLS, benchmark_users, seed_users
+from core.models import BinaryOptionTrade, Trade
+
+
+class Command(BaseCommand):
+    help = (
+        'Show query plans and latency for the trade and binary option access patterns. '
+        'With --seed, first fill the database with synthetic rows (never run --seed against production).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true', help='Insert synthetic users and trades first')
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Binary option rows to seed')
+        parser.add_argument('--users', type=int, default=1_000, help='Users to spread the seeded rows over')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per query')
+        parser.add_argument('--batch-size', type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options['rows'], options['users'], options['batch_size'])
+
+        user = benchmark_users().order_by('id').first()
+        if user is None:
+            raise CommandError('No benchmark users found; run with --seed first')
+
+        now = timezone.now()
+        queries = {
+            'binary_options.active': BinaryOptionTrade.objects.filter(
+                user=user, status='ACTIVE', expiry_time__gt=now,
+            ).order_by('-created_at'),
+            'binary_options.expired': BinaryOptionTrade.objects.filter(
+                user=user, status='ACTIVE', expiry_time__lte=now,
+            ),
+            'binary_options.list': BinaryOptionTrade.objects.filter(user=user).order_by('-created_at')[:100],
+            'binary_options.history': BinaryOptionTrade.objects.filter(
+                user=user, status__in=['WON', 'LOST', 'EXPIRED'], created_at__gte=now - timedelta(days=7),
+            ).order_by('-created_at'),
+            'settlement.scan': BinaryOptionTrade.objects.filter(
+                status='ACTIVE', expiry_time__lte=now + timedelta(seconds=30),
+            ).values_list('id', 'expiry_time'),
+            'trades.list': Trade.objects.filter(user=user).order_by('-timestamp')[:100],
+        }
+
+        self.stdout.write(f'Database: {connection.vendor}, '
+                          f'{BinaryOptionTrade.objects.count()} binary options, {Trade.objects.count()} trades')
+        for name, queryset in queries.items():
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - start) * 1000)
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n{name}'))
+            self.stdout.write(f'  median {statistics.median(timings):.3f} ms, '
+                              f'max {max(timings):.3f} ms over {len(timings)} runs')
+            for line in queryset.explain().splitlines():
+                self.stdout.write(f'  {line}')
+
+    def seed(self, rows, user_count, batch_size):
+        self.stdout.write(f'Seeding {user_count} users and {rows} binary option rows...')
+        user_ids = seed_users(user_count, batch_size)
+
+        now = timezone.now()
+        rng = random.Random(42)
+        # created_at is auto_now_add; switch that off so seeded rows span a
+        # realistic history instead of all sharing the insert time
+        created_at_field = BinaryOptionTrade._meta.get_field('created_at')
+        created_at_field.auto_now_add = False
+        try:
+            self._seed_rows(rows, user_ids, batch_size, now, rng)
+        finally:
+            created_at_field.auto_now_add = True
+        self.stdout.write('Done seeding.')
+
+    def _seed_rows(self, rows, user_ids, batch_size, now, rng):
+        expiries = [60, 300, 900, 3600]
+        created = 0
+        while created < rows:
+            batch = []
+            for _ in range(min(batch_size, rows - created)):
+                expiry_seconds = rng.choice(expiries)
+                opened = now - timedelta(seconds=rng.randint(0, 90 * 24 * 3600))
+                # ~1% still active, the rest settled
+                is_active = rng.random() < 0.01
+                batch.append(BinaryOptionTrade(
+                    user_id=rng.choice(user_ids),
+                    symbol=rng.choice(SYMBOLS),
+                    direction=rng.choice(['UP', 'DOWN']),
+                    amount=Decimal(rng.randint(1, 1000)),
+                    entry_price=Decimal('100'),
+                    expiry_time=now + timedelta(seconds=rng.randint(-60, expiry_seconds)) if is_active
+                    else opened + timedelta(seconds=expiry_seconds),
+                    expiry_seconds=expiry_seconds,
+                    status='ACTIVE' if is_active else rng.choice(['WON', 'LOST']),
+                    created_at=now if is_active else opened,
+                ))
+            BinaryOptionTrade.objects.bulk_create(batch)
+            created += len(batch)
+
+            Trade.objects.bulk_create([
+                Trade(
+                    user_id=rng.choice(user_ids),
+                    symbol=rng.choice(SYMBOLS),
+                    trade_type=rng.choice(['BUY', 'SELL']),
+                    quantity=Decimal('1'),
+                    price=Decimal('100'),
+                    total_amount=Decimal('100'),
+                    exchange='PUBLIC_API',
+                )
+                for _ in range(len(batch) // 10)
+            ])
+            self.stdout.write(f'  {created}/{rows}')
@@ -0,0 +1,128 @@
+import json
+import random
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from core.benchmarking import SYMBOLS, seed_users
+from core.fast_serializers import get_values_serializer
+from core.models import BinaryOptionTrade, Trade
+from core.renderers import FastJSONRenderer
+from core.serializers import BinaryOptionTradeSerializer, TradeSerializer
+
+LISTS = {
+    'binary-options': (BinaryOptionTrade, BinaryOptionTradeSerializer, '-created_at'),
+    'trades': (Trade, TradeSerializer, '-timestamp'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare list serialization through the model serializers and JSONRenderer with the '
+        '.values() read path and FastJSONRenderer, check that both produce the same bytes and '
+        'report timings as JSON. Seeds a benchmark user\'s trades; never run against production.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000, help='Rows per list')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per path')
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse previously seeded data')
+
+    def handle(self, *args, **options):
+        user_id = seed_users(1)[0]
+        if not options['skip_seed']:
+            self.seed(user_id, options['rows'])
+
+        report = {'config': {'rows': options['rows'], 'repeat': options['repeat']}, 'database': connection.vendor, 'lists': {}}
+        for name, (model, serializer_class, ordering) in LISTS.items():
+            queryset = model.objects.filter(user_id=user_id).order_by(ordering)[:options['rows']]
+            values_serializer = get_values_serializer(serializer_class)
+            if values_serializer is None:
+                raise CommandError(f'{serializer_class.__name__} is not supported by the .values() read path')
+
+            def serializer_path():
+                return list(queryset.all()), lambda rows: JSONRenderer().render(serializer_class(rows, many=True).data)
+
+            def values_path():
+                return list(values_serializer.values(queryset)), lambda rows: FastJSONRenderer().render(values_serializer.serialize(rows))
+
+            if self.render(serializer_path) != self.render(values_path):
+                raise CommandError(f'{name}: the two paths rendered different bytes')
+            self.stderr.write(f'Benchmarking {name}...')
+            baseline = self.time(serializer_path, options['repeat'])
+            fast = self.time(values_path, options['repeat'])
+            report['lists'][name] = {
+                'rows': queryset.count(),
+                'serializer_ms': baseline,
+                'values_ms': fast,
+                'speedup': {
+                    stage: round(baseline[stage] / fast[stage], 2) for stage in ('total', 'serialize_render')
+                },
+            }
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def render(self, path):
+        rows, render = path()
+        return render(rows)
+
+    def time(self, path, repeat):
+        """Median milliseconds spent fetching rows and serializing plus rendering them"""
+        fetch, serialize = [], []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows, render = path()
+            fetched = time.perf_counter()
+            render(rows)
+            fetch.append((fetched - start) * 1000)
+            serialize.append((time.perf_counter() - fetched) * 1000)
+        totals = [a + b for a, b in zip(fetch, serialize)]
+        return {
+            'total': round(statistics.median(totals), 3),
+            'fetch': round(statistics.median(fetch), 3),
+            'serialize_render': round(statistics.median(serialize), 3),
+        }
+
+    def seed(self, user_id, rows):
+        self.stderr.write(f'Seeding {rows} binary options and trades...')
+        rng = random.Random(42)
+        now = timezone.now()
+        BinaryOptionTrade.objects.filter(user_id=user_id).delete()
+        Trade.objects.filter(user_id=user_id).delete()
+
+        options = []
+        for _ in range(rows):
+            settled = rng.random() < 0.8
+            won = rng.random() < 0.5
+            amount = Decimal(rng.randint(100, 50_000)) / 100
+            options.append(BinaryOptionTrade(
+                user_id=user_id,
+                symbol=rng.choice(SYMBOLS),
+                direction=rng.choice(['UP', 'DOWN']),
+                amount=amount,
+                entry_price=Decimal(rng.randint(1, 10 ** 10)) / 10 ** 4,
+                expiry_time=now - timedelta(seconds=rng.randint(60, 90 * 86400)),
+                expiry_seconds=rng.choice([60, 300, 900, 3600]),
+                exit_price=Decimal(rng.randint(1, 10 ** 10)) / 10 ** 4 if settled else None,
+                status=('WON' if won else 'LOST') if settled else 'ACTIVE',
+                payout_amount=amount * Decimal('1.85') if settled and won else None,
+            ))
+        BinaryOptionTrade.objects.bulk_create(options, batch_size=5_000)
+
+        Trade.objects.bulk_create([
+            Trade(
+                user_id=user_id,
+                symbol=rng.choice(SYMBOLS),
+                trade_type=rng.choice(['BUY', 'SELL']),
+                quantity=Decimal(rng.randint(1, 10 ** 8)) / 10 ** 8,
+                price=Decimal(rng.randint(1, 10 ** 10)) / 10 ** 4,
+                total_amount=Decimal(rng.randint(1, 10 ** 10)) / 10 ** 6,
+                exchange=rng.choice(['PUBLIC_API', 'binance', None]),
+            )
+            for _ in range(rows)
+        ], batch_size=5_000)
@@ -0,0 +1,40 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.candles import get_tick_store
+from core.events import publish_prices
+from core.market_data import market_data
+
+
+class Command(BaseCommand):
+    help = (
+        'Push live price ticks to WebSocket subscribers of each symbol and record them in the '
+        'candle store. Run exactly one instance: it is the only writer of CANDLE_STORE_DIR.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between ticks')
+        parser.add_argument('--symbols', default=None,
+                            help='Comma-separated symbols (defaults to settings.LIVE_PRICE_SYMBOLS)')
+        parser.add_argument('--no-record', action='store_true', help='Do not write ticks to the candle store')
+
+    def handle(self, *args, **options):
+        symbols = options['symbols'].split(',') if options['symbols'] else settings.LIVE_PRICE_SYMBOLS
+        interval = options['interval']
+        store = None if options['no_record'] else get_tick_store()
+        self.stdout.write(self.style.SUCCESS(f'Broadcasting {len(symbols)} symbols every {interval}s'))
+        try:
+            while True:
+                started = time.monotonic()
+                try:
+                    prices = market_data.get_prices(symbols)
+                    publish_prices(prices)
+                    if store is not None:
+                        store.append_prices(prices)
+                except Exception as e:
+                    self.stderr.write(f'Price broadcast failed: {e}')
+                time.sleep(max(0.0, interval - (time.monotonic() - started)))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,47 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from core.settlement import SettlementScheduler
+
+
+class Command(BaseCommand):
+    help = 'Run the binary option settlement worker, settling each trade at its expiry time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--refresh-interval', type=float, default=None,
+                            help='Seconds between scans for newly created trades')
+        parser.add_argument('--lookahead', type=float, default=None,
+                            help='Schedule trades expiring within this many seconds')
+        parser.add_argument('--stats-interval', type=float, default=60.0,
+                            help='Seconds between settlement lag reports (0 to disable)')
+
+    def handle(self, *args, **options):
+        scheduler = SettlementScheduler(
+            refresh_interval=options['refresh_interval'],
+            lookahead=options['lookahead'],
+        )
+
+        def shutdown(signum, frame):
+            scheduler.stop()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+
+        stop_reporting = threading.Event()
+        if options['stats_interval'] > 0:
+            def report():
+                while not stop_reporting.wait(options['stats_interval']):
+                    self.stdout.write(f'Settlement stats: {scheduler.stats.as_dict()}')
+            threading.Thread(target=report, daemon=True).start()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Settlement worker started (refresh every {scheduler.refresh_interval}s, '
+            f'lookahead {scheduler.lookahead}s)'
+        ))
+        try:
+            scheduler.run_forever()
+        finally:
+            stop_reporting.set()
+            self.stdout.write(f'Settlement worker stopped: {scheduler.stats.as_dict()}')
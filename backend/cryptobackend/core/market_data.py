@@ -0,0 +1,457 @@
+"""
+Shared market-data service.
+
+All views go through ``market_data`` instead of calling the Binance ticker
+endpoint directly. Prices are cached per symbol for ``MARKET_DATA_PRICE_TTL``
+seconds and concurrent misses for the same symbol are coalesced so only one
+upstream request per symbol is in flight at a time. Lookups for several
+symbols at once are answered from a single all-symbols ticker request.
+Prices of the symbols callers ask for are also recorded in
+``core.ticks.tick_history``; the rest of a bulk ticker is only cached.
+
+Binance is called through the ``core.upstream`` client (deadlines, retries,
+circuit breaker). When a fetch fails a cached price up to
+``MARKET_DATA_MAX_STALE`` seconds old is served instead; while the circuit is
+open that window widens to ``MARKET_DATA_OUTAGE_MAX_STALE``.
+
+Async views use ``aget_price``/``aget_prices``, which share the cache and
+fetch from Binance over the pooled aiohttp session without tying up a
+thread while the request is in flight.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .metrics import STALE_PRICES
+from .ticks import tick_history
+from .upstream import CircuitOpen, UpstreamClient
+
+BINANCE_TICKER_URL = 'https://api.binance.com/api/v3/ticker/price'
+QUOTE_CURRENCY = 'USDT'
+
+# Single-flight key used for the all-symbols ticker request
+ALL_SYMBOLS = '*'
+
+binance = UpstreamClient('binance')
+
+
+class PriceUnavailable(Exception):
+    """Raised when no fresh or acceptably stale price exists for a symbol"""
+
+
+def fetch_binance_price(symbol):
+    """Fetch the last traded price of ``symbol`` against USDT from Binance"""
+    ticker = binance.get_json(BINANCE_TICKER_URL, params={'symbol': f'{symbol}{QUOTE_CURRENCY}'})
+    return Decimal(ticker['price'])
+
+
+def fetch_binance_prices():
+    """Fetch every USDT-quoted price from Binance in one request, keyed by base symbol"""
+    return _usdt_prices(binance.get_json(BINANCE_TICKER_URL))
+
+
+async def afetch_binance_price(symbol):
+    """``fetch_binance_price`` over the shared aiohttp session"""
+    ticker = await binance.aget_json(BINANCE_TICKER_URL, params={'symbol': f'{symbol}{QUOTE_CURRENCY}'})
+    return Decimal(ticker['price'])
+
+
+async def afetch_binance_prices():
+    """``fetch_binance_prices`` over the shared aiohttp session"""
+    return _usdt_prices(await binance.aget_json(BINANCE_TICKER_URL))
+
+
+def _usdt_prices(tickers):
+    prices = {}
+    for ticker in tickers:
+        pair = ticker['symbol']
+        if pair.endswith(QUOTE_CURRENCY):
+            prices[pair[:-len(QUOTE_CURRENCY)]] = Decimal(ticker['price'])
+    return prices
+
+
+def default_fetchers():
+    """Return the (single, bulk) price fetchers: Binance, or the simulator when enabled"""
+    from . import simulator
+    if simulator.is_enabled():
+        market = simulator.get_simulator()
+        return market.fetch_price, market.fetch_prices
+    return fetch_binance_price, fetch_binance_prices
+
+
+_fetch_pool = None
+_fetch_pool_lock = threading.Lock()
+
+
+def _get_fetch_pool():
+    global _fetch_pool
+    with _fetch_pool_lock:
+        if _fetch_pool is None:
+            _fetch_pool = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'EXCHANGE_FETCH_WORKERS', 16),
+                thread_name_prefix='exchange-fetch',
+            )
+        return _fetch_pool
+
+
+def fetch_concurrently(fetch, keys, deadline=None):
+    """
+    Call ``fetch(key)`` for every key on a shared bounded thread pool and
+    return ``{key: result}`` for the calls that succeeded within ``deadline``
+    seconds. Failed or late calls are left out, so callers get partial results
+    instead of waiting on the slowest upstream.
+    """
+    deadline = deadline if deadline is not None else getattr(settings, 'EXCHANGE_FETCH_DEADLINE', 5.0)
+    futures = {_get_fetch_pool().submit(fetch, key): key for key in keys}
+    done, not_done = wait(futures, timeout=deadline)
+    for future in not_done:
+        future.cancel()
+    return {
+        futures[future]: future.result()
+        for future in done
+        if future.exception() is None
+    }
+
+
+def fetch_exchange_prices(exchange, symbols, deadline=None):
+    """
+    Return a symbol -> Decimal price map for ``symbols`` quoted in USDT on a
+    ccxt exchange, using one ``fetch_tickers`` call where the exchange has it
+    and concurrent ``fetch_ticker`` calls otherwise. Symbols the exchange does
+    not list, or whose ticker fails or misses the deadline, are left out.
+    """
+    markets = exchange.load_markets()
+    pairs = {f'{symbol}/{QUOTE_CURRENCY}': symbol for symbol in symbols}
+    pairs = {pair: symbol for pair, symbol in pairs.items() if pair in markets}
+    if not pairs:
+        return {}
+
+    if exchange.has.get('fetchTickers'):
+        tickers = exchange.fetch_tickers(list(pairs))
+    else:
+        tickers = fetch_concurrently(exchange.fetch_ticker, pairs, deadline)
+
+    prices = {}
+    for pair, ticker in tickers.items():
+        if pair in pairs and ticker.get('last') is not None:
+            prices[pairs[pair]] = Decimal(str(ticker['last']))
+    return prices
+
+
+class _InflightFetch:
+    """A fetch that other callers for the same key can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MarketDataService:
+    """Per-symbol TTL price cache with single-flight upstream fetches"""
+
+    def __init__(self, fetcher=None, bulk_fetcher=None, ttl=None, max_stale=None, wait_timeout=None,
+                 outage_max_stale=None):
+        if fetcher is None or bulk_fetcher is None:
+            default_fetcher, default_bulk_fetcher = default_fetchers()
+            fetcher = fetcher or default_fetcher
+            bulk_fetcher = bulk_fetcher or default_bulk_fetcher
+        self.fetcher = fetcher
+        self.bulk_fetcher = bulk_fetcher
+        self.ttl = ttl if ttl is not None else getattr(settings, 'MARKET_DATA_PRICE_TTL', 2.0)
+        self.max_stale = max_stale if max_stale is not None else getattr(settings, 'MARKET_DATA_MAX_STALE', 30.0)
+        self.wait_timeout = wait_timeout if wait_timeout is not None else getattr(settings, 'MARKET_DATA_WAIT_TIMEOUT', 10.0)
+        self.outage_max_stale = (
+            outage_max_stale if outage_max_stale is not None
+            else getattr(settings, 'MARKET_DATA_OUTAGE_MAX_STALE', 300.0)
+        )
+        self._lock = threading.Lock()
+        self._prices = {}  # symbol -> (price, fetched_at)
+        self._inflight = {}  # symbol or ALL_SYMBOLS -> _InflightFetch
+        self._async_inflight = {}  # (event loop, symbol or ALL_SYMBOLS) -> Future
+        self._bulk_fetched_at = None
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'stale_served': 0,
+            'errors': 0,
+            'bulk_fetches': 0,
+        }
+
+    def get_price(self, symbol):
+        """Return the current price of ``symbol`` as a Decimal"""
+        symbol = symbol.upper()
+        with self._lock:
+            cached = self._prices.get(symbol)
+            if cached is not None and time.monotonic() - cached[1] < self.ttl:
+                self._stats['hits'] += 1
+                return cached[0]
+
+        try:
+            return self._single_flight(symbol, lambda: self.fetcher(symbol), lambda price: self.set_price(symbol, price))
+        except Exception as e:
+            return self._stale_or_raise(symbol, e)
+
+    def get_prices(self, symbols):
+        """
+        Return a symbol -> Decimal map for ``symbols``. Cache misses are filled
+        from one bulk request; symbols with no usable price are left out.
+        """
+        symbols = [symbol.upper() for symbol in symbols]
+        prices = {}
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            # A symbol absent from a bulk response younger than the TTL is
+            # unknown upstream; refetching would not change that
+            bulk_is_fresh = self._bulk_fetched_at is not None and now - self._bulk_fetched_at < self.ttl
+            for symbol in symbols:
+                cached = self._prices.get(symbol)
+                if cached is not None and now - cached[1] < self.ttl:
+                    self._stats['hits'] += 1
+                    prices[symbol] = cached[0]
+                else:
+                    missing.append(symbol)
+        if not missing or bulk_is_fresh:
+            return prices
+
+        tick_history.track(missing)
+        try:
+            fetched = self._single_flight(ALL_SYMBOLS, self.bulk_fetcher, self._store_bulk)
+        except Exception as e:
+            fetched, error = {}, e
+        else:
+            error = None
+        for symbol in missing:
+            if symbol in fetched:
+                prices[symbol] = fetched[symbol]
+                continue
+            try:
+                prices[symbol] = self._stale_or_raise(symbol, error or PriceUnavailable(f'No {symbol} price in bulk ticker'))
+            except PriceUnavailable:
+                continue
+        return prices
+
+    def _single_flight(self, key, fetch, store):
+        """Run ``fetch`` unless a fetch for ``key`` is already in flight, then share its result"""
+        with self._lock:
+            inflight = self._inflight.get(key)
+            is_leader = inflight is None
+            if is_leader:
+                inflight = _InflightFetch()
+                self._inflight[key] = inflight
+                self._stats['misses'] += 1
+                if key == ALL_SYMBOLS:
+                    self._stats['bulk_fetches'] += 1
+            else:
+                self._stats['coalesced'] += 1
+
+        if is_leader:
+            try:
+                inflight.result = fetch()
+                store(inflight.result)
+            except Exception as e:
+                inflight.error = e
+                with self._lock:
+                    self._stats['errors'] += 1
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                inflight.done.set()
+        elif not inflight.done.wait(self.wait_timeout):
+            raise PriceUnavailable(f'Timed out waiting for {key} price')
+
+        if inflight.error is not None:
+            raise inflight.error
+        return inflight.result
+
+    async def aget_price(self, symbol):
+        """Async ``get_price``"""
+        symbol = symbol.upper()
+        with self._lock:
+            cached = self._prices.get(symbol)
+            if cached is not None and time.monotonic() - cached[1] < self.ttl:
+                self._stats['hits'] += 1
+                return cached[0]
+
+        fetcher, _ = self._async_fetchers()
+        try:
+            return await self._async_single_flight(symbol, lambda: fetcher(symbol), lambda price: self.set_price(symbol, price))
+        except Exception as e:
+            return self._stale_or_raise(symbol, e)
+
+    async def aget_prices(self, symbols):
+        """Async ``get_prices``"""
+        symbols = [symbol.upper() for symbol in symbols]
+        prices = {}
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            bulk_is_fresh = self._bulk_fetched_at is not None and now - self._bulk_fetched_at < self.ttl
+            for symbol in symbols:
+                cached = self._prices.get(symbol)
+                if cached is not None and now - cached[1] < self.ttl:
+                    self._stats['hits'] += 1
+                    prices[symbol] = cached[0]
+                else:
+                    missing.append(symbol)
+        if not missing or bulk_is_fresh:
+            return prices
+
+        tick_history.track(missing)
+        _, bulk_fetcher = self._async_fetchers()
+        try:
+            fetched = await self._async_single_flight(ALL_SYMBOLS, bulk_fetcher, self._store_bulk)
+        except Exception as e:
+            fetched, error = {}, e
+        else:
+            error = None
+        for symbol in missing:
+            if symbol in fetched:
+                prices[symbol] = fetched[symbol]
+                continue
+            try:
+                prices[symbol] = self._stale_or_raise(symbol, error or PriceUnavailable(f'No {symbol} price in bulk ticker'))
+            except PriceUnavailable:
+                continue
+        return prices
+
+    def _async_fetchers(self):
+        """aiohttp versions of the Binance fetchers; any other fetcher (e.g. the simulator) runs in a thread"""
+        if self.fetcher is fetch_binance_price:
+            fetcher = afetch_binance_price
+        else:
+            fetcher = sync_to_async(self.fetcher, thread_sensitive=False)
+        if self.bulk_fetcher is fetch_binance_prices:
+            bulk_fetcher = afetch_binance_prices
+        else:
+            bulk_fetcher = sync_to_async(self.bulk_fetcher, thread_sensitive=False)
+        return fetcher, bulk_fetcher
+
+    async def _async_single_flight(self, key, fetch, store):
+        """``_single_flight`` for coroutines: callers on the same event loop share one fetch"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            inflight = self._async_inflight.get((loop, key))
+            is_leader = inflight is None
+            if is_leader:
+                inflight = loop.create_future()
+                self._async_inflight[(loop, key)] = inflight
+                self._stats['misses'] += 1
+                if key == ALL_SYMBOLS:
+                    self._stats['bulk_fetches'] += 1
+            else:
+                self._stats['coalesced'] += 1
+
+        if not is_leader:
+            try:
+                # shield: a waiter timing out must not cancel the shared fetch
+                return await asyncio.wait_for(asyncio.shield(inflight), self.wait_timeout)
+            except asyncio.TimeoutError:
+                raise PriceUnavailable(f'Timed out waiting for {key} price')
+
+        try:
+            result = await fetch()
+            store(result)
+        except BaseException as e:
+            with self._lock:
+                self._stats['errors'] += 1
+            # Waiters get the error (or, if this request was cancelled, a
+            # PriceUnavailable) instead of hanging until their timeout
+            error = e if isinstance(e, Exception) else PriceUnavailable(f'{key} price fetch was cancelled')
+            inflight.set_exception(error)
+            inflight.exception()  # retrieved; waiters re-raise it themselves
+            raise
+        else:
+            inflight.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._async_inflight.pop((loop, key), None)
+
+    def _stale_or_raise(self, symbol, error):
+        # An open circuit means the upstream is known to be down: keep serving
+        # last-known prices for longer rather than failing every request
+        outage = isinstance(error, CircuitOpen)
+        max_stale = self.outage_max_stale if outage else self.max_stale
+        with self._lock:
+            cached = self._prices.get(symbol)
+            if cached is not None and time.monotonic() - cached[1] < max_stale:
+                self._stats['stale_served'] += 1
+                STALE_PRICES.labels('circuit_open' if outage else 'error').inc()
+                return cached[0]
+        raise PriceUnavailable(f'Failed to fetch {symbol} price: {error}') from error
+
+    def set_price(self, symbol, price):
+        """Store a price observed elsewhere (e.g. an exchange ticker)"""
+        with self._lock:
+            self._prices[symbol.upper()] = (price, time.monotonic())
+        tick_history.record(symbol, price)
+
+    def set_prices(self, prices):
+        """Store a symbol -> price map in one go; only tracked symbols are recorded as ticks"""
+        now = time.monotonic()
+        with self._lock:
+            for symbol, price in prices.items():
+                self._prices[symbol.upper()] = (price, now)
+        tick_history.record_many(prices)
+
+    def _store_bulk(self, prices):
+        self.set_prices(prices)
+        with self._lock:
+            self._bulk_fetched_at = time.monotonic()
+
+    def invalidate(self, symbol=None):
+        """Drop one cached symbol, or the whole cache when ``symbol`` is None"""
+        with self._lock:
+            if symbol is None:
+                self._prices.clear()
+                self._bulk_fetched_at = None
+            else:
+                self._prices.pop(symbol.upper(), None)
+
+    def stats(self):
+        """Return cache counters and the age in seconds of every cached price"""
+        now = time.monotonic()
+        with self._lock:
+            stats = dict(self._stats)
+            ages = {symbol: round(now - fetched_at, 3) for symbol, (_, fetched_at) in self._prices.items()}
+            stats['inflight'] = len(self._inflight)
+        lookups = stats['hits'] + stats['misses'] + stats['coalesced']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+        stats['ttl'] = self.ttl
+        stats['max_stale'] = self.max_stale
+        stats['outage_max_stale'] = self.outage_max_stale
+        stats['circuit'] = binance.breaker.state
+        stats['cached_symbols'] = len(ages)
+        stats['stale_symbols'] = sorted(symbol for symbol, age in ages.items() if age >= self.ttl)
+        return stats
+
+
+market_data = MarketDataService()
+
+
+def get_price(symbol):
+    """Shortcut for ``market_data.get_price``"""
+    return market_data.get_price(symbol)
+
+
+def get_prices(symbols):
+    """Shortcut for ``market_data.get_prices``"""
+    return market_data.get_prices(symbols)
+
+
+async def aget_price(symbol):
+    """Shortcut for ``market_data.aget_price``"""
+    return await market_data.aget_price(symbol)
+
+
+async def aget_prices(symbols):
+    """Shortcut for ``market_data.aget_prices``"""
+    return await market_data.aget_prices(symbols)
@@ -0,0 +1,114 @@
+"""
+Prometheus metrics for request latency, database work, upstream calls and
+settlement lag, exported at ``/metrics`` by ``metrics_view``.
+
+Set ``PROMETHEUS_MULTIPROC_DIR`` when running several worker processes so
+the endpoint aggregates all of them.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+import requests
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils import timezone
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_LATENCY = Histogram(
+    'cryptrade_request_duration_seconds', 'Request latency by view',
+    ['view', 'method', 'status'], buckets=LATENCY_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    'cryptrade_request_db_queries', 'Database queries per request by view',
+    ['view'], buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 500),
+)
+DB_TIME = Histogram(
+    'cryptrade_request_db_seconds', 'Database time per request by view',
+    ['view'], buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_LATENCY = Histogram(
+    'cryptrade_upstream_duration_seconds', 'Outbound HTTP/ccxt call latency',
+    ['target', 'outcome'], buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_RETRIES = Counter(
+    'cryptrade_upstream_retries_total', 'Outbound calls retried after a failed attempt',
+    ['target', 'reason'],
+)
+UPSTREAM_REJECTED = Counter(
+    'cryptrade_upstream_rejected_total', 'Outbound calls failed fast by an open circuit breaker',
+    ['target'],
+)
+CIRCUIT_STATE = Gauge(
+    'cryptrade_upstream_circuit_state', 'Circuit breaker state (0 closed, 1 half-open, 2 open)',
+    ['target'], multiprocess_mode='max',
+)
+CIRCUIT_TRANSITIONS = Counter(
+    'cryptrade_upstream_circuit_transitions_total', 'Circuit breaker state changes',
+    ['target', 'state'],
+)
+STALE_PRICES = Counter(
+    'cryptrade_stale_prices_served_total', 'Cached prices served past their TTL because the upstream failed',
+    ['reason'],
+)
+SETTLEMENT_LAG = Histogram(
+    'cryptrade_settlement_lag_seconds', 'Time between a trade expiring and being settled',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0),
+)
+SETTLED_TRADES = Counter('cryptrade_settled_trades_total', 'Binary option trades settled', ['status'])
+
+# asyncio/aiohttp timeouts subclass TimeoutError
+TIMEOUT_ERRORS = (TimeoutError, requests.Timeout)
+
+
+@contextmanager
+def observe_upstream(target):
+    """Time an outbound call to ``target`` and record whether it succeeded, failed or timed out"""
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    except TIMEOUT_ERRORS:
+        outcome = 'timeout'
+        raise
+    finally:
+        UPSTREAM_LATENCY.labels(target, outcome).observe(time.perf_counter() - start)
+
+
+def instrument_exchange(exchange):
+    """Record every HTTP call a ccxt client makes, labelled with its exchange id"""
+    fetch = exchange.fetch
+
+    def instrumented_fetch(*args, **kwargs):
+        with observe_upstream(exchange.id):
+            return fetch(*args, **kwargs)
+
+    exchange.fetch = instrumented_fetch
+    return exchange
+
+
+def record_settlements(trades):
+    """Record outcome counts and settlement lag for trades that were just settled"""
+    now = timezone.now()
+    for trade in trades:
+        SETTLED_TRADES.labels(trade.status).inc()
+        lag = (now - trade.expiry_time).total_seconds()
+        # Trades closed before expiry (close_early, force) have no lag
+        if lag >= 0:
+            SETTLEMENT_LAG.observe(lag)
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; requires ``Bearer <METRICS_TOKEN>`` when that setting is set"""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponseForbidden()
+
+    registry = REGISTRY
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,185 @@
+import contextvars
+import cProfile
+import hmac
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from .metrics import DB_QUERIES, DB_TIME, REQUEST_LATENCY
+
+logger = logging.getLogger(__name__)
+
+
+class QueryRecorder:
+    """Counts and times the queries of one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+# The current request's recorder. A context variable rather than a per-thread
+# execute_wrapper, so queries an async view runs through sync_to_async in
+# another thread are still counted against the request.
+_query_recorder = contextvars.ContextVar('query_recorder', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """``execute_wrapper`` hook installed on every connection"""
+    recorder = _query_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.count += 1
+        recorder.duration += time.perf_counter() - start
+
+
+def install_query_recorder(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class MetricsMiddleware:
+    """Record per-view latency and database query count/time for every request"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        # Connections opened from now on get the hook when they connect
+        connection_created.connect(install_query_recorder)
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        queries = QueryRecorder()
+        token = _query_recorder.set(queries)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _query_recorder.reset(token)
+        self.observe(request, response, time.perf_counter() - start, queries)
+        return response
+
+    async def __acall__(self, request):
+        queries = QueryRecorder()
+        token = _query_recorder.set(queries)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _query_recorder.reset(token)
+        self.observe(request, response, time.perf_counter() - start, queries)
+        return response
+
+    def observe(self, request, response, elapsed, queries):
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unresolved'
+        REQUEST_LATENCY.labels(view, request.method, response.status_code).observe(elapsed)
+        DB_QUERIES.labels(view).observe(queries.count)
+        DB_TIME.labels(view).observe(queries.duration)
+
+
+class ProfilingMiddleware:
+    """
+    Run selected requests under cProfile and dump the stats to ``PROFILING_DIR``.
+
+    A request is profiled when it carries ``X-Profile: <PROFILING_TOKEN>`` or
+    is picked by ``PROFILING_SAMPLE_RATE``. With neither configured the
+    middleware removes itself at startup, so it costs nothing. Files are named
+    ``<view>-<unix time>-<duration>ms.prof`` and open with ``pstats``,
+    snakeviz, or ``flameprof --format=log`` for flamegraph collapsed stacks.
+    """
+
+    header = 'X-Profile'
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.token = getattr(settings, 'PROFILING_TOKEN', None)
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+        if not self.token and self.sample_rate <= 0:
+            raise MiddlewareNotUsed()
+        self.directory = settings.PROFILING_DIR
+        os.makedirs(self.directory, exist_ok=True)
+        # cProfile cannot profile overlapping requests, so one at a time
+        self._lock = threading.Lock()
+
+    def should_profile(self, request):
+        supplied = request.headers.get(self.header)
+        if supplied and self.token and hmac.compare_digest(supplied, self.token):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.should_profile(request) or not self._lock.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            profiler = cProfile.Profile()
+            start = time.perf_counter()
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+        finally:
+            self._lock.release()
+        self.dump(request, profiler, elapsed_ms)
+        return response
+
+    async def __acall__(self, request):
+        if not self.should_profile(request) or not self._lock.acquire(blocking=False):
+            return await self.get_response(request)
+        # Profiles the event loop thread, so other requests it serves
+        # meanwhile show up too; work done in sync_to_async threads does not
+        try:
+            profiler = cProfile.Profile()
+            start = time.perf_counter()
+            profiler.enable()
+            try:
+                response = await self.get_response(request)
+            finally:
+                profiler.disable()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+        finally:
+            self._lock.release()
+        self.dump(request, profiler, elapsed_ms)
+        return response
+
+    def dump(self, request, profiler, elapsed_ms):
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unresolved'
+        name = re.sub(r'[^\w.-]', '_', view)
+        path = os.path.join(self.directory, f'{name}-{time.time():.3f}-{elapsed_ms:.0f}ms.prof')
+        try:
+            profiler.dump_stats(path)
+        except OSError:
+            logger.exception('Could not write profile %s', path)
+        else:
+            logger.info('Profiled %s %s in %.1f ms: %s', request.method, request.path, elapsed_ms, path)
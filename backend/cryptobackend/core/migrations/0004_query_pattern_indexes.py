@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_binaryoptiontrade'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='binaryoptiontrade',
+            index=models.Index(fields=['user', 'status', 'expiry_time'], name='core_bo_user_status_exp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='binaryoptiontrade',
+            index=models.Index(fields=['user', 'created_at'], name='core_bo_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='binaryoptiontrade',
+            index=models.Index(fields=['status', 'expiry_time'], name='core_bo_status_exp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(fields=['user', 'timestamp'], name='core_trade_user_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_query_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='binaryoptiontrade',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='binaryoptiontrade',
+            index=models.Index(fields=['user', 'updated_at'], name='core_bo_user_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_binaryoptiontrade_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='binaryoptiontrade',
+            name='batch_id',
+            field=models.UUIDField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='trade',
+            name='batch_id',
+            field=models.UUIDField(blank=True, db_index=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:42
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_bulk_insert_batch_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BinaryOptionStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(max_length=20)),
+                ('key', models.CharField(blank=True, max_length=20)),
+                ('won', models.PositiveIntegerField(default=0)),
+                ('lost', models.PositiveIntegerField(default=0)),
+                ('staked', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=24)),
+                ('payout', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=24)),
+                ('longest_win', models.PositiveIntegerField(default=0)),
+                ('longest_loss', models.PositiveIntegerField(default=0)),
+                ('current_streak', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='binary_option_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'dimension', 'key')},
+            },
+        ),
+    ]
@@ -1,3 +1,4 @@
+from decimal import Decimal
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils.translation import gettext_lazy as _
@@ -66,6 +67,14 @@ class Trade(models.Model):
     total_amount = models.DecimalField(max_digits=20, decimal_places=8)
     timestamp = models.DateTimeField(auto_now_add=True)
     exchange = models.CharField(max_length=20, null=True, blank=True)
+    # Tags the rows of one bulk insert, to read back their ids on MySQL
+    batch_id = models.UUIDField(null=True, blank=True, editable=False, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Per-user trade listing ordered by time
+            models.Index(fields=['user', 'timestamp'], name='core_trade_user_ts_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.email} - {self.trade_type} {self.quantity} {self.symbol} @ {self.price}"
@@ -96,6 +105,42 @@ class BinaryOptionTrade(models.Model):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='ACTIVE')
     payout_amount = models.DecimalField(max_digits=20, decimal_places=2, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bulk and conditional updates bypass auto_now; they must set it themselves
+    updated_at = models.DateTimeField(auto_now=True)
+    # Tags the rows of one bulk insert, to read back their ids on MySQL
+    batch_id = models.UUIDField(null=True, blank=True, editable=False, db_index=True)
+    
+    class Meta:
+        indexes = [
+            # active / update_expired_trades: user + status + expiry_time range
+            models.Index(fields=['user', 'status', 'expiry_time'], name='core_bo_user_status_exp_idx'),
+            # list / history: user ordered by created_at
+            models.Index(fields=['user', 'created_at'], name='core_bo_user_created_idx'),
+            # Settlement worker: ACTIVE trades across all users by expiry_time
+            models.Index(fields=['status', 'expiry_time'], name='core_bo_status_exp_idx'),
+            # Delta sync: a user's trades changed since a watermark
+            models.Index(fields=['user', 'updated_at'], name='core_bo_user_updated_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.email} - {self.symbol} {self.direction} ${self.amount} @ {self.entry_price}"
+
+class BinaryOptionStats(models.Model):
+    """Running totals and streaks of a user's settled binary options, overall or for one symbol, direction or expiry"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='binary_option_stats')
+    dimension = models.CharField(max_length=20)  # 'overall', 'by_symbol', 'by_direction' or 'by_expiry'
+    key = models.CharField(max_length=20, blank=True)
+    won = models.PositiveIntegerField(default=0)
+    lost = models.PositiveIntegerField(default=0)
+    staked = models.DecimalField(max_digits=24, decimal_places=2, default=Decimal('0'))
+    payout = models.DecimalField(max_digits=24, decimal_places=2, default=Decimal('0'))
+    longest_win = models.PositiveIntegerField(default=0)
+    longest_loss = models.PositiveIntegerField(default=0)
+    # Current run in settlement order: positive for wins, negative for losses
+    current_streak = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'dimension', 'key')
+
+    def __str__(self):
+        return f"{self.user.email} - {self.dimension} {self.key}: {self.won}W/{self.lost}L"
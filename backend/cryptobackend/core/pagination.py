@@ -0,0 +1,134 @@
+"""
+Keyset (cursor) pagination on ``(<timestamp field>, id)``.
+
+Each page is fetched with ``WHERE (ts, id) < (last_ts, last_id)`` on an
+indexed ordering, so the cost of a page does not depend on how deep into a
+user's history it is. Pagination is opt-in: list endpoints keep returning a
+plain array unless the client sends ``page_size`` or ``cursor``.
+"""
+import base64
+from urllib import parse
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ParseError
+from rest_framework.pagination import BasePagination, replace_query_param
+from rest_framework.response import Response
+
+
+def encode_position(timestamp, pk):
+    """Opaque cursor for a ``(timestamp, id)`` position"""
+    querystring = parse.urlencode({'t': timestamp.isoformat(), 'i': pk})
+    return base64.urlsafe_b64encode(querystring.encode('ascii')).decode('ascii')
+
+
+def decode_position(encoded):
+    """Inverse of ``encode_position``; raises ValueError for a malformed cursor"""
+    try:
+        querystring = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+        tokens = parse.parse_qs(querystring, keep_blank_values=True)
+        timestamp = parse_datetime(tokens['t'][0])
+        pk = int(tokens['i'][0])
+    except (TypeError, ValueError, KeyError, UnicodeError) as e:
+        raise ValueError('Invalid cursor') from e
+    if timestamp is None:
+        raise ValueError('Invalid cursor')
+    return timestamp, pk
+
+
+class KeysetPagination(BasePagination):
+    """Newest-first keyset pagination; subclasses set ``timestamp_field``"""
+
+    timestamp_field = None
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        self.page_size = getattr(settings, 'CURSOR_PAGINATION_PAGE_SIZE', 100)
+        self.max_page_size = getattr(settings, 'CURSOR_PAGINATION_MAX_PAGE_SIZE', 1000)
+        self.next_position = None
+        self.request = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(f'-{self.timestamp_field}', '-id')
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            timestamp, pk = position
+            queryset = queryset.filter(
+                Q(**{f'{self.timestamp_field}__lt': timestamp}) |
+                Q(**{self.timestamp_field: timestamp, 'id__lt': pk})
+            )
+
+        # Fetch one extra row to learn whether another page exists
+        rows = list(queryset[:page_size + 1])
+        page = rows[:page_size]
+        if len(rows) > page_size:
+            last = page[-1]
+            if isinstance(last, dict):
+                # A .values() queryset; it must include the timestamp field and id
+                self.next_position = (last[self.timestamp_field], last['id'])
+            else:
+                self.next_position = (getattr(last, self.timestamp_field), last.pk)
+        else:
+            self.next_position = None
+        return page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            return decode_position(encoded)
+        except ValueError:
+            # 400, as for the delta-sync cursor
+            raise ParseError(self.invalid_cursor_message)
+
+    def encode_cursor(self, position):
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encode_position(*position))
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class BinaryOptionCursorPagination(KeysetPagination):
+    timestamp_field = 'created_at'
+
+
+class TradeCursorPagination(KeysetPagination):
+    timestamp_field = 'timestamp'
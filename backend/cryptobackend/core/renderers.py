@@ -0,0 +1,80 @@
+"""
+``JSONRenderer`` backed by orjson, producing the same bytes as DRF's.
+
+Types orjson does not encode natively (Decimal, datetimes, lazy strings, ...)
+go through DRF's ``JSONEncoder.default``. Anything orjson would write
+differently from ``json.dumps`` is rendered by the stock renderer instead:
+non-compact or ASCII-only settings, indented output, unencodable data, and
+floats below 1e-4 or with a one-digit negative exponent, which orjson writes
+as ``0.00001`` and ``1e-7`` where ``json`` writes ``1e-05`` and ``1e-07``.
+orjson writes NaN and infinity as null; output with a null is checked for
+them and handed to the stock renderer, which refuses them with ValueError.
+"""
+import math
+import re
+from decimal import Decimal
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+# A float with a one-digit negative exponent; may also match inside a
+# string, which only costs a fallback
+SHORT_EXPONENT = re.compile(rb'\de-\d(?:[,\]}]|$)')
+
+
+def has_divergent_float(ret):
+    """Whether orjson output ``ret`` contains a float ``json.dumps`` writes differently"""
+    if b'e-' in ret and SHORT_EXPONENT.search(ret):
+        return True
+    # Floats below 1e-4 written positionally; a match preceded by a quote or
+    # digit is part of a string or a larger number
+    start = ret.find(b'0.0000')
+    while start != -1:
+        before = start - 1 if start and ret[start - 1:start] == b'-' else start
+        if before == 0 or ret[before - 1:before] in (b':', b',', b'['):
+            return True
+        start = ret.find(b'0.0000', start + 1)
+    return False
+
+
+def has_non_finite_number(data):
+    """Whether ``data`` contains NaN or infinity, which orjson writes as null"""
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+        elif isinstance(value, (float, Decimal)) and not math.isfinite(value):
+            return True
+    return False
+
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+
+class FastJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or orjson is None or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=ORJSON_OPTIONS)
+        except TypeError:
+            # orjson.JSONEncodeError: e.g. non-str keys or integers over 64 bits
+            return super().render(data, accepted_media_type, renderer_context)
+        if has_divergent_float(ret) or (b'null' in ret and has_non_finite_number(data)):
+            return super().render(data, accepted_media_type, renderer_context)
+        # As JSONRenderer, keep the output a strict JavaScript subset
+        if b'\xe2\x80' in ret:
+            ret = ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+        return ret
@@ -0,0 +1,122 @@
+"""
+Per-user versioned response cache for the polled read endpoints.
+
+Every user has a version number that is bumped after any committed change to
+their trades, binary options or portfolio. Responses of views decorated with
+``versioned_response`` are cached under ``(user, version, full path)`` for up
+to ``RESPONSE_CACHE_TTL`` seconds and carry an ETag; a poll whose
+``If-None-Match`` still matches is answered with 304 without touching the
+database or the serializers.
+
+Versions live in the ``versions`` cache, which must be shared by every
+process that writes trades (web workers, ``run_settlement``); responses live
+in the ``default`` cache.
+"""
+import functools
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+VERSION_CACHE = 'versions'
+
+
+def get_version(key):
+    """Current value of a version counter in the ``versions`` cache"""
+    versions = caches[VERSION_CACHE]
+    version = versions.get(key)
+    if version is None:
+        # Start from the clock rather than 0, so a counter that was evicted
+        # never repeats a version that older cached data was stored under
+        versions.add(key, time.time_ns(), timeout=None)
+        version = versions.get(key)
+    return version
+
+
+def bump_version(key):
+    # A fresh value rather than incr(), which the file-based cache implements
+    # as get-then-set: two processes bumping at once could lose one bump
+    caches[VERSION_CACHE].set(key, time.time_ns(), timeout=None)
+
+
+def _version_key(user_id):
+    return f'user-version:{user_id}'
+
+
+def get_user_version(user_id):
+    return get_version(_version_key(user_id))
+
+
+def bump_user_versions(user_ids):
+    """Invalidate every cached response of ``user_ids``"""
+    for user_id in set(user_ids):
+        bump_version(_version_key(user_id))
+
+
+def bump_on_commit(user_ids):
+    """
+    Bump versions once the current transaction commits (immediately outside
+    one), so a concurrent request cannot cache pre-commit data under the new version
+    """
+    user_ids = set(user_ids)
+    transaction.on_commit(lambda: bump_user_versions(user_ids))
+
+
+def _etag(payload):
+    return f'"{hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()}"'
+
+
+def versioned_response(view_method=None, expires=None):
+    """
+    Cache a DRF view method's (or ``api_view`` function's) 200 responses per
+    user version and answer matching ``If-None-Match`` requests with 304. ``expires(data)`` may return
+    a datetime after which the response is stale even without a change, e.g.
+    because a listed trade expires.
+    """
+    if view_method is None:
+        return functools.partial(versioned_response, expires=expires)
+
+    @functools.wraps(view_method)
+    def wrapper(*args, **kwargs):
+        # (self, request, ...) for view methods, (request, ...) for function views
+        request = args[0] if isinstance(args[0], Request) else args[1]
+        user_id = request.user.pk
+        path = hashlib.blake2b(request.get_full_path().encode(), digest_size=16).hexdigest()
+        key = f'response:{user_id}:{get_user_version(user_id)}:{path}'
+        cache = caches['default']
+
+        cached = cache.get(key)
+        if cached is None:
+            response = view_method(*args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            # Cache plain JSON text: serializer output holds references to
+            # the serializer and queryset, and the text doubles as ETag input
+            payload = json.dumps(response.data, default=str, separators=(',', ':'))
+            etag = _etag(payload)
+            timeout = settings.RESPONSE_CACHE_TTL
+            stale_at = expires(response.data) if expires is not None else None
+            if stale_at is not None:
+                timeout = min(timeout, (stale_at - timezone.now()).total_seconds())
+            if timeout > 0:
+                cache.set(key, (etag, payload), timeout)
+        else:
+            etag, payload = cached
+            response = Response(json.loads(payload))
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        response['ETag'] = etag
+        # Clients may keep the body but must revalidate on every poll
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    return wrapper
@@ -1,7 +1,10 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.db import connections, router
+from django.utils import timezone
 from .models import Portfolio, Trade, ApiKey, BinaryOptionTrade
-from datetime import datetime, timedelta
+from datetime import timedelta
+import uuid
 
 User = get_user_model()
 
@@ -29,6 +32,32 @@ class ApiKeySerializer(serializers.ModelSerializer):
         fields = ('id', 'exchange', 'api_key', 'api_secret', 'is_active', 'created_at', 'updated_at')
         read_only_fields = ('created_at', 'updated_at')
 
+class BulkCreateListSerializer(serializers.ListSerializer):
+    """
+    Create every item of a ``many=True`` save with one ``bulk_create``. Item
+    serializers with a ``prepare(validated_data)`` method use it for what
+    their ``create`` would add. On databases that return no primary keys from
+    a bulk insert (MySQL) the rows are tagged with a ``batch_id`` and their
+    ids read back in one query. No ``post_save`` signals are sent: callers
+    wrap the save in a transaction and invalidate caches once per batch.
+    """
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        prepare = getattr(self.child, 'prepare', lambda attrs: attrs)
+        instances = [model(**prepare(attrs)) for attrs in validated_data]
+        if connections[router.db_for_write(model)].features.can_return_rows_from_bulk_insert:
+            return model.objects.bulk_create(instances)
+        batch_id = uuid.uuid4()
+        for instance in instances:
+            instance.batch_id = batch_id
+        model.objects.bulk_create(instances)
+        # Auto-increment ids follow insertion order within the batch
+        pks = model.objects.filter(batch_id=batch_id).order_by('pk').values_list('pk', flat=True)
+        for instance, pk in zip(instances, pks):
+            instance.pk = pk
+        return instances
+
 class PortfolioSerializer(serializers.ModelSerializer):
     class Meta:
         model = Portfolio
@@ -40,6 +69,7 @@ class TradeSerializer(serializers.ModelSerializer):
         model = Trade
         fields = ('id', 'symbol', 'trade_type', 'quantity', 'price', 'total_amount', 'timestamp', 'exchange')
         read_only_fields = ('timestamp',)
+        list_serializer_class = BulkCreateListSerializer
 
     def validate(self, data):
         if data['quantity'] <= 0:
@@ -57,6 +87,7 @@ class BinaryOptionTradeSerializer(serializers.ModelSerializer):
             'status', 'payout_amount', 'created_at'
         )
         read_only_fields = ('exit_price', 'status', 'payout_amount', 'created_at', 'expiry_time')
+        list_serializer_class = BulkCreateListSerializer
     
     def validate(self, data):
         if data['amount'] <= 0:
@@ -66,8 +97,12 @@ class BinaryOptionTradeSerializer(serializers.ModelSerializer):
         return data
     
     def create(self, validated_data):
+        return super().create(self.prepare(validated_data))
+
+    def prepare(self, validated_data):
+        """Fill in the fields the client does not send; shared with bulk creation"""
         # Calculate the expiry time based on current time + expiry_seconds
-        expiry_time = datetime.now() + timedelta(seconds=validated_data['expiry_seconds'])
+        expiry_time = timezone.now() + timedelta(seconds=validated_data['expiry_seconds'])
         validated_data['expiry_time'] = expiry_time
         
         # Convert trade_type to direction (if needed)
@@ -81,4 +116,4 @@ class BinaryOptionTradeSerializer(serializers.ModelSerializer):
             # This would be replaced with actual price from an API
             validated_data['entry_price'] = 50000.00  # Dummy BTC price
         
-        return super().create(validated_data) 
\ No newline at end of file
+        return validated_data 
\ No newline at end of file
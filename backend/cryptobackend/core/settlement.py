@@ -0,0 +1,281 @@
+"""
+Server-side settlement of binary option trades.
+
+``SettlementScheduler`` keeps ACTIVE trades that expire soon in a min-heap
+ordered by ``expiry_time`` and settles each one as soon as it is due, so
+trades no longer wait for a client to poll ``/api/check-trades/``. It is
+driven by the ``run_settlement`` management command.
+
+Expired trades are settled at the price in effect at their ``expiry_time``
+(see ``core.ticks``) when one was recorded, so the outcome does not depend
+on how late the trade is processed; only trades without one fall back to the
+current price.
+"""
+import heapq
+import logging
+import time
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .analytics import record_outcomes
+from .authentication import bump_auth_version
+from .events import publish_trade_updates
+from .market_data import market_data
+from .metrics import record_settlements
+from .models import BinaryOptionTrade
+from .response_cache import bump_on_commit
+from .ticks import tick_history
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+
+def determine_outcome(trade, exit_price):
+    """Return the (status, payout_amount) a trade settles to at ``exit_price``"""
+    if trade.direction == 'UP':
+        is_won = exit_price > trade.entry_price
+    else:  # DOWN
+        is_won = exit_price < trade.entry_price
+
+    # Equal prices (draw) count as a loss
+    if is_won:
+        return 'WON', trade.amount + (trade.amount * trade.profit_percentage / 100)
+    return 'LOST', Decimal('0')
+
+
+def credit_balance(user_id, amount):
+    """Atomically add ``amount`` to a user's balance without loading the row"""
+    credited = User.objects.filter(pk=user_id).update(balance=F('balance') + amount)
+    # update() sends no post_save; drop the cached user with its old balance
+    transaction.on_commit(lambda: bump_auth_version(user_id))
+    return credited
+
+
+def expiry_prices(trades):
+    """Map trade id -> recorded price at ``expiry_time`` for the expired ``trades`` that have one"""
+    now = timezone.now()
+    prices = {}
+    for trade in trades:
+        if trade.expiry_time <= now:
+            price = tick_history.price_at(trade.symbol, trade.expiry_time)
+            if price is not None:
+                prices[trade.id] = price
+    return prices
+
+
+def _claim_trades(trades, outcomes):
+    """
+    Claim the still-ACTIVE ``trades`` for this settler and write their
+    outcomes. Must run inside a transaction; returns the claimed trades.
+
+    Where the database has ``SELECT ... FOR UPDATE SKIP LOCKED`` the rows are
+    locked and written with one ``bulk_update``; rows locked or already
+    settled by a concurrent settler are skipped. Elsewhere each trade is moved
+    out of ACTIVE with a conditional ``UPDATE ... WHERE status = 'ACTIVE'``.
+    """
+    now = timezone.now()
+    if connection.features.has_select_for_update_skip_locked:
+        claimed_ids = set(
+            BinaryOptionTrade.objects.select_for_update(skip_locked=True)
+            .filter(id__in=[trade.id for trade in trades], status='ACTIVE')
+            .values_list('id', flat=True)
+        )
+        claimed = [trade for trade in trades if trade.id in claimed_ids]
+        for trade in claimed:
+            trade.status, trade.payout_amount, trade.exit_price = outcomes[trade.id]
+            trade.updated_at = now
+        BinaryOptionTrade.objects.bulk_update(
+            claimed, ['status', 'exit_price', 'payout_amount', 'updated_at'], batch_size=500,
+        )
+        return claimed
+
+    claimed = []
+    for trade in trades:
+        status, payout_amount, exit_price = outcomes[trade.id]
+        if BinaryOptionTrade.objects.filter(pk=trade.pk, status='ACTIVE').update(
+            status=status, payout_amount=payout_amount, exit_price=exit_price, updated_at=now,
+        ):
+            trade.status, trade.payout_amount, trade.exit_price = status, payout_amount, exit_price
+            trade.updated_at = now
+            claimed.append(trade)
+    return claimed
+
+
+def settle_trades(trades, prices, exit_prices=None):
+    """
+    Settle ``trades`` in bulk at ``prices`` (symbol -> exit price), or at
+    ``exit_prices`` (trade id -> exit price) for the trades listed there.
+
+    Outcomes are computed in memory, then the trades are claimed and written
+    in bulk, added to their owners' analytics stats, and winnings are
+    credited with one ``F('balance')`` UPDATE per user, all in a single
+    transaction. A trade settled or closed by someone
+    else in the meantime is skipped, so any number of settlers can run in
+    parallel without crediting a trade twice. Returns the trades settled here.
+    """
+    exit_prices = exit_prices or {}
+    outcomes = {}
+    for trade in trades:
+        if trade.id in exit_prices:
+            exit_price = exit_prices[trade.id]
+        else:
+            exit_price = prices[trade.symbol.upper()]
+        status, payout_amount = determine_outcome(trade, exit_price)
+        outcomes[trade.id] = (status, payout_amount, exit_price)
+
+    with transaction.atomic():
+        settled = _claim_trades(trades, outcomes)
+        record_outcomes(settled)
+        credits = defaultdict(Decimal)
+        for trade in settled:
+            if trade.payout_amount:
+                credits[trade.user_id] += trade.payout_amount
+        # Fixed lock order across settlers
+        for user_id in sorted(credits):
+            credit_balance(user_id, credits[user_id])
+        bump_on_commit(trade.user_id for trade in settled)
+        transaction.on_commit(lambda: publish_trade_updates(settled))
+    record_settlements(settled)
+    return settled
+
+
+class SettlementStats:
+    """Settlement lag (settled_at - expiry_time) counters in seconds"""
+
+    def __init__(self):
+        self.settled = 0
+        self.failed = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+
+    def record(self, lag):
+        self.settled += 1
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+
+    def as_dict(self):
+        return {
+            'settled': self.settled,
+            'failed': self.failed,
+            'avg_lag': round(self.total_lag / self.settled, 4) if self.settled else None,
+            'max_lag': round(self.max_lag, 4),
+        }
+
+
+class SettlementScheduler:
+    """
+    Expiry-ordered settlement loop.
+
+    Every ``refresh_interval`` seconds the scheduler loads ACTIVE trades that
+    expire within ``lookahead`` seconds and pushes the unseen ones onto the
+    heap. Between refreshes it sleeps until the earliest expiry, so a trade is
+    settled within one price fetch of its ``expiry_time``. Because the
+    lookahead is longer than the refresh interval, every trade is on the heap
+    before it expires.
+    """
+
+    MIN_SLEEP = 0.01
+
+    def __init__(self, refresh_interval=None, lookahead=None, price_source=market_data):
+        self.refresh_interval = refresh_interval if refresh_interval is not None else getattr(settings, 'SETTLEMENT_REFRESH_INTERVAL', 1.0)
+        self.lookahead = lookahead if lookahead is not None else getattr(settings, 'SETTLEMENT_LOOKAHEAD', 30.0)
+        self.price_source = price_source
+        self.stats = SettlementStats()
+        self._heap = []  # (expiry_time, trade_id)
+        self._scheduled = set()
+        self._next_refresh = 0.0
+        self._running = False
+
+    def refresh(self, now=None):
+        """Schedule ACTIVE trades expiring before ``now + lookahead``"""
+        now = now or timezone.now()
+        upcoming = BinaryOptionTrade.objects.filter(
+            status='ACTIVE',
+            expiry_time__lte=now + timedelta(seconds=self.lookahead),
+        ).values_list('id', 'expiry_time', 'symbol')
+        added = 0
+        symbols = set()
+        for trade_id, expiry_time, symbol in upcoming:
+            symbols.add(symbol)
+            if trade_id not in self._scheduled:
+                self._scheduled.add(trade_id)
+                heapq.heappush(self._heap, (expiry_time, trade_id))
+                added += 1
+        # Record these symbols' ticks from every bulk price fetch, for expiry prices
+        tick_history.track(symbols)
+        return added
+
+    def pop_due(self, now=None):
+        """Remove and return the ids of every scheduled trade that has expired"""
+        now = now or timezone.now()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, trade_id = heapq.heappop(self._heap)
+            self._scheduled.discard(trade_id)
+            due.append(trade_id)
+        return due
+
+    def settle_due(self, now=None):
+        """Settle every due trade at its expiry price, fetching each missing symbol once"""
+        trade_ids = self.pop_due(now)
+        if not trade_ids:
+            return []
+
+        # Trades may have been settled or closed early since they were scheduled
+        trades = list(BinaryOptionTrade.objects.filter(id__in=trade_ids, status='ACTIVE'))
+        recorded = expiry_prices(trades)
+        # Only trades without a recorded price at expiry need the current price
+        symbols = {trade.symbol for trade in trades if trade.id not in recorded}
+        prices = self.price_source.get_prices(symbols) if symbols else {}
+
+        # Trades without a price are retried on the next refresh instead of
+        # being settled at a wrong price
+        priced = [trade for trade in trades if trade.id in recorded or trade.symbol.upper() in prices]
+        self.stats.failed += len(trades) - len(priced)
+        if not priced:
+            return []
+        try:
+            settled = settle_trades(priced, prices, recorded)
+        except Exception:
+            self.stats.failed += len(priced)
+            logger.exception('Failed to settle %d binary option trades', len(priced))
+            return []
+
+        settled_at = timezone.now()
+        for trade in settled:
+            self.stats.record((settled_at - trade.expiry_time).total_seconds())
+        return settled
+
+    def seconds_until_next(self, now=None):
+        """Seconds to sleep before the next expiry or refresh, whichever is sooner"""
+        wait = max(0.0, self._next_refresh - time.monotonic())
+        if self._heap:
+            now = now or timezone.now()
+            wait = min(wait, max(0.0, (self._heap[0][0] - now).total_seconds()))
+        return wait
+
+    def run_once(self):
+        if time.monotonic() >= self._next_refresh:
+            self.refresh()
+            self._next_refresh = time.monotonic() + self.refresh_interval
+        return self.settle_due()
+
+    def run_forever(self):
+        self._running = True
+        while self._running:
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception('Settlement loop iteration failed')
+            time.sleep(max(self.seconds_until_next(), self.MIN_SLEEP))
+
+    def stop(self):
+        self._running = False
@@ -0,0 +1,52 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .analytics import SETTLED_STATUSES
+from .authentication import bump_auth_version
+from .exchanges import exchange_registry
+from .models import ApiKey, BinaryOptionStats, BinaryOptionTrade, Portfolio, Trade
+from .response_cache import bump_on_commit
+
+
+@receiver(post_save, sender=ApiKey)
+@receiver(post_delete, sender=ApiKey)
+def invalidate_exchange_client(sender, instance, **kwargs):
+    """Drop the pooled client when a key is updated, deactivated or deleted"""
+    exchange_registry.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Trade)
+@receiver(post_delete, sender=Trade)
+@receiver(post_save, sender=BinaryOptionTrade)
+@receiver(post_delete, sender=BinaryOptionTrade)
+@receiver(post_save, sender=Portfolio)
+@receiver(post_delete, sender=Portfolio)
+def invalidate_cached_responses(sender, instance, **kwargs):
+    """Invalidate the owner's cached responses; bulk writes bump versions explicitly"""
+    bump_on_commit([instance.user_id])
+
+
+@receiver(post_save, sender=BinaryOptionTrade)
+@receiver(post_delete, sender=BinaryOptionTrade)
+def invalidate_option_stats(sender, instance, **kwargs):
+    """
+    Drop the owner's analytics stats when a settled trade is saved or deleted
+    outside settlement (e.g. in the admin); the next read rebuilds them.
+    Settlement itself updates trades with ``update()`` and the stats directly.
+    """
+    if instance.status in SETTLED_STATUSES:
+        BinaryOptionStats.objects.filter(user_id=instance.user_id).delete()
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_cached_user(sender, instance, **kwargs):
+    """
+    Make every process reload the user after a password change, deactivation
+    or any other save. Updates through ``QuerySet.update()`` send no signal and
+    must call ``bump_auth_version`` themselves.
+    """
+    user_id = instance.pk
+    transaction.on_commit(lambda: bump_auth_version(user_id))
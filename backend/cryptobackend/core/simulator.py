@@ -0,0 +1,249 @@
+"""
+Offline stand-in for Binance and ccxt exchanges.
+
+With ``MARKET_SIMULATOR_ENABLED`` set, ``core.market_data`` reads prices from
+``simulator`` instead of the Binance ticker endpoint and ``core.exchanges``
+hands out ``SimulatedExchange`` clients instead of real ccxt ones. Every call
+pays a configurable latency plus jitter and fails at a configurable rate, so
+throughput and latency can be measured reproducibly without the network.
+
+Prices follow a seeded random walk, or replay a recorded series from a CSV
+file with ``timestamp,symbol,price`` rows (timestamp in epoch seconds). Like
+Binance, both feeds reject symbols they do not list.
+"""
+import bisect
+import csv
+import itertools
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+
+# Symbols the random walk lists and their starting prices; add others with
+# MARKET_SIMULATOR_EXTRA_PRICES
+BASE_PRICES = {
+    'BTC': 65000.0,
+    'ETH': 3500.0,
+    'BNB': 580.0,
+    'SOL': 150.0,
+    'AVAX': 35.0,
+    'DOT': 7.0,
+    'MATIC': 0.7,
+    'ADA': 0.45,
+    'XRP': 0.5,
+    'DOGE': 0.15,
+}
+
+
+class SimulatedUpstreamError(Exception):
+    """Injected upstream failure"""
+
+
+def round_to_tick(price):
+    """Round to a realistic tick size: about seven significant digits, 2-8 decimals"""
+    decimals = 6 - math.floor(math.log10(price)) if price > 0 else 8
+    return round(price, min(8, max(2, decimals)))
+
+
+class RandomWalkFeed:
+    """Geometric random walk per listed symbol, advanced by wall-clock time"""
+
+    def __init__(self, seed=None, volatility=0.0005, extra_prices=None):
+        self.volatility = volatility  # standard deviation per sqrt(second)
+        self.base_prices = {**BASE_PRICES, **(extra_prices or {})}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._state = {}  # symbol -> (price, updated_at)
+
+    def price(self, symbol):
+        if symbol not in self.base_prices:
+            raise SimulatedUpstreamError(f'Invalid symbol {symbol}')
+        now = time.monotonic()
+        with self._lock:
+            price, updated_at = self._state.get(symbol, (self.base_prices[symbol], now))
+            elapsed = now - updated_at
+            if elapsed > 0:
+                price *= math.exp(self.volatility * math.sqrt(elapsed) * self._rng.gauss(0, 1))
+            self._state[symbol] = (price, now)
+            return round_to_tick(price)
+
+    def symbols(self):
+        return sorted(self.base_prices)
+
+
+class ReplayFeed:
+    """Replays a recorded price series in real time (or ``speed`` times faster), looping at the end"""
+
+    def __init__(self, path, speed=1.0):
+        self.speed = speed
+        series = defaultdict(list)
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                series[row['symbol'].upper()].append((float(row['timestamp']), float(row['price'])))
+        if not series:
+            raise ValueError(f'No ticks in replay file {path}')
+        for ticks in series.values():
+            ticks.sort()
+        self._times = {symbol: [t for t, _ in ticks] for symbol, ticks in series.items()}
+        self._prices = {symbol: [p for _, p in ticks] for symbol, ticks in series.items()}
+        self._start = min(times[0] for times in self._times.values())
+        self._duration = max(times[-1] for times in self._times.values()) - self._start or 1.0
+        self._started_at = time.monotonic()
+
+    def price(self, symbol):
+        times = self._times.get(symbol)
+        if times is None:
+            raise SimulatedUpstreamError(f'Invalid symbol {symbol}')
+        elapsed = ((time.monotonic() - self._started_at) * self.speed) % self._duration
+        index = bisect.bisect_right(times, self._start + elapsed) - 1
+        return self._prices[symbol][max(index, 0)]
+
+    def symbols(self):
+        return sorted(self._times)
+
+
+class MarketSimulator:
+    """Price feed plus injected latency, jitter and errors"""
+
+    def __init__(self, feed, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, seed=None):
+        self.feed = feed
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.calls = itertools.count()
+
+    def simulate_call(self):
+        """Sleep for one call's latency and raise an injected error at ``error_rate``"""
+        next(self.calls)
+        with self._rng_lock:
+            delay = self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)
+            fail = self._rng.random() < self.error_rate
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if fail:
+            raise SimulatedUpstreamError('Injected upstream failure')
+
+    def fetch_price(self, symbol):
+        """Drop-in for ``market_data.fetch_binance_price``"""
+        self.simulate_call()
+        return Decimal(f'{self.feed.price(symbol.upper()):.8f}')
+
+    def fetch_prices(self):
+        """Drop-in for ``market_data.fetch_binance_prices``"""
+        self.simulate_call()
+        return {symbol: Decimal(f'{self.feed.price(symbol):.8f}') for symbol in self.feed.symbols()}
+
+
+class SimulatedExchange:
+    """
+    The subset of the ccxt exchange API used by the views, backed by a
+    ``MarketSimulator``. Balances live in memory per client, starting with
+    ``MARKET_SIMULATOR_START_BALANCE`` USDT.
+    """
+
+    has = {'fetchTickers': True}
+
+    def __init__(self, market, name='simulated', start_balance=100000.0):
+        self.market = market
+        self.id = name
+        self._lock = threading.Lock()
+        self._balances = defaultdict(float, {'USDT': start_balance})
+        self._order_ids = itertools.count(1)
+
+    def load_markets(self):
+        return {f'{symbol}/USDT': {'symbol': f'{symbol}/USDT', 'base': symbol, 'quote': 'USDT'}
+                for symbol in self.market.feed.symbols()}
+
+    def _ticker(self, pair):
+        last = self.market.feed.price(pair.split('/')[0])
+        return {'symbol': pair, 'last': last, 'bid': last, 'ask': last, 'timestamp': int(time.time() * 1000)}
+
+    def fetch_ticker(self, pair):
+        self.market.simulate_call()
+        return self._ticker(pair)
+
+    def fetch_tickers(self, pairs=None):
+        self.market.simulate_call()
+        pairs = pairs or list(self.load_markets())
+        return {pair: self._ticker(pair) for pair in pairs}
+
+    def fetch_balance(self):
+        self.market.simulate_call()
+        with self._lock:
+            total = {currency: amount for currency, amount in self._balances.items() if amount}
+        return {'total': total, 'free': dict(total), 'used': {currency: 0.0 for currency in total}}
+
+    def _create_market_order(self, pair, side, amount):
+        self.market.simulate_call()
+        base, quote = pair.split('/')
+        price = self.market.feed.price(base)
+        cost = price * amount
+        with self._lock:
+            if side == 'buy':
+                if self._balances[quote] < cost:
+                    raise SimulatedUpstreamError('Insufficient balance')
+                self._balances[quote] -= cost
+                self._balances[base] += amount
+            else:
+                if self._balances[base] < amount:
+                    raise SimulatedUpstreamError('Insufficient balance')
+                self._balances[base] -= amount
+                self._balances[quote] += cost
+        return {
+            'id': str(next(self._order_ids)),
+            'symbol': pair,
+            'type': 'market',
+            'side': side,
+            'amount': amount,
+            'filled': amount,
+            'price': price,
+            'average': price,
+            'cost': cost,
+            'status': 'closed',
+        }
+
+    def create_market_buy_order(self, pair, amount):
+        return self._create_market_order(pair, 'buy', amount)
+
+    def create_market_sell_order(self, pair, amount):
+        return self._create_market_order(pair, 'sell', amount)
+
+
+def build_simulator():
+    """Create a ``MarketSimulator`` from the MARKET_SIMULATOR_* settings"""
+    seed = getattr(settings, 'MARKET_SIMULATOR_SEED', None)
+    replay_file = getattr(settings, 'MARKET_SIMULATOR_REPLAY_FILE', None)
+    if replay_file:
+        feed = ReplayFeed(replay_file, speed=getattr(settings, 'MARKET_SIMULATOR_REPLAY_SPEED', 1.0))
+    else:
+        feed = RandomWalkFeed(seed=seed, extra_prices=getattr(settings, 'MARKET_SIMULATOR_EXTRA_PRICES', None))
+    return MarketSimulator(
+        feed,
+        latency_ms=getattr(settings, 'MARKET_SIMULATOR_LATENCY_MS', 0.0),
+        jitter_ms=getattr(settings, 'MARKET_SIMULATOR_JITTER_MS', 0.0),
+        error_rate=getattr(settings, 'MARKET_SIMULATOR_ERROR_RATE', 0.0),
+        seed=seed,
+    )
+
+
+_simulator = None
+_simulator_lock = threading.Lock()
+
+
+def get_simulator():
+    """Return the process-wide simulator, creating it on first use"""
+    global _simulator
+    with _simulator_lock:
+        if _simulator is None:
+            _simulator = build_simulator()
+        return _simulator
+
+
+def is_enabled():
+    return getattr(settings, 'MARKET_SIMULATOR_ENABLED', False)
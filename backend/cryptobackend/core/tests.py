@@ -1,3 +1,1283 @@
-from django.test import TestCase
+import asyncio
+import os
+import pstats
+import tempfile
+import threading
+import time
+import warnings
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import requests
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .analytics import add_outcome, binary_option_stats, trade_stats
+from .async_http import short_lived_loop
+from .authentication import CachedJWTAuthentication, user_cache
+from .candles import TickStore
+from .consumers import MAX_SUBSCRIPTIONS
+from .events import publish_prices, publish_trade_updates
+from .exchanges import ExchangeRegistry
+from .fast_serializers import get_values_serializer
+from .market_data import MarketDataService, PriceUnavailable, fetch_concurrently, fetch_exchange_prices, market_data
+from .middleware import ProfilingMiddleware
+from .models import ApiKey, BinaryOptionStats, BinaryOptionTrade, Portfolio, Trade, User
+from .renderers import FastJSONRenderer
+from .routing import websocket_urlpatterns
+from .serializers import BinaryOptionTradeSerializer
+from .settlement import SettlementScheduler, credit_balance, settle_trades
+from .simulator import MarketSimulator, RandomWalkFeed, ReplayFeed, SimulatedExchange, SimulatedUpstreamError, build_simulator
+from .ticks import TickHistory, tick_history
+from .upstream import CircuitBreaker, CircuitOpen, UpstreamClient, UpstreamError
+
+
+class ConcurrentSettlementTests(TransactionTestCase):
+    """Settlement stays exact when many workers race over the same trades"""
+
+    WORKERS = 8
+    TRADES_PER_USER = 40
+
+    def setUp(self):
+        expired = timezone.now() - timedelta(seconds=1)
+        self.users = [
+            User.objects.create_user(email=f'settle{i}@example.com', username=f'settle{i}', password='x')
+            for i in range(3)
+        ]
+        BinaryOptionTrade.objects.bulk_create([
+            BinaryOptionTrade(
+                user=user,
+                symbol='BTC' if n % 2 else 'ETH',
+                direction='UP' if n % 3 else 'DOWN',
+                amount=Decimal('10.00'),
+                profit_percentage=Decimal('85.00'),
+                entry_price=Decimal('100'),
+                expiry_time=expired,
+                expiry_seconds=60,
+            )
+            for user in self.users
+            for n in range(self.TRADES_PER_USER)
+        ])
+        self.prices = {'BTC': Decimal('101'), 'ETH': Decimal('101')}
+
+    def run_concurrently(self, target):
+        barrier = threading.Barrier(self.WORKERS)
+        errors = []
+
+        def worker():
+            try:
+                target(barrier)
+            except Exception as e:  # surfaced by the assertion below
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def expected_balance(self, user):
+        winners = BinaryOptionTrade.objects.filter(user=user, direction='UP').count()
+        return winners * Decimal('18.50')
+
+    def test_parallel_settlers_never_double_credit(self):
+        settled_counts = []
+
+        def settle(barrier):
+            # Every worker loads the same ACTIVE trades before any of them writes
+            trades = list(BinaryOptionTrade.objects.filter(status='ACTIVE'))
+            barrier.wait()
+            settled_counts.append(len(settle_trades(trades, self.prices)))
+
+        self.run_concurrently(settle)
+
+        self.assertEqual(sum(settled_counts), len(self.users) * self.TRADES_PER_USER)
+        self.assertFalse(BinaryOptionTrade.objects.filter(status='ACTIVE').exists())
+        for user in self.users:
+            user.refresh_from_db()
+            self.assertEqual(user.balance, self.expected_balance(user))
+
+    def test_parallel_credits_are_not_lost(self):
+        user = self.users[0]
+
+        def credit(barrier):
+            barrier.wait()
+            for _ in range(25):
+                credit_balance(user.pk, Decimal('1.5'))
+
+        self.run_concurrently(credit)
+
+        user.refresh_from_db()
+        self.assertEqual(user.balance, Decimal('1.5') * 25 * self.WORKERS)
+
+
+class ExpiryPriceTests(TestCase):
+    """Expired trades settle at the price recorded at expiry_time, not the price when processed"""
+
+    class FixedPrices:
+        def __init__(self, price):
+            self.price = price
+            self.requested = []
+
+        def get_prices(self, symbols):
+            self.requested.extend(symbols)
+            return {symbol.upper(): self.price for symbol in symbols}
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='expiry@example.com', username='expiry', password='x')
+        self.expiry = timezone.now() - timedelta(seconds=30)
+        self.trade = BinaryOptionTrade.objects.create(
+            user=self.user,
+            symbol='BTC',
+            direction='UP',
+            amount=Decimal('10.00'),
+            profit_percentage=Decimal('85.00'),
+            entry_price=Decimal('100'),
+            expiry_time=self.expiry,
+            expiry_seconds=60,
+        )
+
+    def tearDown(self):
+        tick_history._buffers.clear()
+
+    def test_ring_buffer_returns_price_in_effect(self):
+        history = TickHistory(capacity=4, max_gap=5)
+        for second, price in enumerate(['1', '2', '3', '4', '5', '6']):
+            history.record('ETH', Decimal(price), 1000 + second)
+        self.assertEqual(history.price_at('ETH', 1003.5), Decimal('4'))
+        self.assertEqual(history.price_at('ETH', 1010), Decimal('6'))
+        # Evicted from the buffer, and far past the last tick
+        self.assertIsNone(history.price_at('ETH', 1001))
+        self.assertIsNone(history.price_at('ETH', 1011))
+
+    def test_bulk_ticks_are_kept_for_tracked_symbols_only(self):
+        history = TickHistory(capacity=4, max_gap=5)
+        history.track(['btc'])
+        history.record_many({'BTC': Decimal('65000.12345678'), 'ETH': Decimal('3500')}, 1000)
+        self.assertEqual(list(history._buffers), ['BTC'])
+        self.assertEqual(history.price_at('BTC', 1000), Decimal('65000.12345678'))
+        self.assertIsNone(history.price_at('ETH', 1000))
+
+        # Symbols asked for by name are tracked; the rest of the bulk ticker is only cached
+        service = MarketDataService(fetcher=None, bulk_fetcher=lambda: {'BTC': Decimal('1'), 'SOL': Decimal('2'), 'XRP': Decimal('3')})
+        service.get_prices(['SOL'])
+        self.assertIn('SOL', tick_history._buffers)
+        self.assertNotIn('XRP', tick_history._buffers)
+
+    def test_scheduler_tracks_active_symbols(self):
+        SettlementScheduler(price_source=self.FixedPrices(Decimal('99'))).refresh()
+        self.assertEqual(list(tick_history._buffers), ['BTC'])
+
+    def test_scheduler_settles_at_recorded_expiry_price(self):
+        tick_history.record('BTC', Decimal('101'), self.expiry.timestamp() - 1)
+        prices = self.FixedPrices(Decimal('99'))
+        scheduler = SettlementScheduler(price_source=prices)
+        scheduler.refresh()
+
+        settled = scheduler.settle_due()
+
+        self.assertEqual([trade.id for trade in settled], [self.trade.id])
+        self.assertEqual(prices.requested, [])
+        self.trade.refresh_from_db()
+        self.assertEqual(self.trade.status, 'WON')
+        self.assertEqual(self.trade.exit_price, Decimal('101'))
+
+    def test_scheduler_falls_back_to_current_price(self):
+        prices = self.FixedPrices(Decimal('99'))
+        scheduler = SettlementScheduler(price_source=prices)
+        scheduler.refresh()
+
+        scheduler.settle_due()
+
+        self.assertEqual(prices.requested, ['BTC'])
+        self.trade.refresh_from_db()
+        self.assertEqual(self.trade.status, 'LOST')
+
+
+class FastListTests(TestCase):
+    """The .values() read path and FastJSONRenderer produce the same bytes as the serializers"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='lists@example.com', username='lists', password='x')
+        now = timezone.now()
+        for n, (exit_price, payout) in enumerate([(None, None), (Decimal('101.5'), Decimal('18.5')), (Decimal('0.00000123'), None)]):
+            BinaryOptionTrade.objects.create(
+                user=self.user,
+                symbol='BTC',
+                direction='UP' if n % 2 else 'DOWN',
+                amount=Decimal('10'),
+                entry_price=Decimal('100.123'),
+                expiry_time=now + timedelta(microseconds=n * 1500),
+                expiry_seconds=60,
+                exit_price=exit_price,
+                status='WON' if payout else 'ACTIVE',
+                payout_amount=payout,
+            )
+
+    def test_values_path_matches_serializer(self):
+        queryset = BinaryOptionTrade.objects.filter(user=self.user).order_by('-created_at')
+        values_serializer = get_values_serializer(BinaryOptionTradeSerializer)
+        expected = JSONRenderer().render(BinaryOptionTradeSerializer(queryset, many=True).data)
+        rendered = FastJSONRenderer().render(values_serializer.serialize(values_serializer.values(queryset)))
+        self.assertEqual(rendered, expected)
+
+    def test_list_endpoint_matches_serializer(self):
+        queryset = BinaryOptionTrade.objects.filter(user=self.user).order_by('-created_at')
+        expected = JSONRenderer().render(BinaryOptionTradeSerializer(queryset[:2], many=True).data)
+        response = self.client.get('/api/binary-options/?page_size=2', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.assertIn(b'"results":' + expected, response.content)
+        self.assertIsNotNone(response.json()['next'])
+
+    def test_renderer_matches_json_renderer(self):
+        for data in ([1e-05, 2.5e-07, 0.1, 85.0, 1e16], {'text': 'a\u2028b\u00e9', 'nested': [None, True, Decimal('1.5')]},
+                     {1: 'non-str key'}, [2 ** 70], {'when': timezone.now()}):
+            self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_renderer_refuses_non_finite_floats(self):
+        for data in (float('nan'), {'a': [None, float('inf')]}, [None, -float('inf')], [None, Decimal('NaN')]):
+            with self.assertRaises(ValueError):
+                JSONRenderer().render(data)
+            with self.assertRaises(ValueError):
+                FastJSONRenderer().render(data)
+
+
+class FakeExchange:
+    """ccxt stand-in with fixed balances and tickers"""
+
+    has = {'fetchTickers': True}
+
+    def __init__(self, balances, prices):
+        self.balances = balances
+        self.prices = prices
+
+    def load_markets(self):
+        return {f'{symbol}/USDT': {} for symbol in self.prices}
+
+    def fetch_tickers(self, pairs):
+        return {pair: {'last': self.prices[pair.split('/')[0]]} for pair in pairs}
+
+    def fetch_balance(self):
+        return {'total': self.balances}
+
+
+class PortfolioSyncTests(TestCase):
+    """sync_from_exchange upserts every holding and zeroes the ones that are gone"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='portfolio@example.com', username='portfolio', password='x')
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.api_key = ApiKey.objects.create(user=self.user, exchange='BINANCE', api_key='k', api_secret='s')
+        Portfolio.objects.create(user=self.user, symbol='BTC', quantity=Decimal('1'), average_buy_price=Decimal('50'))
+        Portfolio.objects.create(user=self.user, symbol='ETH', quantity=Decimal('3'), average_buy_price=Decimal('10'))
+        other = User.objects.create_user(email='other@example.com', username='other', password='x')
+        Portfolio.objects.create(user=other, symbol='ETH', quantity=Decimal('5'), average_buy_price=Decimal('10'))
+
+    def sync(self, exchange):
+        with mock.patch('core.views.get_exchange', return_value=exchange):
+            return self.client.post(
+                '/api/portfolio/sync_from_exchange/', {'api_key_id': self.api_key.id},
+                content_type='application/json', headers=self.headers,
+            )
+
+    def holdings(self, user):
+        return dict(Portfolio.objects.filter(user=user).values_list('symbol', 'quantity'))
+
+    def test_sync(self):
+        exchange = FakeExchange(
+            {'BTC': 2.0, 'SOL': 0.5, 'USDT': 1000.0, 'DOGE': 0.0, 'XYZ': 7.0},
+            {'BTC': 100.0, 'SOL': 20.0, 'ETH': 10.0},
+        )
+        response = self.sync(exchange)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['items'], [
+            {'symbol': 'BTC', 'quantity': '2.0', 'price': '100.0'},
+            {'symbol': 'SOL', 'quantity': '0.5', 'price': '20.0'},
+        ])
+        # XYZ has no price, so it is skipped but not zeroed either
+        self.assertEqual(self.holdings(self.user), {'BTC': Decimal('2'), 'ETH': Decimal('0'), 'SOL': Decimal('0.5')})
+        btc = Portfolio.objects.get(user=self.user, symbol='BTC')
+        self.assertEqual(btc.average_buy_price, Decimal('100'))
+        self.assertEqual(Portfolio.objects.get(symbol='ETH', user__email='other@example.com').quantity, Decimal('5'))
+
+    def test_sync_is_repeatable(self):
+        exchange = FakeExchange({'BTC': 2.0}, {'BTC': 100.0})
+        self.sync(exchange)
+        exchange.balances = {'ETH': 4.0}
+        exchange.prices = {'ETH': 12.0}
+        self.assertEqual(self.sync(exchange).status_code, 200)
+        self.assertEqual(self.holdings(self.user), {'BTC': Decimal('0'), 'ETH': Decimal('4')})
+        self.assertEqual(Portfolio.objects.filter(user=self.user).count(), 2)
+
+    def test_unknown_api_key(self):
+        self.api_key.is_active = False
+        self.api_key.save()
+        response = self.sync(FakeExchange({}, {}))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.holdings(self.user), {'BTC': Decimal('1'), 'ETH': Decimal('3')})
+
+
+class ExchangeClientTests(SimpleTestCase):
+    """Pooled exchange clients and concurrent ticker fetches"""
+
+    def test_registry_reuses_and_evicts_clients(self):
+        registry = ExchangeRegistry(factory=lambda api_key: object(), max_size=2)
+        keys = [ApiKey(id=n, exchange='BINANCE', api_key=f'key{n}', api_secret='s') for n in range(3)]
+        first = registry.get(keys[0])
+        registry.get(keys[1])
+        self.assertIs(registry.get(keys[0]), first)
+        # keys[1] is now the least recently used
+        registry.get(keys[2])
+        self.assertEqual(len(registry), 2)
+        self.assertIs(registry.get(keys[0]), first)
+        self.assertEqual(list(registry._clients), [2, 0])
+
+        keys[0].api_secret = 'rotated'
+        self.assertIsNot(registry.get(keys[0]), first)
+        registry.invalidate(2)
+        self.assertEqual(list(registry._clients), [0])
+
+    def test_fetch_concurrently_keeps_partial_results(self):
+        def fetch(key):
+            if key == 'fail':
+                raise ValueError(key)
+            if key == 'slow':
+                time.sleep(0.5)
+            return key.upper()
+
+        started = time.monotonic()
+        results = fetch_concurrently(fetch, ['a', 'fail', 'slow', 'b'], deadline=0.1)
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertEqual(results, {'a': 'A', 'b': 'B'})
+
+    def test_exchange_prices_without_bulk_tickers(self):
+        exchange = mock.Mock(has={})
+        exchange.load_markets.return_value = {'BTC/USDT': {}, 'ETH/USDT': {}, 'SOL/USDT': {}}
+
+        def fetch_ticker(pair):
+            if pair == 'ETH/USDT':
+                raise ValueError('exchange error')
+            return {'last': 100.5}
+
+        exchange.fetch_ticker.side_effect = fetch_ticker
+        prices = fetch_exchange_prices(exchange, ['BTC', 'ETH', 'SOL', 'UNLISTED'], deadline=1)
+        self.assertEqual(prices, {'BTC': Decimal('100.5'), 'SOL': Decimal('100.5')})
+        self.assertEqual(sorted(call.args[0] for call in exchange.fetch_ticker.call_args_list),
+                         ['BTC/USDT', 'ETH/USDT', 'SOL/USDT'])
+
+
+class AsyncPriceTests(TestCase):
+    """Async views await prices through the shared single-flight cache"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='async@example.com', username='async', password='x')
+        self.fetched = []
+
+    def fetch(self, symbol):
+        self.fetched.append(symbol)
+        time.sleep(0.05)
+        return Decimal('100')
+
+    def fetch_all(self):
+        self.fetched.append('*')
+        return {'BTC': Decimal('100')}
+
+    def test_concurrent_lookups_share_one_fetch(self):
+        service = MarketDataService(fetcher=self.fetch, bulk_fetcher=self.fetch_all)
+
+        async def lookups():
+            return await asyncio.gather(*[service.aget_price('btc') for _ in range(10)])
+
+        self.assertEqual(asyncio.run(lookups()), [Decimal('100')] * 10)
+        self.assertEqual(self.fetched, ['BTC'])
+
+    async def test_create_binary_option(self):
+        fetcher = market_data.fetcher
+        market_data.fetcher = self.fetch
+        market_data.invalidate()
+        try:
+            response = await AsyncClient().post(
+                '/api/binary-options/',
+                {'symbol': 'ETH', 'amount': '10', 'direction': 'UP', 'expiry_seconds': 60},
+                content_type='application/json',
+                headers={'Authorization': f'Bearer {AccessToken.for_user(self.user)}'},
+            )
+        finally:
+            market_data.fetcher = fetcher
+            market_data.invalidate()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['entry_price'], '100.00000000')
+        self.assertEqual(self.fetched, ['ETH'])
+
+        response = await AsyncClient().post('/api/binary-options/', {}, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+
+class MarketDataServiceTests(SimpleTestCase):
+    """Prices are cached for the TTL, fetched once per miss and served stale while the upstream fails"""
+
+    def setUp(self):
+        # Zero volatility keeps the simulated prices at their base values
+        self.market = MarketSimulator(RandomWalkFeed(volatility=0), latency_ms=50)
+        self.fetcher = mock.Mock(wraps=self.market.fetch_price)
+        self.bulk_fetcher = mock.Mock(wraps=self.market.fetch_prices)
+
+    def tearDown(self):
+        tick_history._buffers.clear()
+
+    def service(self, **options):
+        return MarketDataService(fetcher=self.fetcher, bulk_fetcher=self.bulk_fetcher, **options)
+
+    def test_concurrent_misses_share_one_fetch(self):
+        service = self.service()
+        barrier = threading.Barrier(8)
+        results = []
+
+        def lookup():
+            barrier.wait()
+            results.append(service.get_price('btc'))
+
+        threads = [threading.Thread(target=lookup) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [Decimal('65000')] * 8)
+        self.assertEqual(self.fetcher.call_count, 1)
+        self.assertEqual(service.stats()['misses'], 1)
+
+    def test_ttl_expiry(self):
+        service = self.service(ttl=0.2)
+        service.get_price('BTC')
+        service.get_price('BTC')
+        self.assertEqual(self.fetcher.call_count, 1)
+        time.sleep(0.25)
+        service.get_price('BTC')
+        self.assertEqual(self.fetcher.call_count, 2)
+
+    def test_stale_price_on_upstream_failure(self):
+        service = self.service(ttl=0, max_stale=60)
+        self.assertEqual(service.get_price('ETH'), Decimal('3500'))
+        self.market.error_rate = 1
+        self.assertEqual(service.get_price('ETH'), Decimal('3500'))
+        self.assertEqual(service.stats()['stale_served'], 1)
+
+        service.max_stale = 0
+        with self.assertRaises(PriceUnavailable):
+            service.get_price('ETH')
+
+    def test_bulk_lookup_makes_one_upstream_call(self):
+        service = self.service()
+        prices = service.get_prices(['btc', 'ETH', 'SOL', 'UNLISTED'])
+        self.assertEqual(prices, {'BTC': Decimal('65000'), 'ETH': Decimal('3500'), 'SOL': Decimal('150')})
+        # Hits the cache, and an unlisted symbol is not refetched within the TTL
+        self.assertEqual(service.get_prices(['BTC', 'DOGE', 'UNLISTED']), {'BTC': Decimal('65000'), 'DOGE': Decimal('0.15')})
+        self.assertEqual(service.get_price('SOL'), Decimal('150'))
+        self.assertEqual(self.bulk_fetcher.call_count, 1)
+        self.assertEqual(self.fetcher.call_count, 0)
+
+
+class SimulatorTests(SimpleTestCase):
+    """Simulated feeds, injected failures and the simulated exchange"""
+
+    def setUp(self):
+        self.clock = 0.0
+        patcher = mock.patch('core.simulator.time.monotonic', lambda: self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def walk(self, feed, steps=20):
+        prices = []
+        for _ in range(steps):
+            self.clock += 1
+            prices.append(feed.price('BTC'))
+        return prices
+
+    def test_random_walk_is_seeded(self):
+        self.assertEqual(self.walk(RandomWalkFeed(seed=7)), self.walk(RandomWalkFeed(seed=7)))
+        self.assertNotEqual(self.walk(RandomWalkFeed(seed=7)), self.walk(RandomWalkFeed(seed=8)))
+
+    def test_unknown_symbols_are_rejected(self):
+        feed = RandomWalkFeed(volatility=0)
+        with self.assertRaisesMessage(SimulatedUpstreamError, 'Invalid symbol UNLISTED'):
+            feed.price('UNLISTED')
+        self.assertNotIn('UNLISTED', feed.symbols())
+        with self.assertRaises(PriceUnavailable):
+            MarketDataService(fetcher=MarketSimulator(feed).fetch_price).get_price('unlisted')
+
+        feed = RandomWalkFeed(volatility=0, extra_prices={'PEPE': 0.00001})
+        self.assertEqual(feed.price('PEPE'), 0.00001)
+        self.assertIn('PEPE', feed.symbols())
+
+    @override_settings(MARKET_SIMULATOR_REPLAY_FILE=None, MARKET_SIMULATOR_EXTRA_PRICES={'PEPE': 0.00001})
+    def test_extra_prices_setting(self):
+        self.assertEqual(build_simulator().fetch_price('pepe'), Decimal('0.00001'))
+
+    def test_error_rate(self):
+        def failures(market):
+            pattern = []
+            for _ in range(500):
+                try:
+                    market.simulate_call()
+                except SimulatedUpstreamError:
+                    pattern.append(True)
+                else:
+                    pattern.append(False)
+            return pattern
+
+        feed = RandomWalkFeed()
+        pattern = failures(MarketSimulator(feed, error_rate=0.3, seed=1))
+        self.assertEqual(pattern, failures(MarketSimulator(feed, error_rate=0.3, seed=1)))
+        self.assertAlmostEqual(sum(pattern) / len(pattern), 0.3, delta=0.06)
+        self.assertFalse(any(failures(MarketSimulator(feed, error_rate=0))))
+        self.assertTrue(all(failures(MarketSimulator(feed, error_rate=1))))
+
+    def test_replay_feed(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'ticks.csv')
+        with open(path, 'w') as f:
+            f.write('timestamp,symbol,price\n110,btc,20\n100,btc,10\n120,btc,30\n105,eth,5\n')
+        feed = ReplayFeed(path)
+        self.assertEqual(feed.symbols(), ['BTC', 'ETH'])
+        # Before ETH's first tick it reports that tick
+        self.assertEqual((feed.price('BTC'), feed.price('ETH')), (10, 5))
+        for clock, price in ((9.9, 10), (10, 20), (15, 20), (19.9, 20), (20, 10), (31, 20)):
+            self.clock = clock
+            self.assertEqual(feed.price('BTC'), price, clock)
+        with self.assertRaises(SimulatedUpstreamError):
+            feed.price('SOL')
+
+        self.clock = 0
+        fast = ReplayFeed(path, speed=2)
+        self.clock = 5
+        self.assertEqual(fast.price('BTC'), 20)
+
+    def test_exchange_balances(self):
+        exchange = SimulatedExchange(MarketSimulator(RandomWalkFeed(volatility=0)), start_balance=1000.0)
+        order = exchange.create_market_buy_order('BTC/USDT', 0.01)
+        self.assertEqual((order['side'], order['price'], order['status']), ('buy', 65000.0, 'closed'))
+        balance = exchange.fetch_balance()['total']
+        self.assertAlmostEqual(balance['USDT'], 350.0)
+        self.assertEqual(balance['BTC'], 0.01)
+
+        with self.assertRaisesMessage(SimulatedUpstreamError, 'Insufficient balance'):
+            exchange.create_market_buy_order('BTC/USDT', 0.01)
+        with self.assertRaisesMessage(SimulatedUpstreamError, 'Insufficient balance'):
+            exchange.create_market_sell_order('BTC/USDT', 0.02)
+        self.assertEqual(exchange.fetch_balance()['total'], balance)
+
+        exchange.create_market_sell_order('BTC/USDT', 0.01)
+        self.assertEqual(exchange.fetch_balance()['total'], {'USDT': 1000.0})
+        with self.assertRaises(SimulatedUpstreamError):
+            exchange.fetch_ticker('UNLISTED/USDT')
+
+
+class FakeSession:
+    """Stands in for requests.Session, replaying one outcome per call"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def get(self, url, params=None, timeout=None):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        response = requests.Response()
+        response.status_code = outcome
+        response._content = b'{"price": "100"}'
+        return response
+
+
+class UpstreamClientTests(SimpleTestCase):
+    """Retries, circuit breaking and last-known prices when the upstream fails"""
+
+    def client_with(self, *outcomes, retries=2):
+        client = UpstreamClient('test', retries=retries, backoff=0, breaker=CircuitBreaker('test', 3, 60))
+        client._session = FakeSession(*outcomes)
+        return client
+
+    def test_retries_transient_failures(self):
+        client = self.client_with(requests.ConnectTimeout(), 503, 200)
+        self.assertEqual(client.get_json('http://upstream'), {'price': '100'})
+        self.assertEqual(client.session.calls, 3)
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_client_errors_are_not_retried(self):
+        client = self.client_with(400)
+        with self.assertRaises(UpstreamError):
+            client.get_json('http://upstream')
+        self.assertEqual(client.session.calls, 1)
+
+    def test_open_circuit_fails_fast_then_probes(self):
+        client = self.client_with(*[requests.ConnectionError()] * 3, 200)
+        with self.assertRaises(UpstreamError):
+            client.get_json('http://upstream')
+        self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpen):
+            client.get_json('http://upstream')
+        self.assertEqual(client.session.calls, 3)
+
+        client.breaker.reset_timeout = 0
+        self.assertEqual(client.get_json('http://upstream'), {'price': '100'})
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_short_lived_loop_uses_the_keep_alive_session(self):
+        client = self.client_with(200, 200)
+
+        async def lookup():
+            with short_lived_loop():
+                return await client.aget_json('http://upstream')
+
+        # Two requests as WSGI serves them, each on a loop of its own
+        for _ in range(2):
+            self.assertEqual(asyncio.run(lookup()), {'price': '100'})
+        self.assertEqual(client.session.calls, 2)
+
+    def test_open_circuit_serves_last_known_price(self):
+        errors = [UpstreamError('down'), CircuitOpen('open')]
+
+        def fetch(symbol):
+            raise errors.pop(0)
+
+        service = MarketDataService(fetcher=fetch, bulk_fetcher=dict, ttl=0, max_stale=0, outage_max_stale=60)
+        service.set_price('BTC', Decimal('100'))
+        with self.assertRaises(PriceUnavailable):
+            service.get_price('BTC')
+        self.assertEqual(service.get_price('BTC'), Decimal('100'))
+
+
+class BatchOrderTests(TestCase):
+    """Baskets are priced from one quote fetch and placed whole or not at all"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='batch@example.com', username='batch', password='x')
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.bulk_fetches = 0
+        self.bulk_fetcher = market_data.bulk_fetcher
+        market_data.bulk_fetcher = self.fetch_all
+        market_data.invalidate()
+
+    def tearDown(self):
+        market_data.bulk_fetcher = self.bulk_fetcher
+        market_data.invalidate()
+
+    def fetch_all(self):
+        self.bulk_fetches += 1
+        return {'BTC': Decimal('100'), 'ETH': Decimal('10')}
+
+    async def test_trades_batch(self):
+        orders = [
+            {'symbol': 'BTC', 'trade_type': 'BUY', 'quantity': '1'},
+            {'symbol': 'ETH', 'trade_type': 'BUY', 'quantity': '3'},
+            {'symbol': 'BTC', 'trade_type': 'BUY', 'quantity': '0.5'},
+        ]
+        response = await AsyncClient().post(
+            '/api/trades/batch/', {'orders': orders}, content_type='application/json', headers=self.headers,
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([result['total_amount'] for result in response.json()['results']],
+                         ['100.00000000', '30.00000000', '50.00000000'])
+        self.assertEqual(self.bulk_fetches, 1)
+        btc = await Portfolio.objects.aget(user=self.user, symbol='BTC')
+        self.assertEqual((btc.quantity, btc.average_buy_price), (Decimal('1.5'), Decimal('100')))
+
+    async def test_invalid_order_rejects_the_basket(self):
+        orders = [
+            {'symbol': 'BTC', 'amount': '10', 'direction': 'UP', 'expiry_seconds': 60},
+            {'symbol': 'DOGE', 'amount': '10', 'direction': 'UP', 'expiry_seconds': 60},
+            {'symbol': 'ETH', 'amount': '10', 'direction': 'UP', 'expiry_seconds': 7},
+        ]
+        response = await AsyncClient().post(
+            '/api/binary-options/batch/', orders, content_type='application/json', headers=self.headers,
+        )
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['errors']
+        self.assertEqual(errors[0], {})
+        self.assertIn('symbol', errors[1])
+        self.assertIn('non_field_errors', errors[2])
+        self.assertFalse(await BinaryOptionTrade.objects.filter(user=self.user).aexists())
+        self.assertFalse(await Trade.objects.filter(user=self.user).aexists())
+
+    def test_results_carry_stored_ids(self):
+        orders = [{'symbol': 'BTC', 'amount': '10', 'direction': 'UP', 'expiry_seconds': 60}] * 3
+        # Also without ids from bulk inserts, as on MySQL
+        for returns_rows in (True, False):
+            with mock.patch.object(
+                type(connection.features), 'can_return_rows_from_bulk_insert',
+                new_callable=mock.PropertyMock, return_value=returns_rows,
+            ), CaptureQueriesContext(connection) as queries, warnings.catch_warnings():
+                warnings.simplefilter('error', RuntimeWarning)
+                response = self.client.post(
+                    '/api/binary-options/batch/', orders, content_type='application/json', headers=self.headers,
+                )
+            self.assertEqual(response.status_code, 201)
+            inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "core_binaryoptiontrade"')]
+            self.assertEqual(len(inserts), 1)
+            ids = [result['id'] for result in response.json()['results']]
+            self.assertNotIn(None, ids)
+            self.assertEqual(
+                sorted(ids),
+                sorted(BinaryOptionTrade.objects.filter(id__in=ids, user=self.user).values_list('id', flat=True)),
+            )
+            BinaryOptionTrade.objects.filter(user=self.user).delete()
+
+
+class CachedAuthenticationTests(TestCase):
+    """Cached users are reused until the user changes in any way"""
+
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create_user(email='auth@example.com', username='auth', password='x')
+
+    def authenticate(self, token):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return CachedJWTAuthentication().authenticate(request)[0]
+
+    def test_cache_hit_skips_the_user_query(self):
+        token = AccessToken.for_user(self.user)
+        self.authenticate(token)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate(token).pk, self.user.pk)
+
+    def test_password_change_revokes_token(self):
+        with mock.patch.object(jwt_settings, 'CHECK_REVOKE_TOKEN', True):
+            token = AccessToken.for_user(self.user)
+            self.authenticate(token)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.set_password('changed')
+                self.user.save()
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate(token)
+
+    def test_deactivation_revokes_token(self):
+        token = AccessToken.for_user(self.user)
+        self.authenticate(token)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_credit_reloads_balance(self):
+        token = AccessToken.for_user(self.user)
+        self.authenticate(token)
+        with self.captureOnCommitCallbacks(execute=True):
+            credit_balance(self.user.pk, Decimal('5'))
+        self.assertEqual(self.authenticate(token).balance, Decimal('5'))
+
+
+class ResponseCacheTests(TestCase):
+    """Polled lists answer 304 until the user's trades change"""
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = User.objects.create_user(email='poll@example.com', username='poll', password='x')
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def poll(self, etag=None):
+        headers = dict(self.headers, **({'If-None-Match': etag} if etag else {}))
+        return self.client.get('/api/binary-options/', headers=headers)
+
+    def create_trade(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return BinaryOptionTrade.objects.create(
+                user=self.user, symbol='BTC', direction='UP', amount=Decimal('10'),
+                entry_price=Decimal('100'), expiry_time=timezone.now(), expiry_seconds=60,
+                profit_percentage=Decimal('85'),
+            )
+
+    def test_unchanged_list_is_not_modified(self):
+        etag = self.poll()['ETag']
+        response = self.poll(etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_create_invalidates(self):
+        etag = self.poll()['ETag']
+        self.create_trade()
+        response = self.poll(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()), 1)
+
+    def test_settlement_invalidates(self):
+        trade = self.create_trade()
+        etag = self.poll()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            settle_trades([trade], {'BTC': Decimal('110')})
+        response = self.poll(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['status'], 'WON')
+
+
+class AnalyticsTests(TestCase):
+    """Aggregates, win rates and streaks of settled trades"""
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = User.objects.create_user(email='stats@example.com', username='stats', password='x')
+        now = timezone.now()
+        # In settlement order: W W L W on BTC/60s, then L on ETH/300s, and one still active
+        for offset, (symbol, direction, expiry, status, payout) in enumerate([
+            ('BTC', 'UP', 60, 'WON', '18.5'),
+            ('BTC', 'DOWN', 60, 'WON', '18.5'),
+            ('BTC', 'UP', 60, 'LOST', '0'),
+            ('BTC', 'UP', 60, 'WON', '18.5'),
+            ('ETH', 'UP', 300, 'LOST', '0'),
+            ('ETH', 'UP', 300, 'ACTIVE', None),
+        ]):
+            trade = BinaryOptionTrade.objects.create(
+                user=self.user, symbol=symbol, direction=direction, amount=Decimal('10'),
+                entry_price=Decimal('100'), expiry_time=now, expiry_seconds=expiry,
+                profit_percentage=Decimal('85'), status=status,
+                payout_amount=Decimal(payout) if payout is not None else None,
+            )
+            BinaryOptionTrade.objects.filter(pk=trade.pk).update(updated_at=now - timedelta(seconds=10 - offset))
+
+    def test_binary_option_aggregates(self):
+        stats = binary_option_stats(self.user)
+        overall = stats['overall']
+        self.assertEqual((overall['trades'], overall['won'], overall['lost']), (5, 3, 2))
+        self.assertEqual(overall['win_rate'], 0.6)
+        self.assertEqual(Decimal(overall['net_pnl']), Decimal('5.5'))
+        self.assertEqual(overall['roi'], 0.11)
+        self.assertEqual(overall['streaks'], {'longest_win': 2, 'longest_loss': 1, 'current': -1})
+        self.assertEqual(stats['by_symbol']['BTC']['streaks'], {'longest_win': 2, 'longest_loss': 1, 'current': 1})
+        self.assertEqual(stats['by_expiry']['60']['win_rate'], 0.75)
+        self.assertEqual(stats['by_expiry']['300']['win_rate'], 0.0)
+        self.assertEqual(stats['by_direction']['DOWN']['trades'], 1)
+
+    def test_streaks(self):
+        stats = BinaryOptionStats()
+        for outcome in 'LLWWWLL':
+            add_outcome(stats, 'WON' if outcome == 'W' else 'LOST', Decimal('10'), Decimal('0'))
+        self.assertEqual((stats.longest_win, stats.longest_loss, stats.current_streak), (3, 2, -2))
+        self.assertEqual((stats.won, stats.lost, stats.staked), (3, 4, Decimal('70')))
+
+    def test_settlement_updates_stats_in_place(self):
+        binary_option_stats(self.user)
+        trades = [
+            BinaryOptionTrade.objects.create(
+                user=self.user, symbol='SOL', direction=direction, amount=Decimal('10'), entry_price=Decimal('100'),
+                expiry_time=timezone.now(), expiry_seconds=120, profit_percentage=Decimal('85'),
+            )
+            for direction in ('UP', 'UP', 'DOWN')
+        ]
+        settle_trades(trades, {'SOL': Decimal('110')})
+        with self.assertNumQueries(1):
+            stats = binary_option_stats(self.user)
+        self.assertEqual(stats['overall']['streaks'], {'longest_win': 2, 'longest_loss': 1, 'current': -1})
+        self.assertEqual(stats['by_symbol']['SOL']['won'], 2)
+        self.assertEqual(list(stats['by_expiry']), ['60', '120', '300'])
+
+        # Rebuilding from the trades gives the same result
+        BinaryOptionStats.objects.filter(user=self.user).delete()
+        self.assertEqual(binary_option_stats(self.user), stats)
+
+    def test_editing_a_settled_trade_rebuilds_stats(self):
+        binary_option_stats(self.user)
+        trade = BinaryOptionTrade.objects.get(user=self.user, symbol='ETH', status='LOST')
+        trade.status = 'WON'
+        trade.payout_amount = Decimal('18.5')
+        trade.save()
+        self.assertFalse(BinaryOptionStats.objects.filter(user=self.user).exists())
+        self.assertEqual(binary_option_stats(self.user)['overall']['won'], 4)
+
+    def test_empty_history(self):
+        user = User.objects.create_user(email='new@example.com', username='new', password='x')
+        stats = binary_option_stats(user)
+        self.assertEqual(stats['overall']['trades'], 0)
+        self.assertIsNone(stats['overall']['win_rate'])
+        self.assertEqual(stats['by_symbol'], {})
+        self.assertEqual(trade_stats(user), {'overall': {'trades': 0, 'realized_pnl': '0', 'roi': None}, 'by_symbol': {}})
+
+    def test_endpoint_is_cached_until_trades_change(self):
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.assertEqual(self.client.get('/api/analytics/', headers=headers).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/analytics/', headers=headers)
+        self.assertEqual(response.json()['binary_options']['overall']['trades'], 5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            settle_trades(list(BinaryOptionTrade.objects.filter(user=self.user, status='ACTIVE')), {'ETH': Decimal('110')})
+        response = self.client.get('/api/analytics/', headers=headers)
+        self.assertEqual(response.json()['binary_options']['overall']['trades'], 6)
+
+
+class TickStoreTests(SimpleTestCase):
+    """Ticks roll up into minute candles that survive a restart"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.store = TickStore(self.directory)
+        self.addCleanup(self.store.close)
+
+    def test_rollups(self):
+        # Two closed minutes and an open third one
+        for timestamp, price in [(60, 10), (90, 12), (119, 9), (120, 11), (150, 15), (180, 14)]:
+            self.assertTrue(self.store.append('BTC', price, timestamp))
+        self.assertFalse(self.store.append('BTC', 1, 180))
+        self.assertEqual(self.store.read('BTC', '1m', 0, 1000), [(60, 10, 12, 9, 9), (120, 11, 15, 11, 15)])
+        self.assertEqual(self.store.candles('BTC', 60, 0, 1000), [
+            [60, 10, 12, 9, 9], [120, 11, 15, 11, 15], [180, 14, 14, 14, 14],
+        ])
+        self.assertEqual(self.store.candles('BTC', 300, 0, 1000), [[0, 10, 15, 9, 14]])
+
+    def test_restart_resumes_open_minute(self):
+        for timestamp, price in [(60, 10), (120, 11), (130, 20)]:
+            self.store.append('BTC', price, timestamp)
+        self.store.close()
+
+        store = TickStore(self.directory)
+        self.addCleanup(store.close)
+        store.append('BTC', 5, 185)
+        self.assertEqual(store.read('BTC', '1m', 0, 1000), [(60, 10, 10, 10, 10), (120, 11, 20, 11, 20)])
+
+    def test_resume_without_minutes_reads_only_the_last_minute(self):
+        for timestamp in (120, 130):
+            self.store.append('BTC', 1, timestamp)
+        self.store.close()
+
+        store = TickStore(self.directory)
+        self.addCleanup(store.close)
+        with mock.patch.object(store, 'ticks', wraps=store.ticks) as ticks:
+            store.append('BTC', 2, 140)
+        self.assertEqual(ticks.call_args.args[1], 120)
+        self.assertEqual(store.candles('BTC', 60, 0, 1000), [[120, 1, 2, 1, 2]])
+
+
+class CandleEndpointTests(TestCase):
+    """Query validation of /api/candles/"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        store = TickStore(directory.name)
+        self.addCleanup(store.close)
+        store.append('BTC', 10, 60)
+        patcher = mock.patch('core.views.get_tick_store', return_value=store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        user = User.objects.create_user(email='candles@example.com', username='candles', password='x')
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+
+    def get(self, query):
+        return self.client.get(f'/api/candles/?{query}', headers=self.headers)
+
+    def test_candles(self):
+        response = self.get('symbol=btc&start=0&end=600')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['candles'], [{'time': 60, 'open': 10, 'high': 10, 'low': 10, 'close': 10}])
+
+    def test_invalid_queries(self):
+        for query in ('symbol=BTC&start=nan', 'symbol=BTC&end=inf', 'symbol=BTC&limit=abc',
+                      'symbol=BTC&start=600&end=0', 'symbol=BTC&interval=2m', 'start=0'):
+            response = self.get(query)
+            self.assertEqual(response.status_code, 400, query)
+        self.assertEqual(self.get('symbol=BTC&limit=abc').json(), {'error': 'limit must be an integer'})
+
+
+@override_settings(DELTA_SYNC_PAGE_SIZE=2, DELTA_SYNC_OVERLAP=0)
+class DeltaSyncTests(TestCase):
+    """/api/binary-options/changes/ sends every change, including ones that commit late"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='sync@example.com', username='sync', password='x')
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.trades = [self.create_trade() for _ in range(3)]
+
+    def create_trade(self):
+        return BinaryOptionTrade.objects.create(
+            user=self.user, symbol='BTC', direction='UP', amount=Decimal('10'),
+            entry_price=Decimal('100'), expiry_time=timezone.now(), expiry_seconds=60,
+        )
+
+    def poll(self, cursor=None):
+        query = f'?cursor={cursor}' if cursor else ''
+        return self.client.get(f'/api/binary-options/changes/{query}', headers=self.headers)
+
+    def sync(self, cursor=None):
+        """Follow has_more to the end; returns (ids, cursor)"""
+        ids = []
+        while True:
+            body = self.poll(cursor).json()
+            ids += [trade['id'] for trade in body['results']]
+            cursor = body['cursor']
+            if not body['has_more']:
+                return ids, cursor
+
+    def test_each_change_is_sent(self):
+        ids, cursor = self.sync()
+        self.assertEqual(ids, [trade.id for trade in self.trades])
+        ids, cursor = self.sync(cursor)
+        self.assertEqual(ids, [])
+
+        self.trades[0].status = 'WON'
+        self.trades[0].save()
+        ids, cursor = self.sync(cursor)
+        self.assertEqual(ids, [self.trades[0].id])
+        self.assertEqual(self.sync(cursor)[0], [])
+
+    @override_settings(DELTA_SYNC_OVERLAP=5)
+    def test_late_commit_behind_the_cursor(self):
+        ids, cursor = self.sync()
+        self.assertEqual(ids, [trade.id for trade in self.trades])
+        # Stamped before the last trade sent, but committed after the poll
+        late = self.create_trade()
+        BinaryOptionTrade.objects.filter(id=late.id).update(
+            updated_at=self.trades[-1].updated_at - timedelta(seconds=1),
+        )
+        ids, cursor = self.sync(cursor)
+        self.assertIn(late.id, ids)
+        # The overlap window is re-sent, so clients dedupe by id
+        self.assertEqual(sorted(ids), sorted([late.id] + [trade.id for trade in self.trades]))
+
+    def test_deletions_are_not_reported(self):
+        _, cursor = self.sync()
+        self.trades[1].delete()
+        self.assertEqual(self.sync(cursor)[0], [])
+        self.assertEqual(self.sync()[0], [self.trades[0].id, self.trades[2].id])
+
+    def test_invalid_cursor(self):
+        for cursor in ('garbage', 'dD14Jmk9MQ=='):  # the second decodes to an invalid time
+            response = self.poll(cursor)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'error': 'Invalid cursor'})
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursor pages seek newest first and are stable while trades are added"""
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = User.objects.create_user(email='pages@example.com', username='pages', password='x')
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.now = timezone.now()
+        # Two trades share a timestamp, so the id breaks the tie
+        self.ids = [self.create(seconds) for seconds in (-50, -40, -40, -30, -20)]
+
+    def create(self, seconds):
+        trade = BinaryOptionTrade.objects.create(
+            user=self.user, symbol='BTC', direction='UP', amount=Decimal('10'),
+            entry_price=Decimal('100'), expiry_time=self.now, expiry_seconds=60,
+        )
+        BinaryOptionTrade.objects.filter(pk=trade.pk).update(created_at=self.now + timedelta(seconds=seconds))
+        return trade.id
+
+    def get(self, url):
+        response = self.client.get(url, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages_seek_newest_first(self):
+        ids, url = [], '/api/binary-options/?page_size=2'
+        while url:
+            page = self.get(url)
+            self.assertLessEqual(len(page['results']), 2)
+            ids += [trade['id'] for trade in page['results']]
+            url = page['next']
+        expected = [self.ids[4], self.ids[3], max(self.ids[1:3]), min(self.ids[1:3]), self.ids[0]]
+        self.assertEqual(ids, expected)
+
+    def test_next_cursor_is_stable_across_inserts(self):
+        first = self.get('/api/binary-options/?page_size=2')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create(0)
+            self.create(-45)
+        second = self.get(first['next'])
+        # The newer trade is not on later pages; the older one slots in by time
+        self.assertEqual([trade['id'] for trade in second['results']], [max(self.ids[1:3]), min(self.ids[1:3])])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/binary-options/?cursor=garbage', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'detail': 'Invalid cursor'})
+
+
+class MetricsTests(TestCase):
+    """MetricsMiddleware samples and the /metrics endpoint"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='metrics@example.com', username='metrics', password='x')
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.trades = [
+            BinaryOptionTrade.objects.create(
+                user=self.user, symbol='BTC', direction='UP', amount=Decimal('10'), entry_price=Decimal('100'),
+                expiry_time=timezone.now() + timedelta(minutes=1), expiry_seconds=60,
+            )
+            for _ in range(2)
+        ]
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_request_is_recorded(self):
+        labels = {'view': 'binary-options-detail', 'method': 'GET', 'status': '200'}
+        requests_before = self.sample('cryptrade_request_duration_seconds_count', **labels)
+        latency_before = self.sample('cryptrade_request_duration_seconds_sum', **labels)
+        queries_before = self.sample('cryptrade_request_db_queries_sum', view='binary-options-detail')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/binary-options/{self.trades[0].pk}/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(len(queries), 0)
+        self.assertEqual(self.sample('cryptrade_request_duration_seconds_count', **labels), requests_before + 1)
+        self.assertGreater(self.sample('cryptrade_request_duration_seconds_sum', **labels), latency_before)
+        self.assertEqual(self.sample('cryptrade_request_db_queries_sum', view='binary-options-detail'), queries_before + len(queries))
+
+    def test_views_are_labelled_by_route(self):
+        labels = {'view': 'binary-options-detail', 'method': 'GET', 'status': '200'}
+        before = self.sample('cryptrade_request_duration_seconds_count', **labels)
+        unresolved_before = self.sample('cryptrade_request_duration_seconds_count', view='unresolved', method='GET', status='404')
+        for trade in self.trades:
+            self.client.get(f'/api/binary-options/{trade.pk}/', headers=self.headers)
+        self.client.get('/no-such-page/12345/')
+        self.assertEqual(self.sample('cryptrade_request_duration_seconds_count', **labels), before + 2)
+        self.assertEqual(self.sample('cryptrade_request_duration_seconds_count', view='unresolved', method='GET', status='404'), unresolved_before + 1)
+        views = {
+            sample.labels['view']
+            for metric in REGISTRY.collect() if metric.name == 'cryptrade_request_duration_seconds'
+            for sample in metric.samples
+        }
+        self.assertFalse([view for view in views if '/' in view or str(self.trades[0].pk) in view])
+
+    def test_exposition(self):
+        self.client.get(f'/api/binary-options/{self.trades[0].pk}/', headers=self.headers)
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], CONTENT_TYPE_LATEST)
+        self.assertIn(b'cryptrade_request_duration_seconds_count{method="GET",status="200",view="binary-options-detail"}', response.content)
+        self.assertIn(b'cryptrade_request_db_queries_bucket{le="0.0",view="binary-options-detail"}', response.content)
+
+    @override_settings(METRICS_TOKEN='scrape-token')
+    def test_exposition_requires_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code, 403)
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer scrape-token'}).status_code, 200)
+
+
+class ProfilingMiddlewareTests(TestCase):
+    """ProfilingMiddleware is removed when disabled and dumps profiles when asked"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        caches['default'].clear()
+        self.user = User.objects.create_user(email='profile@example.com', username='profile', password='x')
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    @override_settings(PROFILING_TOKEN=None, PROFILING_SAMPLE_RATE=0.0)
+    def test_disabled(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            ProfilingMiddleware(lambda request: HttpResponse())
+
+    def test_profiles_requests_with_the_token(self):
+        with override_settings(PROFILING_TOKEN='profile-token', PROFILING_SAMPLE_RATE=0.0, PROFILING_DIR=self.directory):
+            response = self.client.get('/api/analytics/', headers={**self.headers, 'X-Profile': 'profile-token'})
+            self.client.get('/api/analytics/', headers=self.headers)
+            self.client.get('/api/analytics/', headers={**self.headers, 'X-Profile': 'wrong'})
+        self.assertEqual(response.status_code, 200)
+        [name] = os.listdir(self.directory)
+        self.assertRegex(name, r'^analytics-\d+\.\d{3}-\d+ms\.prof$')
+        stats = pstats.Stats(os.path.join(self.directory, name))
+        self.assertIn(('views.py', 'analytics'), {(os.path.basename(filename), function) for filename, _, function in stats.stats})
+
+    def test_sampling(self):
+        with override_settings(PROFILING_TOKEN=None, PROFILING_SAMPLE_RATE=1.0, PROFILING_DIR=self.directory):
+            self.client.get('/api/analytics/', headers=self.headers)
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+
+class LiveUpdatesConsumerTests(TransactionTestCase):
+    """/ws/live/ authenticates, validates subscriptions and fans out pushes"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='live@example.com', username='live', password='x')
+        self.other = User.objects.create_user(email='live2@example.com', username='live2', password='x')
+        self.trade = BinaryOptionTrade.objects.create(
+            user=self.user, symbol='BTC', direction='UP', amount=Decimal('10'), profit_percentage=Decimal('85'),
+            entry_price=Decimal('100'), expiry_time=timezone.now(), expiry_seconds=60,
+            status='WON', exit_price=Decimal('101'), payout_amount=Decimal('18.5'),
+        )
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/live/?token={AccessToken.for_user(user)}')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def send(self, communicator, message):
+        await communicator.send_json_to(message)
+        return await communicator.receive_json_from()
+
+    async def test_rejects_bad_token(self):
+        for path in ('/ws/live/', '/ws/live/?token=garbage'):
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path)
+            connected, code = await communicator.connect()
+            self.assertEqual((connected, code), (False, 4401))
+
+    async def test_subscribe_and_unsubscribe(self):
+        communicator = await self.connect(self.user)
+        reply = await self.send(communicator, {'action': 'subscribe', 'symbols': ['btc', 'ETH']})
+        self.assertEqual(reply, {'type': 'subscriptions', 'symbols': ['BTC', 'ETH']})
+        reply = await self.send(communicator, {'action': 'unsubscribe', 'symbols': ['BTC']})
+        self.assertEqual(reply, {'type': 'subscriptions', 'symbols': ['ETH']})
+        await communicator.disconnect()
+
+    async def test_bad_messages_get_an_error_frame(self):
+        communicator = await self.connect(self.user)
+        for message in ([1], 'subscribe', {'action': 'subscribe'}, {'action': 'subscribe', 'symbols': ['BTC/USDT']},
+                        {'action': 'subscribe', 'symbols': ['ÉTH']}, {'action': 'subscribe', 'symbols': ['A' * 300]},
+                        {'action': 'subscribe', 'symbols': [7]},
+                        {'action': 'subscribe', 'symbols': [f'S{n}' for n in range(MAX_SUBSCRIPTIONS + 1)]}):
+            reply = await self.send(communicator, message)
+            self.assertEqual(reply['type'], 'error', message)
+        await communicator.send_to(text_data='{not json')
+        self.assertEqual((await communicator.receive_json_from())['type'], 'error')
+        # The socket is still usable and nothing was subscribed
+        reply = await self.send(communicator, {'action': 'subscribe', 'symbols': []})
+        self.assertEqual(reply, {'type': 'subscriptions', 'symbols': []})
+        await communicator.disconnect()
+
+    async def test_price_fan_out(self):
+        subscribed = await self.connect(self.user)
+        await self.send(subscribed, {'action': 'subscribe', 'symbols': ['BTC']})
+        other = await self.connect(self.other)
+        await self.send(other, {'action': 'subscribe', 'symbols': ['ETH']})
+        await sync_to_async(publish_prices)({'BTC': Decimal('101.5')})
+        self.assertEqual(await subscribed.receive_json_from(), {'type': 'price', 'symbol': 'BTC', 'price': '101.5'})
+        self.assertTrue(await other.receive_nothing())
+        await subscribed.disconnect()
+        await other.disconnect()
+
+    async def test_trade_updates_reach_only_the_owner(self):
+        owner = await self.connect(self.user)
+        other = await self.connect(self.other)
+        await sync_to_async(publish_trade_updates)([self.trade])
+        self.assertEqual(await owner.receive_json_from(), {'type': 'trade', 'trade': {
+            'id': self.trade.id, 'symbol': 'BTC', 'status': 'WON', 'exit_price': '101', 'payout_amount': '18.5',
+        }})
+        self.assertTrue(await other.receive_nothing())
+        await owner.disconnect()
+        await other.disconnect()
@@ -0,0 +1,148 @@
+"""
+Recent price ticks per symbol, for pricing trades at an exact instant.
+
+Prices ``market_data`` fetches for tracked symbols are recorded in a
+fixed-size ring buffer per symbol, so settlement and ``close_early`` can look
+up the price in effect at ``expiry_time`` with a binary search instead of
+using whatever price is current when the trade happens to be processed. A
+symbol is tracked once it is looked up by name or has ACTIVE trades; the rest
+of a bulk ticker (every USDT pair) is not kept. Instants the in-process
+buffer does not cover are looked up in the on-disk tick store written by
+``broadcast_prices``.
+"""
+import threading
+import time
+from array import array
+from decimal import Decimal
+
+from django.conf import settings
+
+from .candles import get_tick_store
+
+# Prices are stored as integer multiples of 1e-8, the precision of the price
+# columns, so a buffer is two flat arrays of 8-byte values
+PRICE_PLACES = 8
+
+
+def to_units(price):
+    return int(Decimal(str(price)).scaleb(PRICE_PLACES).to_integral_value())
+
+
+def from_units(units):
+    return Decimal(units).scaleb(-PRICE_PLACES)
+
+
+class TickRingBuffer:
+    """The last ``capacity`` (timestamp, price) ticks of one symbol, oldest first"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._times = array('d', bytes(8 * capacity))
+        self._prices = array('q', bytes(8 * capacity))
+        self._start = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def append(self, timestamp, price):
+        """Add a tick; returns False if it is not newer than the latest one"""
+        units = to_units(price)
+        if not -2 ** 63 <= units < 2 ** 63:
+            return False
+        with self._lock:
+            if self._size:
+                latest = (self._start + self._size - 1) % self.capacity
+                if timestamp <= self._times[latest]:
+                    return False
+            if self._size < self.capacity:
+                index = (self._start + self._size) % self.capacity
+                self._size += 1
+            else:
+                # Full: overwrite the oldest tick
+                index = self._start
+                self._start = (self._start + 1) % self.capacity
+            self._times[index] = timestamp
+            self._prices[index] = units
+            return True
+
+    def price_at(self, timestamp, max_gap):
+        """
+        Price in effect at ``timestamp``: the latest tick at or before it, if
+        that tick is at most ``max_gap`` seconds older. Otherwise None.
+        """
+        with self._lock:
+            # Binary search over logical positions 0.._size-1 for the first tick after timestamp
+            lo, hi = 0, self._size
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self._times[(self._start + mid) % self.capacity] <= timestamp:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            if lo == 0:
+                return None
+            index = (self._start + lo - 1) % self.capacity
+            if timestamp - self._times[index] > max_gap:
+                return None
+            return from_units(self._prices[index])
+
+
+class TickHistory:
+    """Per-symbol ``TickRingBuffer``s plus a fallback to the on-disk tick store"""
+
+    def __init__(self, capacity=None, max_gap=None):
+        self.capacity = capacity if capacity is not None else getattr(settings, 'TICK_HISTORY_SIZE', 3600)
+        self.max_gap = max_gap if max_gap is not None else getattr(settings, 'TICK_HISTORY_MAX_GAP', 5.0)
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    def _buffer(self, symbol):
+        buffer = self._buffers.get(symbol)
+        if buffer is None:
+            with self._lock:
+                buffer = self._buffers.setdefault(symbol, TickRingBuffer(self.capacity))
+        return buffer
+
+    def track(self, symbols):
+        """Start keeping ticks of ``symbols`` from ``record_many``"""
+        for symbol in symbols:
+            self._buffer(symbol.upper())
+
+    def record(self, symbol, price, timestamp=None):
+        """Record one tick, tracking ``symbol`` from now on"""
+        self._buffer(symbol.upper()).append(time.time() if timestamp is None else timestamp, price)
+
+    def record_many(self, prices, timestamp=None):
+        """Record the ticks of tracked symbols in a symbol -> price map; others are dropped"""
+        timestamp = time.time() if timestamp is None else timestamp
+        for symbol, price in prices.items():
+            buffer = self._buffers.get(symbol.upper())
+            if buffer is not None:
+                buffer.append(timestamp, price)
+
+    def price_at(self, symbol, when):
+        """
+        Decimal price of ``symbol`` in effect at ``when`` (a datetime or epoch
+        seconds), or None if no tick within ``max_gap`` before it is known.
+        """
+        symbol = symbol.upper()
+        timestamp = when if isinstance(when, (int, float)) else when.timestamp()
+        if timestamp > time.time():
+            return None
+        buffer = self._buffers.get(symbol)
+        price = buffer.price_at(timestamp, self.max_gap) if buffer is not None else None
+        if price is not None:
+            return price
+
+        try:
+            stored = get_tick_store().ticks(symbol, timestamp - self.max_gap, timestamp + 1e-6)
+        except (ValueError, OSError):
+            return None
+        if not stored:
+            return None
+        return Decimal(repr(stored[-1][1]))
+
+
+tick_history = TickHistory()
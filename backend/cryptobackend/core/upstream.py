@@ -0,0 +1,214 @@
+"""
+Resilient client for upstream HTTP APIs (the Binance ticker).
+
+``UpstreamClient`` wraps one keep-alive ``requests.Session`` per process for
+sync callers and the per-loop aiohttp session from ``core.async_http`` for
+async ones (or the sync session from a thread, on loops that end with the
+request). Every call has separate connect and read deadlines, is retried a
+bounded number of times with full-jitter exponential backoff, and goes
+through a ``CircuitBreaker`` shared by both paths: after
+``UPSTREAM_BREAKER_THRESHOLD`` consecutive failures calls fail fast with
+``CircuitOpen`` for ``UPSTREAM_BREAKER_RESET`` seconds, then a single probe
+decides whether the circuit closes again. Callers such as ``market_data``
+fall back to last-known values on ``UpstreamError``.
+"""
+import asyncio
+import random
+import threading
+import time
+
+import aiohttp
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .async_http import get_session, loop_is_short_lived
+from .metrics import (
+    CIRCUIT_STATE, CIRCUIT_TRANSITIONS, TIMEOUT_ERRORS, UPSTREAM_REJECTED, UPSTREAM_RETRIES, observe_upstream,
+)
+
+# Statuses worth retrying: rate limiting and server-side failures
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    """Raised when an upstream call fails after its retries"""
+
+
+class CircuitOpen(UpstreamError):
+    """Raised without calling the upstream while its circuit breaker is open"""
+
+
+class UpstreamStatusError(UpstreamError):
+    """Raised for a non-2xx upstream response"""
+
+    def __init__(self, target, status):
+        super().__init__(f'{target} returned HTTP {status}')
+        self.status = status
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe"""
+
+    CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+    GAUGE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name, failure_threshold=None, reset_timeout=None):
+        self.name = name
+        self.failure_threshold = failure_threshold or getattr(settings, 'UPSTREAM_BREAKER_THRESHOLD', 5)
+        self.reset_timeout = reset_timeout if reset_timeout is not None else getattr(settings, 'UPSTREAM_BREAKER_RESET', 30.0)
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        CIRCUIT_STATE.labels(name).set(0)
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def allow(self):
+        """Whether a call may go upstream now; an open circuit lets one probe through after the reset timeout"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._transition(self.HALF_OPEN)
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            if self._state != self.CLOSED:
+                self._transition(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                if self._state != self.OPEN:
+                    self._transition(self.OPEN)
+
+    def release(self):
+        """Give up a half-open probe that ended without a verdict (e.g. a cancelled request)"""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                # opened_at is unchanged, so the next call probes straight away
+                self._transition(self.OPEN)
+
+    def _transition(self, state):
+        self._state = state
+        CIRCUIT_STATE.labels(self.name).set(self.GAUGE_VALUES[state])
+        CIRCUIT_TRANSITIONS.labels(self.name, state).inc()
+
+
+class UpstreamClient:
+    """GET JSON from one upstream with deadlines, jittered retries and a circuit breaker"""
+
+    def __init__(self, name, connect_timeout=None, read_timeout=None, retries=None,
+                 backoff=None, max_backoff=None, breaker=None):
+        self.name = name
+        self.connect_timeout = connect_timeout or getattr(settings, 'UPSTREAM_CONNECT_TIMEOUT', 3.0)
+        self.read_timeout = read_timeout or getattr(settings, 'UPSTREAM_READ_TIMEOUT', 5.0)
+        self.retries = retries if retries is not None else getattr(settings, 'UPSTREAM_RETRIES', 2)
+        self.backoff = backoff if backoff is not None else getattr(settings, 'UPSTREAM_RETRY_BACKOFF', 0.1)
+        self.max_backoff = max_backoff if max_backoff is not None else getattr(settings, 'UPSTREAM_RETRY_MAX_BACKOFF', 1.0)
+        self.breaker = breaker or CircuitBreaker(name)
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        """Keep-alive ``requests.Session`` shared by every thread in the process"""
+        with self._session_lock:
+            if self._session is None:
+                pool_size = getattr(settings, 'UPSTREAM_POOL_SIZE', 20)
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._session = session
+            return self._session
+
+    def get_json(self, url, params=None):
+        """GET ``url`` and return its decoded JSON body"""
+        for attempt in range(self.retries + 1):
+            self._check_circuit()
+            try:
+                with observe_upstream(self.name):
+                    response = self.session.get(url, params=params, timeout=(self.connect_timeout, self.read_timeout))
+                    if response.status_code >= 400:
+                        raise UpstreamStatusError(self.name, response.status_code)
+                    data = response.json()
+            except Exception as e:
+                if not self._record_failure(e, attempt):
+                    raise self._wrap(e)
+                time.sleep(self._backoff(attempt))
+                continue
+            self.breaker.record_success()
+            return data
+
+    async def aget_json(self, url, params=None):
+        """``get_json`` over the event loop's shared aiohttp session"""
+        if loop_is_short_lived():
+            # A session opened on this loop would die with it after one
+            # request; the keep-alive requests.Session outlives it
+            return await sync_to_async(self.get_json, thread_sensitive=False)(url, params)
+        timeout = aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout)
+        for attempt in range(self.retries + 1):
+            self._check_circuit()
+            try:
+                with observe_upstream(self.name):
+                    async with get_session().get(url, params=params, timeout=timeout) as response:
+                        if response.status >= 400:
+                            raise UpstreamStatusError(self.name, response.status)
+                        data = await response.json(content_type=None)
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                if not self._record_failure(e, attempt):
+                    raise self._wrap(e)
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            self.breaker.record_success()
+            return data
+
+    def _check_circuit(self):
+        if not self.breaker.allow():
+            UPSTREAM_REJECTED.labels(self.name).inc()
+            raise CircuitOpen(f'{self.name} circuit is open')
+
+    def _record_failure(self, error, attempt):
+        """Feed ``error`` to the breaker and return whether the call should be retried"""
+        status = getattr(error, 'status', None)
+        if isinstance(error, UpstreamStatusError) and status not in RETRY_STATUSES:
+            # The upstream answered; a bad request says nothing about its health
+            self.breaker.record_success()
+            return False
+        self.breaker.record_failure()
+        if attempt >= self.retries:
+            return False
+        if isinstance(error, TIMEOUT_ERRORS):
+            reason = 'timeout'
+        elif status is not None:
+            reason = str(status)
+        else:
+            reason = 'error'
+        UPSTREAM_RETRIES.labels(self.name, reason).inc()
+        return True
+
+    def _backoff(self, attempt):
+        """Full jitter: a random delay up to the capped exponential backoff"""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _wrap(self, error):
+        if isinstance(error, UpstreamError):
+            return error
+        wrapped = UpstreamError(f'{self.name} request failed: {error!r}')
+        wrapped.__cause__ = error
+        return wrapped
@@ -1,4 +1,3 @@
-from django.shortcuts import render
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
@@ -6,16 +5,31 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import get_user_model
 from .models import Portfolio, Trade, ApiKey, BinaryOptionTrade
 from .serializers import UserSerializer, PortfolioSerializer, TradeSerializer, ApiKeySerializer, BinaryOptionTradeSerializer
-import requests
+from .market_data import market_data, fetch_exchange_prices
+from .exchanges import get_exchange, UnsupportedExchange
+from .candles import INTERVALS, get_tick_store
+from .analytics import binary_option_stats, trade_stats
+from .pagination import BinaryOptionCursorPagination, TradeCursorPagination, decode_position, encode_position
+from .response_cache import bump_on_commit, versioned_response
+from .async_views import (
+    close_early, create_binary_option, create_binary_options_batch, create_trade, create_trades_batch, run_handler,
+)
+from .fast_serializers import ValuesListMixin, get_values_serializer
 from decimal import Decimal
-import ccxt
-import json
 from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from datetime import timedelta
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+import logging
+import math
 import os
+import time
+
+logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
@@ -51,48 +65,28 @@ class ApiKeyViewSet(viewsets.ModelViewSet):
     def test_connection(self, request, pk=None):
         api_key = self.get_object()
         try:
-            # Initialize the exchange
-            if api_key.exchange == 'BINANCE':
-                exchange = ccxt.binance({
-                    'apiKey': api_key.api_key,
-                    'secret': api_key.api_secret,
-                })
-            elif api_key.exchange == 'COINBASE':
-                exchange = ccxt.coinbase({
-                    'apiKey': api_key.api_key,
-                    'secret': api_key.api_secret,
-                })
-            elif api_key.exchange == 'KRAKEN':
-                exchange = ccxt.kraken({
-                    'apiKey': api_key.api_key,
-                    'secret': api_key.api_secret,
-                })
-            elif api_key.exchange == 'KUCOIN':
-                exchange = ccxt.kucoin({
-                    'apiKey': api_key.api_key,
-                    'secret': api_key.api_secret,
-                })
-            elif api_key.exchange == 'BITFINEX':
-                exchange = ccxt.bitfinex({
-                    'apiKey': api_key.api_key,
-                    'secret': api_key.api_secret,
-                })
-            else:
-                return Response({'error': 'Unsupported exchange'}, status=status.HTTP_400_BAD_REQUEST)
+            # Get the pooled client for this key
+            exchange = get_exchange(api_key)
             
             # Test connection by fetching balance
-            balance = exchange.fetch_balance()
+            exchange.fetch_balance()
             return Response({'status': 'success', 'message': 'Connection successful!'}, status=status.HTTP_200_OK)
+        except UnsupportedExchange:
+            return Response({'error': 'Unsupported exchange'}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({'status': 'error', 'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-class PortfolioViewSet(viewsets.ModelViewSet):
+class PortfolioViewSet(ValuesListMixin, viewsets.ModelViewSet):
     serializer_class = PortfolioSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         return Portfolio.objects.filter(user=self.request.user)
 
+    @versioned_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
     @action(detail=False, methods=['get'])
     def total_value(self, request):
         portfolios = self.get_queryset()
@@ -105,46 +99,40 @@ class PortfolioViewSet(viewsets.ModelViewSet):
                 # Choose the first active API key
                 api_key = api_keys.first()
                 
-                # Initialize the exchange based on the API key
-                if api_key.exchange == 'BINANCE':
-                    exchange = ccxt.binance({
-                        'apiKey': api_key.api_key,
-                        'secret': api_key.api_secret,
-                    })
-                elif api_key.exchange == 'COINBASE':
-                    exchange = ccxt.coinbase({
-                        'apiKey': api_key.api_key,
-                        'secret': api_key.api_secret,
-                    })
-                # Add more exchanges as needed
+                # Get the pooled client for this key
+                exchange = get_exchange(api_key)
                 
                 # Fetch balances directly from the exchange
                 balances = exchange.fetch_balance()
+                holdings = {
+                    currency: Decimal(str(amount))
+                    for currency, amount in balances['total'].items()
+                    if amount > 0 and currency != 'USDT'
+                }
                 
-                # Calculate the total value
-                for currency, amount in balances['total'].items():
-                    if amount > 0 and currency != 'USDT':
-                        try:
-                            ticker = exchange.fetch_ticker(f'{currency}/USDT')
-                            price = Decimal(str(ticker['last']))
-                            total_value += Decimal(str(amount)) * price
-                        except:
-                            continue
+                # Price every holding with one bulk ticker request, or
+                # concurrent ones; holdings that miss the deadline are skipped
+                prices = fetch_exchange_prices(exchange, holdings)
+                for currency, amount in holdings.items():
+                    if currency in prices:
+                        total_value += amount * prices[currency]
                 
-                return Response({'total_value': str(total_value), 'source': 'exchange_api'})
+                return Response({
+                    'total_value': str(total_value),
+                    'source': 'exchange_api',
+                    'partial': len(prices) < len(holdings),
+                })
                 
-            except Exception as e:
+            except Exception:
                 # Fallback to regular method
-                pass
+                logger.warning('Exchange valuation failed for user %s, using public prices', request.user.pk, exc_info=True)
         
         # Fallback: Use Binance public API
+        portfolios = list(portfolios)
+        prices = market_data.get_prices(portfolio.symbol for portfolio in portfolios)
         for portfolio in portfolios:
-            try:
-                response = requests.get(f'https://api.binance.com/api/v3/ticker/price?symbol={portfolio.symbol}USDT')
-                current_price = Decimal(response.json()['price'])
-                total_value += portfolio.quantity * current_price
-            except:
-                continue
+            if portfolio.symbol.upper() in prices:
+                total_value += portfolio.quantity * prices[portfolio.symbol.upper()]
         
         return Response({'total_value': str(total_value), 'source': 'public_api'})
 
@@ -155,43 +143,54 @@ class PortfolioViewSet(viewsets.ModelViewSet):
         try:
             api_key = ApiKey.objects.get(id=api_key_id, user=request.user, is_active=True)
             
-            # Initialize the exchange
-            if api_key.exchange == 'BINANCE':
-                exchange = ccxt.binance({
-                    'apiKey': api_key.api_key,
-                    'secret': api_key.api_secret,
-                })
-            # Add more exchanges as needed
+            # Get the pooled client for this key
+            exchange = get_exchange(api_key)
             
             # Fetch balances
             balances = exchange.fetch_balance()
             
-            # Update or create portfolio entries
+            holdings = {
+                currency: amount
+                for currency, amount in balances['total'].items()
+                if amount > 0 and currency != 'USDT'
+            }
+            
+            # Get current prices for every holding at once
+            prices = fetch_exchange_prices(exchange, holdings)
+            
+            # Build every portfolio entry in memory
+            entries = []
             synced_items = []
-            for currency, amount in balances['total'].items():
-                if amount > 0 and currency != 'USDT':
-                    # Get current price
-                    try:
-                        ticker = exchange.fetch_ticker(f'{currency}/USDT')
-                        price = Decimal(str(ticker['last']))
-                        
-                        # Update or create portfolio entry
-                        portfolio, created = Portfolio.objects.update_or_create(
-                            user=request.user,
-                            symbol=currency,
-                            defaults={
-                                'quantity': Decimal(str(amount)),
-                                'average_buy_price': price  # This is an approximation
-                            }
-                        )
-                        
-                        synced_items.append({
-                            'symbol': currency,
-                            'quantity': str(amount),
-                            'price': str(price)
-                        })
-                    except:
-                        continue
+            for currency, amount in holdings.items():
+                if currency not in prices:
+                    continue
+                price = prices[currency]
+                entries.append(Portfolio(
+                    user=request.user,
+                    symbol=currency,
+                    quantity=Decimal(str(amount)),
+                    average_buy_price=price  # This is an approximation
+                ))
+                synced_items.append({
+                    'symbol': currency,
+                    'quantity': str(amount),
+                    'price': str(price)
+                })
+            
+            # Upsert all entries on (user, symbol) in one statement and zero
+            # out holdings that are no longer on the exchange
+            upsert_options = {
+                'update_conflicts': True,
+                'update_fields': ['quantity', 'average_buy_price', 'last_updated'],
+            }
+            if connection.features.supports_update_conflicts_with_target:
+                upsert_options['unique_fields'] = ['user', 'symbol']
+            with transaction.atomic():
+                Portfolio.objects.bulk_create(entries, **upsert_options)
+                Portfolio.objects.filter(user=request.user).exclude(
+                    symbol__in=holdings.keys()
+                ).exclude(quantity=0).update(quantity=0)
+                bump_on_commit([request.user.pk])
             
             return Response({
                 'status': 'success', 
@@ -210,141 +209,30 @@ class PortfolioViewSet(viewsets.ModelViewSet):
                 'message': str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class TradeViewSet(viewsets.ModelViewSet):
+class TradeViewSet(ValuesListMixin, viewsets.ModelViewSet):
     serializer_class = TradeSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = TradeCursorPagination
 
     def get_queryset(self):
         return Trade.objects.filter(user=self.request.user)
 
+    @versioned_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
     def create(self, request, *args, **kwargs):
-        symbol = request.data.get('symbol')
-        quantity = Decimal(request.data.get('quantity'))
-        trade_type = request.data.get('trade_type')
-        exchange_name = request.data.get('exchange')
-        api_key_id = request.data.get('api_key_id')
-        
-        # Check if using an exchange API or public API
-        if api_key_id:
-            try:
-                api_key = ApiKey.objects.get(id=api_key_id, user=request.user, is_active=True)
-                
-                # Initialize the exchange
-                if api_key.exchange == 'BINANCE':
-                    exchange = ccxt.binance({
-                        'apiKey': api_key.api_key,
-                        'secret': api_key.api_secret,
-                    })
-                # Add more exchanges as needed
-                
-                # Execute the trade
-                symbol_pair = f"{symbol}/USDT"
-                
-                if trade_type == 'BUY':
-                    order = exchange.create_market_buy_order(symbol_pair, float(quantity))
-                else:  # SELL
-                    order = exchange.create_market_sell_order(symbol_pair, float(quantity))
-                
-                # Calculate average price and total amount
-                price = Decimal(str(order['price'])) if 'price' in order else Decimal(str(order['average']))
-                total_amount = price * quantity
-                
-                # Create trade record
-                trade_data = {
-                    'symbol': symbol,
-                    'trade_type': trade_type,
-                    'quantity': quantity,
-                    'price': price,
-                    'total_amount': total_amount,
-                    'exchange': api_key.exchange,
-                }
-                
-                serializer = self.get_serializer(data=trade_data)
-                if serializer.is_valid():
-                    serializer.save(user=request.user)
-                    
-                    # Update portfolio
-                    self._update_portfolio(request.user, symbol, trade_type, quantity, price)
-                    
-                    return Response(serializer.data, status=status.HTTP_201_CREATED)
-                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-                
-            except ApiKey.DoesNotExist:
-                return Response({
-                    'status': 'error',
-                    'message': 'API key not found or inactive'
-                }, status=status.HTTP_400_BAD_REQUEST)
-            except Exception as e:
-                return Response({
-                    'status': 'error',
-                    'message': str(e)
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
-        # Fallback to mock trading using public API
-        try:
-            response = requests.get(f'https://api.binance.com/api/v3/ticker/price?symbol={symbol}USDT')
-            current_price = Decimal(response.json()['price'])
-        except:
-            return Response({'error': 'Failed to fetch current price'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Calculate total amount
-        total_amount = quantity * current_price
-
-        # Create trade record
-        trade_data = {
-            'symbol': symbol,
-            'trade_type': trade_type,
-            'quantity': quantity,
-            'price': current_price,
-            'total_amount': total_amount,
-            'exchange': 'PUBLIC_API',
-        }
-        
-        serializer = self.get_serializer(data=trade_data)
-        if serializer.is_valid():
-            serializer.save(user=request.user)
-            
-            # Update portfolio
-            self._update_portfolio(request.user, symbol, trade_type, quantity, current_price)
-            
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-    
-    def _update_portfolio(self, user, symbol, trade_type, quantity, price):
-        try:
-            portfolio, created = Portfolio.objects.get_or_create(
-                user=user,
-                symbol=symbol,
-                defaults={
-                    'quantity': 0,
-                    'average_buy_price': 0
-                }
-            )
-            
-            if trade_type == 'BUY':
-                # Calculate new average buy price
-                total_value = (portfolio.quantity * portfolio.average_buy_price) + (quantity * price)
-                new_quantity = portfolio.quantity + quantity
-                if new_quantity > 0:
-                    new_avg_price = total_value / new_quantity
-                else:
-                    new_avg_price = 0
-                
-                portfolio.quantity = new_quantity
-                portfolio.average_buy_price = new_avg_price
-            else:  # SELL
-                portfolio.quantity = max(0, portfolio.quantity - quantity)
-                # We don't change the average buy price when selling
-            
-            portfolio.save()
-        except Exception as e:
-            # Log the error but don't interrupt the trade
-            print(f"Error updating portfolio: {str(e)}")
-    
+        # /api/trades/ is served by the async view; this covers the other routes
+        return run_handler(create_trade, request)
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request, *args, **kwargs):
+        """Place a basket of trades in one request"""
+        return run_handler(create_trades_batch, request)
+
     @action(detail=False, methods=['get'])
     def current_prices(self, request):
         symbols = ['BTC', 'ETH', 'BNB', 'ADA', 'DOGE', 'XRP', 'SOL', 'DOT', 'AVAX', 'MATIC']
-        prices = {}
         
         # Try to use user's API keys first
         api_keys = ApiKey.objects.filter(user=request.user, is_active=True)
@@ -353,21 +241,14 @@ class TradeViewSet(viewsets.ModelViewSet):
                 # Choose the first active API key
                 api_key = api_keys.first()
                 
-                # Initialize the exchange
-                if api_key.exchange == 'BINANCE':
-                    exchange = ccxt.binance({
-                        'apiKey': api_key.api_key,
-                        'secret': api_key.api_secret,
-                    })
-                # Add more exchanges as needed
+                # Get the pooled client for this key
+                exchange = get_exchange(api_key)
                 
-                # Fetch tickers for all symbols
-                for symbol in symbols:
-                    try:
-                        ticker = exchange.fetch_ticker(f'{symbol}/USDT')
-                        prices[symbol] = str(ticker['last'])
-                    except:
-                        continue
+                # Fetch tickers for all symbols in one request
+                prices = {
+                    symbol: str(price)
+                    for symbol, price in fetch_exchange_prices(exchange, symbols).items()
+                }
                 
                 return Response(prices)
             except:
@@ -375,66 +256,39 @@ class TradeViewSet(viewsets.ModelViewSet):
                 pass
         
         # Fallback: Use Binance public API
-        for symbol in symbols:
-            try:
-                response = requests.get(f'https://api.binance.com/api/v3/ticker/price?symbol={symbol}USDT')
-                prices[symbol] = response.json()['price']
-            except:
-                continue
+        prices = {symbol: str(price) for symbol, price in market_data.get_prices(symbols).items()}
         
         return Response(prices)
 
-class BinaryOptionTradeViewSet(viewsets.ModelViewSet):
+def _first_expiry(data):
+    """Earliest expiry_time in a (possibly paginated) list of serialized trades"""
+    rows = data['results'] if isinstance(data, dict) else data
+    expiries = [parse_datetime(row['expiry_time']) for row in rows if row.get('expiry_time')]
+    return min(expiries) if expiries else None
+
+class BinaryOptionTradeViewSet(ValuesListMixin, viewsets.ModelViewSet):
     serializer_class = BinaryOptionTradeSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = BinaryOptionCursorPagination
 
     def get_queryset(self):
         return BinaryOptionTrade.objects.filter(user=self.request.user).order_by('-created_at')
 
+    @versioned_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
     def create(self, request, *args, **kwargs):
-        data = request.data.copy()
-        
-        # Check if entry_price is provided by client
-        client_entry_price = data.get('entry_price')
-        
-        # Only fetch price from API if entry_price is not provided
-        if not client_entry_price:
-            # Get current price from public API
-            symbol = data.get('symbol')
-            try:
-                response = requests.get(f'https://api.binance.com/api/v3/ticker/price?symbol={symbol}USDT')
-                current_price = Decimal(response.json()['price'])
-                data['entry_price'] = current_price
-            except Exception as e:
-                return Response({
-                    'status': 'error',
-                    'message': f'Failed to fetch current price: {str(e)}'
-                }, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Map trade_type to direction if needed
-        if 'trade_type' in data and 'direction' not in data:
-            data['direction'] = 'UP' if data.pop('trade_type') == 'BUY' else 'DOWN'
-        
-        # Set default profit percentage if not provided
-        if 'profit_percentage' not in data:
-            data['profit_percentage'] = 85.0
-            
-        # Convert quantity to amount if needed
-        if 'quantity' in data and 'amount' not in data:
-            data['amount'] = data.pop('quantity')
-            
-        serializer = self.get_serializer(data=data)
-        if serializer.is_valid():
-            serializer.save(user=request.user)
-            
-            # Schedule a task to process this trade when it expires
-            # In a real app, this would be handled by a background task/celery
-            # For demo purposes, we'll just return the created trade
-            
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        
+        # /api/binary-options/ is served by the async view; this covers the other routes
+        return run_handler(create_binary_option, request)
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request, *args, **kwargs):
+        """Open a basket of binary options in one request"""
+        return run_handler(create_binary_options_batch, request)
+
     @action(detail=False, methods=['get'])
+    @versioned_response(expires=_first_expiry)
     def active(self, request):
         active_trades = BinaryOptionTrade.objects.filter(
             user=request.user,
@@ -442,10 +296,10 @@ class BinaryOptionTradeViewSet(viewsets.ModelViewSet):
             expiry_time__gt=timezone.now()
         ).order_by('-created_at')
         
-        serializer = self.get_serializer(active_trades, many=True)
-        return Response(serializer.data)
+        return self.list_response(active_trades)
     
     @action(detail=False, methods=['get'])
+    @versioned_response
     def history(self, request):
         # Get completed trades from the last 7 days
         seven_days_ago = timezone.now() - timedelta(days=7)
@@ -455,66 +309,54 @@ class BinaryOptionTradeViewSet(viewsets.ModelViewSet):
             created_at__gte=seven_days_ago
         ).order_by('-created_at')
         
-        serializer = self.get_serializer(completed_trades, many=True)
-        return Response(serializer.data)
+        return self.list_response(completed_trades)
     
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """
+        Delta sync: trades created or modified since ``cursor`` (omit it for a
+        full sync), oldest change first, plus the cursor for the next poll.
+        While ``has_more`` is true, poll again right away with the new cursor.
+        Once caught up, the cursor points ``DELTA_SYNC_OVERLAP`` seconds back,
+        so trades changed in that window are sent again: clients dedupe by
+        id, keeping the copy with the latest ``updated_at``. Deleted trades
+        are not reported.
+        """
+        page_size = settings.DELTA_SYNC_PAGE_SIZE
+        started = timezone.now()
+        trades = BinaryOptionTrade.objects.filter(user=request.user)
+        encoded = request.query_params.get('cursor')
+        if encoded:
+            try:
+                since, last_id = decode_position(encoded)
+            except ValueError:
+                return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+            trades = trades.filter(Q(updated_at__gt=since) | Q(updated_at=since, id__gt=last_id))
+
+        # Fetch one extra row to learn whether another page exists
+        values_serializer = get_values_serializer(self.get_serializer_class())
+        trades = values_serializer.values(trades, 'updated_at')
+        rows = list(trades.order_by('updated_at', 'id')[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if has_more:
+            cursor = encode_position(rows[-1]['updated_at'], rows[-1]['id'])
+        else:
+            # updated_at is stamped before commit (auto_now, settlement), so a
+            # slow transaction can commit behind the last row sent; re-read
+            # the last few seconds next time
+            cursor = encode_position(started - timedelta(seconds=settings.DELTA_SYNC_OVERLAP), 0)
+
+        return Response({
+            'results': values_serializer.serialize(rows),
+            'cursor': cursor,
+            'has_more': has_more,
+        })
+
     @action(detail=True, methods=['post'])
     def close_early(self, request, pk=None):
         """Endpoint to close a binary option trade early (before expiry)"""
-        try:
-            trade = self.get_object()
-            
-            if trade.status != 'ACTIVE':
-                return Response({
-                    'status': 'error',
-                    'message': 'Only active trades can be closed early'
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Get current price
-            try:
-                response = requests.get(f'https://api.binance.com/api/v3/ticker/price?symbol={trade.symbol}USDT')
-                current_price = Decimal(response.json()['price'])
-            except Exception as e:
-                return Response({
-                    'status': 'error',
-                    'message': f'Failed to fetch current price: {str(e)}'
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Determine if the trade is winning or losing at this point
-            if trade.direction == 'UP':
-                is_winning = current_price > trade.entry_price
-            else:  # DOWN
-                is_winning = current_price < trade.entry_price
-            
-            # Early close usually offers a reduced payout or reduced loss
-            # For simplicity, we'll use 80% of normal payout for winners
-            # and 20% refund for losers
-            if is_winning:
-                trade.status = 'WON'
-                reduced_percentage = trade.profit_percentage * Decimal('0.8')
-                trade.payout_amount = trade.amount + (trade.amount * reduced_percentage / 100)
-            else:
-                trade.status = 'LOST'
-                refund_percentage = 20
-                trade.payout_amount = trade.amount * Decimal(refund_percentage) / 100
-            
-            trade.exit_price = current_price
-            trade.save()
-            
-            # Update user balance
-            if trade.payout_amount:
-                user = request.user
-                user.balance += trade.payout_amount
-                user.save()
-            
-            serializer = self.get_serializer(trade)
-            return Response(serializer.data)
-            
-        except Exception as e:
-            return Response({
-                'status': 'error',
-                'message': str(e)
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return run_handler(close_early, request, pk)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -550,134 +392,100 @@ def get_coinbase_config(request):
             'error': str(e)
         }, status=500)
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def market_data_stats(request):
+    """
+    Report price cache hit/miss counters and per-symbol staleness
+    """
+    return Response(market_data.stats())
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
-def update_expired_trades(request):
+@versioned_response
+def analytics(request):
     """
-    Check for expired trades and update their status
-    Compare the entry price with the current price to determine if the trade is won or lost
-    
-    Optional parameters:
-    - force: Process all active trades even if not expired
-    - ignore_expiry: Ignore the expiry time check
-    - manual_price: Use this price instead of fetching from API
-    - trade_id: Process only a specific trade (by ID)
+    Trading performance of the authenticated user: win rate, net PnL, ROI and
+    streaks (in settlement order) of settled binary options overall and per
+    symbol, direction and expiry, plus realized PnL of spot trades per
+    symbol. Cached until the user's trades change (settlement included).
     """
-    now = timezone.now()
-    
-    print(f"[DEBUG] update_expired_trades called at {now}. Query params: {request.query_params}")
-    
-    # Check if a specific trade_id was provided
-    specific_trade_id = request.query_params.get('trade_id')
-    if specific_trade_id:
-        print(f"[DEBUG] Processing specific trade ID: {specific_trade_id}")
-        # Get only the specified trade that belongs to this user
-        expired_trades = BinaryOptionTrade.objects.filter(
-            user=request.user,
-            status='ACTIVE',
-            id=specific_trade_id
-        )
-    else:
-        # Find all active trades
-        expired_trades = BinaryOptionTrade.objects.filter(
-            user=request.user,
-            status='ACTIVE'
-        )
-        
-        # By default, filter to only expired trades
-        if 'ignore_expiry' not in request.query_params and 'force' not in request.query_params:
-            expired_trades = expired_trades.filter(expiry_time__lte=now)
-    
-    print(f"[DEBUG] Found {expired_trades.count()} trades to process")
-    
-    if not expired_trades:
+    return Response({
+        'binary_options': binary_option_stats(request.user),
+        'trades': trade_stats(request.user),
+    })
+
+def _parse_time(value):
+    """Epoch seconds or an ISO 8601 datetime, as epoch seconds"""
+    try:
+        seconds = float(value)
+    except ValueError:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValueError(f'Invalid time: {value}')
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed.timestamp()
+    # nan compares false against every bound and would pass the range checks
+    if not math.isfinite(seconds):
+        raise ValueError(f'Invalid time: {value}')
+    return seconds
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def candles(request):
+    """
+    OHLC candles from the local tick store
+
+    Query parameters:
+    - symbol: e.g. BTC (required)
+    - interval: 1m, 5m, 15m or 1h (default 1m)
+    - start, end: epoch seconds or ISO 8601 (default the last `limit` candles up to now)
+    - limit: candles to return when start is omitted (default and maximum CANDLES_MAX_RESULTS)
+    """
+    params = request.query_params
+    symbol = params.get('symbol', '').upper()
+    interval_name = params.get('interval', '1m')
+    if not symbol:
+        return Response({'error': 'symbol is required'}, status=status.HTTP_400_BAD_REQUEST)
+    if interval_name not in INTERVALS:
         return Response({
-            'status': 'success',
-            'message': 'No expired trades found',
-            'updated_trades': []
-        })
-    
-    # Check if manual price is provided
-    manual_price = None
-    if 'manual_price' in request.query_params:
-        try:
-            manual_price = Decimal(request.query_params['manual_price'])
-            print(f"[DEBUG] Using manual price: {manual_price}")
-        except (ValueError, TypeError):
-            return Response({
-                'status': 'error',
-                'message': 'Invalid manual price provided'
-            }, status=status.HTTP_400_BAD_REQUEST)
-    
-    updated_trades = []
-    for trade in expired_trades:
-        # Skip trades that are not yet fully expired unless explicitly told to ignore expiry
-        if trade.expiry_time > now and 'ignore_expiry' not in request.query_params and 'force' not in request.query_params:
-            print(f"[DEBUG] Skipping trade {trade.id} - not expired yet")
-            continue
-            
-        try:
-            print(f"[DEBUG] Processing trade {trade.id}, direction: {trade.direction}, entry_price: {trade.entry_price}")
-            # Get current price - either from manual input or API
-            if manual_price is not None:
-                current_price = manual_price
-                print(f"[DEBUG] Using provided price {current_price}")
-            else:
-                # Get from API as before
-                print(f"[DEBUG] Fetching price from API for {trade.symbol}USDT")
-                response = requests.get(f'https://api.binance.com/api/v3/ticker/price?symbol={trade.symbol}USDT')
-                current_price = Decimal(response.json()['price'])
-                print(f"[DEBUG] Received price from API: {current_price}")
-            
-            # Determine if trade won or lost based on direction and price comparison
-            if trade.direction == 'UP':
-                is_won = current_price > trade.entry_price
-            else:  # DOWN
-                is_won = current_price < trade.entry_price
-                
-            # Handle equal prices (draw) - count as loss for simplicity
-            if current_price == trade.entry_price:
-                is_won = False
-                
-            # Update trade status
-            trade.status = 'WON' if is_won else 'LOST'
-            trade.exit_price = current_price
-            
-            print(f"[DEBUG] Trade {trade.id} result: {trade.status} (exit_price: {trade.exit_price})")
-            
-            # Calculate payout
-            if is_won:
-                trade.payout_amount = trade.amount + (trade.amount * trade.profit_percentage / 100)
-            else:
-                trade.payout_amount = 0  # Full loss
-                
-            trade.save()
-            print(f"[DEBUG] Trade {trade.id} saved successfully")
-            
-            # Update user balance if trade is won
-            if is_won:
-                user = request.user
-                user.balance += trade.payout_amount
-                user.save()
-                print(f"[DEBUG] Updated user balance: +{trade.payout_amount}")
-                
-            updated_trades.append({
-                'id': trade.id, 
-                'status': trade.status,
-                'exit_price': str(trade.exit_price),
-                'payout_amount': str(trade.payout_amount)
-            })
-                
-        except Exception as e:
-            print(f"[DEBUG] Error processing trade {trade.id}: {str(e)}")
-            return Response({
-                'status': 'error',
-                'message': f'Error updating trade {trade.id}: {str(e)}'
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    
-    print(f"[DEBUG] Successfully updated {len(updated_trades)} trades")
+            'error': f'interval must be one of {", ".join(INTERVALS)}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    interval = INTERVALS[interval_name]
+    max_results = settings.CANDLES_MAX_RESULTS
+
+    try:
+        end = _parse_time(params['end']) if 'end' in params else time.time()
+        if 'start' in params:
+            start = _parse_time(params['start'])
+        else:
+            try:
+                limit = min(int(params.get('limit', max_results)), max_results)
+            except ValueError:
+                raise ValueError('limit must be an integer')
+            start = end - interval * max(limit, 1)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    if end <= start:
+        return Response({'error': 'end must be after start'}, status=status.HTTP_400_BAD_REQUEST)
+    if (end - start) / interval > max_results:
+        return Response({
+            'error': f'Range too large: at most {max_results} candles per request'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        rows = get_tick_store().candles(symbol, interval, start, end)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     return Response({
-        'status': 'success',
-        'message': f'Updated {len(updated_trades)} expired trades',
-        'updated_trades': updated_trades
+        'symbol': symbol,
+        'interval': interval_name,
+        'candles': [{
+            'time': int(open_time),
+            'open': open_,
+            'high': high,
+            'low': low,
+            'close': close,
+        } for open_time, open_, high, low, close in rows],
     })
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 from datetime import timedelta
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -36,6 +37,8 @@ ALLOWED_HOSTS = ['*']  # Configure this properly in production
 # Application definition
 
 INSTALLED_APPS = [
+    # First, so runserver serves the ASGI app (HTTP and WebSockets)
+    'daphne',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -45,11 +48,13 @@ INSTALLED_APPS = [
     # Third party apps
     'rest_framework',
     'corsheaders',
+    'channels',
     # Local apps
     'core',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',  # Outermost so it times the whole stack
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # CORS middleware
@@ -58,6 +63,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.ProfilingMiddleware',  # Innermost so profiles show the view
 ]
 
 ROOT_URLCONF = 'cryptobackend.urls'
@@ -78,6 +84,57 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'cryptobackend.wsgi.application'
+ASGI_APPLICATION = 'cryptobackend.asgi.application'
+
+# Channel layer for WebSocket push (core/consumers.py). Set REDIS_URL so the
+# settlement worker and price broadcaster can reach clients connected to other
+# processes; without it an in-process layer is used.
+if os.getenv('REDIS_URL'):
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [os.getenv('REDIS_URL')]},
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'},
+    }
+
+# Caches: 'default' holds cached API responses (core/response_cache.py) and
+# 'versions' the per-user version counters, which every process that writes
+# trades must share. With REDIS_URL both live in Redis; without it responses
+# are cached per process and versions in files under the temp directory.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+            'KEY_PREFIX': 'cryptrade',
+        },
+        'versions': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+            'KEY_PREFIX': 'cryptrade-versions',
+            'TIMEOUT': None,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        },
+        'versions': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(tempfile.gettempdir(), 'cryptrade-versions'),
+            'TIMEOUT': None,
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        },
+    }
+
+# Seconds a cached response of a polled read endpoint may be served
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '60'))
 
 
 # Database
@@ -139,13 +196,28 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # Same output as rest_framework.renderers.JSONRenderer, encoded with orjson
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
+# Cursor pagination for trade and binary option listings. Opt-in per request
+# with ?page_size=N; follow the returned 'next' link for older rows.
+CURSOR_PAGINATION_PAGE_SIZE = int(os.getenv('CURSOR_PAGINATION_PAGE_SIZE', '100'))
+CURSOR_PAGINATION_MAX_PAGE_SIZE = int(os.getenv('CURSOR_PAGINATION_MAX_PAGE_SIZE', '1000'))
+
+# Delta sync (/api/binary-options/changes/): trades per response, and seconds
+# re-read behind the last poll to catch transactions that committed late
+DELTA_SYNC_PAGE_SIZE = int(os.getenv('DELTA_SYNC_PAGE_SIZE', '500'))
+DELTA_SYNC_OVERLAP = float(os.getenv('DELTA_SYNC_OVERLAP', '5'))
+
 # JWT settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
@@ -154,9 +226,91 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
 }
 
+# Authenticated users are cached per process for this many seconds
+# (core/authentication.py); saving a user invalidates them everywhere
+AUTH_USER_CACHE_TTL = float(os.getenv('AUTH_USER_CACHE_TTL', '30'))
+AUTH_USER_CACHE_SIZE = int(os.getenv('AUTH_USER_CACHE_SIZE', '10000'))
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True  # Only for development
 CORS_ALLOW_CREDENTIALS = True
 
 # Custom user model
 AUTH_USER_MODEL = 'core.User'
+
+# Market data settings
+MARKET_DATA_PRICE_TTL = float(os.getenv('MARKET_DATA_PRICE_TTL', '2'))  # seconds a cached price is fresh
+MARKET_DATA_MAX_STALE = float(os.getenv('MARKET_DATA_MAX_STALE', '30'))  # seconds a price may be served if upstream fails
+MARKET_DATA_WAIT_TIMEOUT = float(os.getenv('MARKET_DATA_WAIT_TIMEOUT', '10'))  # seconds to wait on a coalesced fetch
+MARKET_DATA_OUTAGE_MAX_STALE = float(os.getenv('MARKET_DATA_OUTAGE_MAX_STALE', '300'))  # same, while the upstream circuit is open
+
+# Upstream price client (core/upstream.py): connect/read deadlines in seconds,
+# retries with full-jitter exponential backoff, and the circuit breaker that
+# fails fast after consecutive failures until its reset timeout has passed
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', '3'))
+UPSTREAM_READ_TIMEOUT = float(os.getenv('UPSTREAM_READ_TIMEOUT', '5'))
+UPSTREAM_RETRIES = int(os.getenv('UPSTREAM_RETRIES', '2'))
+UPSTREAM_RETRY_BACKOFF = float(os.getenv('UPSTREAM_RETRY_BACKOFF', '0.1'))
+UPSTREAM_RETRY_MAX_BACKOFF = float(os.getenv('UPSTREAM_RETRY_MAX_BACKOFF', '1'))
+UPSTREAM_BREAKER_THRESHOLD = int(os.getenv('UPSTREAM_BREAKER_THRESHOLD', '5'))
+UPSTREAM_BREAKER_RESET = float(os.getenv('UPSTREAM_BREAKER_RESET', '30'))
+UPSTREAM_POOL_SIZE = int(os.getenv('UPSTREAM_POOL_SIZE', '20'))  # keep-alive connections per process
+
+# Shared aiohttp client (core/async_http.py) used by the async views for price
+# lookups: seconds per upstream request, and open connections per worker process
+ASYNC_HTTP_TIMEOUT = float(os.getenv('ASYNC_HTTP_TIMEOUT', '5'))
+ASYNC_HTTP_MAX_CONNECTIONS = int(os.getenv('ASYNC_HTTP_MAX_CONNECTIONS', '100'))
+
+# Most orders accepted by one /api/trades/batch/ or /api/binary-options/batch/ request
+BATCH_ORDER_MAX_SIZE = int(os.getenv('BATCH_ORDER_MAX_SIZE', '100'))
+
+# Settlement worker settings (python manage.py run_settlement)
+SETTLEMENT_REFRESH_INTERVAL = float(os.getenv('SETTLEMENT_REFRESH_INTERVAL', '1'))  # seconds between scans for new trades
+SETTLEMENT_LOOKAHEAD = float(os.getenv('SETTLEMENT_LOOKAHEAD', '30'))  # schedule trades expiring within this many seconds
+
+# Symbols pushed to WebSocket subscribers by python manage.py broadcast_prices
+LIVE_PRICE_SYMBOLS = os.getenv('LIVE_PRICE_SYMBOLS', 'BTC,ETH,BNB,ADA,DOGE,XRP,SOL,DOT,AVAX,MATIC').split(',')
+
+# Price history (core/candles.py): memory-mapped tick and 1m candle segments,
+# written by python manage.py broadcast_prices and served at /api/candles/
+CANDLE_STORE_DIR = os.getenv('CANDLE_STORE_DIR', str(BASE_DIR / 'tickdata'))
+CANDLES_MAX_RESULTS = int(os.getenv('CANDLES_MAX_RESULTS', '1000'))
+
+# In-memory tick history (core/ticks.py) used to price trades at expiry: ticks
+# kept per symbol, and how old the last tick before an instant may be
+TICK_HISTORY_SIZE = int(os.getenv('TICK_HISTORY_SIZE', '3600'))
+TICK_HISTORY_MAX_GAP = float(os.getenv('TICK_HISTORY_MAX_GAP', '5'))
+
+# Maximum number of initialized ccxt clients kept in memory (core/exchanges.py)
+EXCHANGE_CLIENT_CACHE_SIZE = int(os.getenv('EXCHANGE_CLIENT_CACHE_SIZE', '256'))
+# Concurrent exchange calls: shared thread pool size and per-call deadline in seconds
+EXCHANGE_FETCH_WORKERS = int(os.getenv('EXCHANGE_FETCH_WORKERS', '16'))
+EXCHANGE_FETCH_DEADLINE = float(os.getenv('EXCHANGE_FETCH_DEADLINE', '5'))
+
+# Offline market simulator (core/simulator.py). When enabled, Binance prices and
+# ccxt exchange calls are served in-process with the latency, jitter and error
+# rate below, from a seeded random walk or a replayed CSV (timestamp,symbol,price).
+MARKET_SIMULATOR_ENABLED = os.getenv('MARKET_SIMULATOR_ENABLED', 'False') == 'True'
+MARKET_SIMULATOR_LATENCY_MS = float(os.getenv('MARKET_SIMULATOR_LATENCY_MS', '0'))
+MARKET_SIMULATOR_JITTER_MS = float(os.getenv('MARKET_SIMULATOR_JITTER_MS', '0'))
+MARKET_SIMULATOR_ERROR_RATE = float(os.getenv('MARKET_SIMULATOR_ERROR_RATE', '0'))
+MARKET_SIMULATOR_REPLAY_FILE = os.getenv('MARKET_SIMULATOR_REPLAY_FILE') or None
+MARKET_SIMULATOR_REPLAY_SPEED = float(os.getenv('MARKET_SIMULATOR_REPLAY_SPEED', '1'))
+MARKET_SIMULATOR_SEED = int(os.getenv('MARKET_SIMULATOR_SEED', '42'))
+MARKET_SIMULATOR_START_BALANCE = float(os.getenv('MARKET_SIMULATOR_START_BALANCE', '100000'))
+# Extra random-walk symbols as 'SYMBOL=start price,...'; others are rejected
+MARKET_SIMULATOR_EXTRA_PRICES = {
+    symbol.strip().upper(): float(price)
+    for symbol, _, price in (item.partition('=') for item in os.getenv('MARKET_SIMULATOR_EXTRA_PRICES', '').split(',') if item.strip())
+}
+
+# Prometheus scrape endpoint (/metrics). When set, scrapers must send
+# 'Authorization: Bearer <METRICS_TOKEN>'.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN') or None
+
+# On-demand profiling (core.middleware.ProfilingMiddleware). Requests sending
+# 'X-Profile: <PROFILING_TOKEN>', plus a PROFILING_SAMPLE_RATE fraction of all
+# requests, are profiled into PROFILING_DIR. Disabled when both are unset.
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN') or None
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_DIR = os.getenv('PROFILING_DIR', os.path.join(tempfile.gettempdir(), 'cryptrade-profiles'))
@@ -18,7 +18,9 @@ from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from core.views import UserViewSet, PortfolioViewSet, TradeViewSet, ApiKeyViewSet, BinaryOptionTradeViewSet, get_coinbase_config, update_expired_trades
+from core.metrics import metrics_view
+from core.async_views import method_view, create_trade_view, create_binary_option_view, close_early_view, create_trades_batch_view, create_binary_options_batch_view, update_expired_trades
+from core.views import UserViewSet, PortfolioViewSet, TradeViewSet, ApiKeyViewSet, BinaryOptionTradeViewSet, get_coinbase_config, market_data_stats, candles, analytics
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet)
@@ -29,9 +31,20 @@ router.register(r'binary-options', BinaryOptionTradeViewSet, basename='binary-op
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    # Price-dependent writes run as async views (core/async_views.py); the
+    # routes come before the router's so they take over POST on these URLs
+    path('api/trades/', method_view(TradeViewSet.as_view({'get': 'list'}), post=create_trade_view), name='trades-list'),
+    path('api/binary-options/', method_view(BinaryOptionTradeViewSet.as_view({'get': 'list'}), post=create_binary_option_view), name='binary-options-list'),
+    path('api/trades/batch/', create_trades_batch_view, name='trades-batch'),
+    path('api/binary-options/batch/', create_binary_options_batch_view, name='binary-options-batch'),
+    path('api/binary-options/<pk>/close_early/', close_early_view, name='binary-options-close-early'),
     path('api/', include(router.urls)),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/config/coinbase/', get_coinbase_config, name='get_coinbase_config'),
     path('api/check-trades/', update_expired_trades, name='update_expired_trades'),
+    path('api/market-data/stats/', market_data_stats, name='market_data_stats'),
+    path('api/candles/', candles, name='candles'),
+    path('api/analytics/', analytics, name='analytics'),
+    path('metrics', metrics_view, name='metrics'),
 ]